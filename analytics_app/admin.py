@@ -1,3 +1,25 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import AnalysisJob, Dataset, DatasetVersion, Release
+
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'file_path', 'epsilon', 'status', 'stage', 'progress', 'created_at')
+    list_filter = ('status',)
+
+
+@admin.register(Dataset)
+class DatasetAdmin(admin.ModelAdmin):
+    list_display = ('id', 'owner', 'name', 'current_version', 'updated_at')
+
+
+@admin.register(DatasetVersion)
+class DatasetVersionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'dataset', 'number', 'name', 'file_hash', 'n_rows', 'n_columns', 'created_at')
+    search_fields = ('file_hash', 'name')
+
+
+@admin.register(Release)
+class ReleaseAdmin(admin.ModelAdmin):
+    list_display = ('id', 'version', 'epsilon', 'anonymization_version', 'created_at')
@@ -0,0 +1,289 @@
+"""
+Incremental appends to stored datasets.
+Provides:
+1. DatasetSummary: Mergeable per-column summaries of a dataset: count/mean/M2, min/max and
+   category counts (sketch_utils.ColumnSketch) plus chart histograms (GridHistogram).
+2. load_summary: The stored summary of a cleaned dataset or of one of its releases,
+   built with one pass over the data the first time it is needed.
+3. append_rows: Append a stored upload to a stored dataset as a new version. Only the new
+   rows are cleaned, summarized, anonymized (with the noise scales and generalization rules
+   of the existing releases) and written; statistics and histograms come from merged summaries.
+4. dataset_parts: The cached Arrow files of an appended version, one per append.
+5. incremental_charts: Profiles and histograms of an appended version for compare_datasets.
+
+An appended version is a chain file in the upload store (see upload_utils.store_chain), so
+the rest of the app handles it like any upload: its content hash keys the dataset cache and
+the release store. Its raw data, cleaned data and releases are stored as parts holding only
+the appended rows, each naming the file of the version it extends (see
+cache_utils.arrow_parts), so an append costs O(new rows) however large the dataset is. The
+values the new rows' gaps were filled with are stored with the version, so a part evicted
+from the cache is rebuilt with the same values.
+"""
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from .cache_utils import (FILL_SUFFIX, SUMMARY_SUFFIX, cache_path, concat_frames, dataset_files, load_dataset,
+                          parent_part, read_arrow, read_upload, save_profile, write_cached)
+from .privacy_utils import ANONYMIZATION_VERSION, anonymize_rows
+from .profile_utils import DatasetProfile, is_numeric_column, is_text_column
+from .release_utils import load_plan, load_release, publish_release, release_path, stored_epsilons
+from .sketch_utils import SKETCH_CHUNK_ROWS, ColumnSketch, GridHistogram, sketch_profile
+from .timing_utils import stage, timed
+from .upload_utils import CHAIN_SUFFIX, chain_parts, store_chain
+
+
+def _numeric_values(series: pd.Series) -> np.ndarray:
+    # Values as plotted by chart_utils: numbers as they are, text parsed (non-numbers become NaN)
+    if is_numeric_column(series):
+        return series.to_numpy(dtype='float64', na_value=np.nan)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Parse each category once and look the rows up by code
+        parsed = pd.to_numeric(pd.Series(series.cat.categories.astype(object)), errors='coerce')
+        lookup = np.append(parsed.to_numpy(dtype='float64', na_value=np.nan), np.nan)
+        return lookup[series.cat.codes.to_numpy()]
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+
+class DatasetSummary:
+    """Column sketches and chart histograms of a dataset, updated in O(new rows)"""
+
+    def __init__(self):
+        self.n_rows = 0
+        self.sketches = {}
+        # Numeric columns and text columns with numeric-looking values (the chartable ones)
+        self.grids = {}
+
+    def update(self, df: pd.DataFrame) -> 'DatasetSummary':
+        for start in range(0, len(df), SKETCH_CHUNK_ROWS):
+            chunk = df.iloc[start:start + SKETCH_CHUNK_ROWS]
+            if not self.sketches:
+                self.sketches = {col: ColumnSketch(chunk[col]) for col in chunk.columns}
+                self.grids = {col: GridHistogram() for col in chunk.columns
+                              if is_numeric_column(chunk[col]) or is_text_column(chunk[col])}
+            self.n_rows += len(chunk)
+            for col, sketch in self.sketches.items():
+                sketch.update(chunk[col])
+            for col, grid in list(self.grids.items()):
+                grid.update(_numeric_values(chunk[col]))
+                if grid.count == 0 and not self.sketches[col].numeric:
+                    # Text that does not look numeric is never charted
+                    del self.grids[col]
+        return self
+
+    def profile(self, df_dtypes: dict = None) -> DatasetProfile:
+        """Sketch-based profile of the summarized rows (see sketch_utils.sketch_profile)"""
+        profile = sketch_profile(self.n_rows, self.sketches)
+        if df_dtypes:
+            # Appending can widen dtypes (int8 -> int16, int -> float once gaps are filled)
+            profile.dtypes = {col: str(dtype) for col, dtype in df_dtypes.items()}
+        return profile
+
+
+def release_variant(epsilon: float) -> str:
+    """Cache variant under which the summary of a release is stored"""
+    return f"e{float(epsilon)!r}.v{ANONYMIZATION_VERSION}"
+
+def save_summary(summary: DatasetSummary, digest: str, variant: str = 'clean') -> None:
+    path = cache_path(digest, variant, SUMMARY_SUFFIX)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(summary, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def load_summary(filepath, digest: str, epsilon: float = None, df: pd.DataFrame = None) -> DatasetSummary:
+    """
+    Load the summary of a cleaned dataset (or of its release for `epsilon`), summarizing the
+    data once if it is not stored yet (the first append to a dataset).
+    """
+    variant = 'clean' if epsilon is None else release_variant(epsilon)
+    path = cache_path(digest, variant, SUMMARY_SUFFIX)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            summary = pickle.load(f)
+        os.utime(path)
+        return summary
+    if df is None:
+        df = (load_dataset(filepath, clean=True, digest=digest) if epsilon is None
+              else load_release(filepath, epsilon=epsilon, digest=digest))
+    summary = DatasetSummary().update(df)
+    save_summary(summary, digest, variant)
+    return summary
+
+def _align_rows(rows: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
+    # Same columns as the dataset, in its order; numbers stay numbers
+    if set(rows.columns) != set(df.columns):
+        missing = [col for col in df.columns if col not in rows.columns]
+        extra = [col for col in rows.columns if col not in df.columns]
+        raise ValueError("The appended rows must have the same columns as the dataset "
+                         f"(missing: {', '.join(missing) or 'none'}; unexpected: {', '.join(extra) or 'none'}).")
+    rows = rows[list(df.columns)]
+    for col in df.columns:
+        if is_numeric_column(df[col]) and not is_numeric_column(rows[col]):
+            parsed = pd.to_numeric(rows[col].astype(object), errors='coerce')
+            if (parsed.isna() & rows[col].notna()).any():
+                raise ValueError(f"Column {col} holds numbers in the dataset but text in the appended rows.")
+            rows[col] = parsed
+    return rows
+
+def _fill_values(rows: pd.DataFrame, summary: DatasetSummary) -> dict:
+    """
+    The values clean_dataset fills the gaps of appended rows with: the mean (or most frequent
+    value) of the dataset and the new rows together, taken from the summary instead of the data.
+    Rows already in the dataset keep the values they were filled with.
+    """
+    fills = {}
+    for col in rows.columns:
+        if not rows[col].isna().any():
+            continue
+        sketch = summary.sketches[col]
+        if sketch.numeric:
+            values = rows[col].dropna().to_numpy(dtype='float64')
+            count = sketch.count + values.size
+            fills[col] = (sketch.mean * sketch.count + values.sum()) / count if count else np.nan
+        else:
+            new_counts = rows[col].value_counts()
+            new_counts.index = new_counts.index.astype(object)
+            counts = sketch.frequencies.value_counts().add(new_counts, fill_value=0)
+            fills[col] = counts.idxmax() if len(counts) else "Unknown"
+    return fills
+
+def _fill_rows(rows: pd.DataFrame, fills: dict) -> pd.DataFrame:
+    rows = rows.copy()
+    for col, fill in fills.items():
+        if isinstance(rows[col].dtype, pd.CategoricalDtype) and fill not in rows[col].cat.categories:
+            rows[col] = rows[col].cat.add_categories([fill])
+        rows[col] = rows[col].fillna(fill)
+    return rows
+
+def _save_fills(fills: dict, digest: str) -> None:
+    path = cache_path(digest, 'clean', FILL_SUFFIX)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(fills, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def _load_fills(filepath: str, digest: str, rows: pd.DataFrame) -> dict:
+    # Stored by append_rows; versions appended before fill values were kept get them from the
+    # parent's summary, which is what their rows were filled from
+    path = cache_path(digest, 'clean', FILL_SUFFIX)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    parent, _ = chain_parts(filepath)
+    fills = _fill_values(rows, load_summary(parent, _stored_digest(parent)))
+    _save_fills(fills, digest)
+    return fills
+
+def _stored_digest(path: str) -> str:
+    # Stored uploads and chains are named after their content hash
+    return os.path.splitext(os.path.basename(path))[0]
+
+def _empty_frame(parts: list) -> pd.DataFrame:
+    # No rows, with the columns and dtypes of the data in `parts` (only their schemas are read)
+    frames = []
+    for part in parts:
+        with pa.memory_map(part) as source:
+            frames.append(pa.ipc.open_file(source).schema.empty_table().to_pandas())
+    return concat_frames(*frames)
+
+def dataset_parts(filepath: str, digest: str, clean: bool = False) -> list:
+    """
+    The cached Arrow files holding a dataset, oldest first: for an appended version, the data
+    of the upload it started from followed by one part per append with only the rows it added
+    (see load_dataset). Parts evicted from the cache are rebuilt from the appended upload, and
+    cleaned with the fill values stored with their version.
+    """
+    variant = 'clean' if clean else 'raw'
+    path = cache_path(digest, variant)
+    if not filepath.endswith(CHAIN_SUFFIX):
+        return dataset_files(filepath, clean=clean, digest=digest)
+    if os.path.exists(path) and parent_part(path) is None:
+        # Versions cached before appends were stored as parts hold all their rows
+        return [path]
+    parent, rows_path = chain_parts(filepath)
+    parts = dataset_parts(parent, _stored_digest(parent), clean=clean)
+    if not os.path.exists(path):
+        if clean:
+            rows = read_arrow(dataset_parts(filepath, digest)[-1])
+            rows = _fill_rows(rows, _load_fills(filepath, digest, rows))
+        else:
+            rows = _align_rows(read_upload(rows_path), _empty_frame(parts))
+        write_cached(rows, path, appended_to=parts[-1])
+    return parts + [path]
+
+@timed('append')
+def append_rows(filepath: str, digest: str, rows_path: str) -> tuple:
+    """
+    Append the rows of a stored upload to a stored dataset, creating a new version.
+
+    The new version's raw and cleaned data are cached as parts holding only the new rows (see
+    dataset_parts), its summary and profile are the old summary updated with the new rows, and
+    every stored release of the dataset is extended with a part holding the new rows
+    anonymized under that release's plan (same noise scales, quintiles and rare values), so
+    earlier rows keep their noise and are not written again.
+
+    Parameters:
+    filepath (str): Path of the stored dataset (an upload or an earlier version).
+    digest (str): Its content hash.
+    rows_path (str): Path of the stored upload holding the rows to append.
+
+    Returns:
+    tuple: (path, content hash) of the new version.
+    """
+    path, version = store_chain(filepath, rows_path)
+    # Releases of the dataset the new version does not have yet
+    pending = [epsilon for epsilon in stored_epsilons(digest) if not os.path.exists(release_path(version, epsilon))]
+    if not pending and os.path.exists(cache_path(version, 'clean', SUMMARY_SUFFIX)):
+        # The same rows were appended to this dataset before
+        return path, version
+
+    with stage('load'):
+        raw_parts = dataset_parts(filepath, digest)
+        clean_parts = dataset_parts(filepath, digest, clean=True)
+        rows = _align_rows(read_upload(rows_path), _empty_frame(raw_parts))
+        summary = load_summary(filepath, digest)
+
+    with stage('merge'):
+        fills = _fill_values(rows, summary)
+        # Stored before the parts, which are rebuilt from it once evicted
+        _save_fills(fills, version)
+        new_clean = _fill_rows(rows, fills)
+        write_cached(rows, cache_path(version, 'raw'), appended_to=raw_parts[-1])
+        write_cached(new_clean, cache_path(version, 'clean'), appended_to=clean_parts[-1])
+        summary.update(new_clean)
+        dtypes = concat_frames(_empty_frame(clean_parts), new_clean.iloc[:0]).dtypes
+        save_profile(summary.profile(dict(dtypes)), version, clean=True)
+
+    for epsilon in pending:
+        with stage('append_release', epsilon=epsilon):
+            plan = load_plan(filepath, epsilon=epsilon, digest=digest)
+            release_summary = load_summary(filepath, digest, epsilon=epsilon)
+            new_release = anonymize_rows(new_clean.copy(), plan)
+            # If another process published this release first, its summary is built on demand
+            if publish_release(new_release, release_path(version, epsilon), plan,
+                               appended_to=release_path(digest, epsilon)):
+                save_summary(release_summary.update(new_release), version, release_variant(epsilon))
+
+    # Written last: its presence marks the version as complete
+    save_summary(summary, version)
+    return path, version
+
+def incremental_charts(filepath: str, digest: str, epsilon: float, anon_df: pd.DataFrame = None) -> dict:
+    """
+    For appended versions, the histograms of the dataset and its release plus the release's
+    profile, taken from the stored summaries (compare_datasets' `incremental` argument).
+    Returns None for plain uploads, which are charted from their data.
+    """
+    if not filepath.endswith(CHAIN_SUFFIX):
+        return None
+    summary = load_summary(filepath, digest)
+    release_summary = load_summary(filepath, digest, epsilon=epsilon, df=anon_df)
+    return {
+        'orig_grids': summary.grids,
+        'anon_grids': release_summary.grids,
+        'anon_profile': release_summary.profile(dict(anon_df.dtypes) if anon_df is not None else None),
+    }
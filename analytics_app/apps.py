@@ -1,6 +1,16 @@
+import os
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class AnalyticsAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'analytics_app'
+
+    def ready(self):
+        # Storage directories are created once per process here rather than when a module is
+        # imported, so importing a module has no side effects. The upload, cache and release
+        # helpers (upload_dir, cache_dir, release_dir) still recreate theirs if removed.
+        for path in (settings.UPLOAD_STORE_DIR, settings.DATASET_CACHE_DIR, settings.RELEASE_STORE_DIR):
+            os.makedirs(path, exist_ok=True)
@@ -0,0 +1,172 @@
+"""
+Batch anonymization of many datasets.
+Provides:
+1. anonymize_file: Anonymize one stored dataset (through the release store) and write the
+   result as Parquet or CSV; returns its manifest entry. Runs inside pool workers.
+2. collect_inputs: Expand files and directories given on the command line into dataset paths.
+3. BatchZipWriter: Build the result zip incrementally (one entry per finished file, then a
+   manifest.json), handing back the bytes written in bounded chunks so the archive can be streamed.
+
+Used by the batch API view and the `anonymize_batch` management command.
+"""
+import json
+import os
+import tempfile
+import time
+import zipfile
+
+import pyarrow as pa
+
+from .cache_utils import file_hash
+from .export_utils import iter_export
+from .privacy_utils import ANONYMIZATION_VERSION
+from .release_utils import ensure_release, load_plan
+from .upload_utils import validate_file
+
+OUTPUT_FORMATS = ('parquet', 'csv')
+# Extensions picked up when a directory is given
+DATASET_EXTENSIONS = ('.csv', '.xls', '.xlsx')
+# Bytes of a result copied into the zip (and handed back) at a time
+BATCH_ZIP_CHUNK_BYTES = 1024 ** 2
+
+def anonymize_file(filepath: str, epsilon: float = 1.0, output_format: str = 'parquet',
+                   name: str = None, digest: str = None) -> dict:
+    """
+    Anonymize one dataset and write the result to a temporary file.
+    Failures are reported in the returned entry instead of raised, so one bad file
+    does not abort a batch.
+
+    Returns:
+    dict: Manifest entry: file, epsilon, format, sha256, rows, columns, dropped_columns,
+          seconds and output (temporary path of the result), or file, epsilon and error.
+    """
+    start = time.perf_counter()
+    entry = {'file': name or os.path.basename(filepath), 'epsilon': epsilon, 'format': output_format}
+    try:
+        # Same header checks as interactive uploads; command-line inputs never pass through store_upload
+        validate_file(filepath)
+        digest = digest or file_hash(filepath)
+        # Through the release store: re-running a batch returns the same noisy output, and
+        # large CSVs are anonymized without being loaded (see release_utils.stream_release)
+        release = ensure_release(filepath, epsilon=epsilon, digest=digest)
+        plan = load_plan(filepath, epsilon=epsilon, digest=digest)
+
+        fd, output = tempfile.mkstemp(suffix=f".{output_format}")
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter_export(release, output_format):
+                f.write(chunk)
+        with pa.memory_map(release) as source:
+            reader = pa.ipc.open_file(source)
+            rows = sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+            columns = reader.schema.names
+        entry.update({
+            'sha256': digest,
+            'rows': rows,
+            'columns': columns,
+            'dropped_columns': [str(col) for col in plan.dropped],
+            'output': output,
+        })
+    except Exception as e:
+        entry['error'] = str(e)
+    entry['seconds'] = round(time.perf_counter() - start, 3)
+    return entry
+
+def collect_inputs(paths) -> list:
+    """Expand directories into the CSV/Excel files directly inside them (sorted); keep files as given"""
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            inputs.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.lower().endswith(DATASET_EXTENSIONS) and os.path.isfile(os.path.join(path, name))))
+        else:
+            inputs.append(path)
+    return inputs
+
+
+class _ZipBuffer:
+    # Write-only file object for ZipFile; without seek() ZipFile writes streaming-friendly
+    # data descriptors, and everything written is collected until drained
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class BatchZipWriter:
+    """
+    Incremental zip of batch results. add() and close() return the archive bytes produced
+    since the last call, ready to be written to a file or yielded to a streaming response.
+    """
+
+    def __init__(self):
+        self._buffer = _ZipBuffer()
+        self._zip = zipfile.ZipFile(self._buffer, 'w')
+        self._names = set()
+        self.entries = []
+
+    def _archive_name(self, entry: dict) -> str:
+        # Unique name per result, even when two inputs share a file name
+        stem = os.path.splitext(entry['file'])[0]
+        name, n = f"{stem}.anonymized.{entry['format']}", 1
+        while name in self._names:
+            n += 1
+            name = f"{stem}.{n}.anonymized.{entry['format']}"
+        self._names.add(name)
+        return name
+
+    def add(self, entry: dict):
+        """
+        Add a result from anonymize_file (its temporary output is deleted) to the archive.
+        Generator: yields the archive bytes as the file is copied in, at most about
+        BATCH_ZIP_CHUNK_BYTES at a time, so a large result is never held in memory whole.
+        """
+        output = entry.pop('output', None)
+        if output:
+            try:
+                entry['archive_name'] = self._archive_name(entry)
+                info = zipfile.ZipInfo.from_file(output, entry['archive_name'])
+                # Parquet is already compressed; CSV shrinks well with deflate
+                info.compress_type = zipfile.ZIP_STORED if entry['format'] == 'parquet' else zipfile.ZIP_DEFLATED
+                entry['bytes'] = info.file_size
+                with open(output, 'rb') as src, self._zip.open(
+                        info, 'w', force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as dest:
+                    while chunk := src.read(BATCH_ZIP_CHUNK_BYTES):
+                        dest.write(chunk)
+                        data = self._buffer.drain()
+                        if data:
+                            yield data
+            finally:
+                os.remove(output)
+        self.entries.append(entry)
+        data = self._buffer.drain()
+        if data:
+            yield data
+
+    def close(self, **summary) -> bytes:
+        """Write manifest.json (the entries plus any summary fields) and finish the archive"""
+        manifest = {
+            'anonymization_version': ANONYMIZATION_VERSION,
+            'files': len(self.entries),
+            'failed': sum(1 for entry in self.entries if 'error' in entry),
+            **summary,
+            'results': self.entries,
+        }
+        self._zip.writestr('manifest.json', json.dumps(manifest, indent=2), compress_type=zipfile.ZIP_DEFLATED)
+        self._zip.close()
+        return self._buffer.drain()
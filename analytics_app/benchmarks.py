@@ -0,0 +1,217 @@
+"""
+Benchmark harness for the anonymize -> stats -> charts pipeline.
+Provides:
+1. make_dataset: Synthetic datasets modelled on uploads/sample_cet_dataset.csv, scalable in rows and columns.
+2. run_stage: Time one pipeline stage on one dataset size in a fresh process and record its peak RSS.
+3. run_startup: Time how long a fresh process takes to set up Django, load the URLconf (and
+   with it every view) or run `manage.py check`, and which heavy libraries that loaded.
+4. compare_results: Compare a benchmark run against a stored baseline and flag regressions.
+
+Used by the `benchmark` management command; everything runs offline.
+"""
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# The five columns of the sample dataset; wider datasets add generated columns after them
+BASE_COLUMNS = ['Name', 'RollNo', 'Marks', 'Rank', 'Category']
+CATEGORIES = ['GEN', 'OBC', 'SC', 'ST']
+CATEGORY_WEIGHTS = [0.5, 0.27, 0.15, 0.08]
+# Levels of generated categorical columns; the last ones are rare enough to be grouped as "Other"
+GROUP_LEVELS = ['A', 'B', 'C', 'D', 'E', 'F']
+GROUP_WEIGHTS = [0.4, 0.3, 0.2, 0.07, 0.02, 0.01]
+RANK_TIERS = [f"Tier {i}" for i in range(1, 9)]
+
+STAGES = ['profile', 'anonymize', 'stats', 'compare']
+
+# What a fresh process does before it can serve: Django setup alone (pool and job workers),
+# setup plus the URLconf (the web process) and `manage.py check` (any management command)
+STARTUP_TARGETS = {
+    'setup': '',
+    'urls': 'from django.urls import get_resolver; get_resolver().url_patterns',
+    'check': "from django.core.management import call_command; call_command('check', verbosity=0)",
+}
+# Libraries that must only be imported when a request or job needs them
+HEAVY_MODULES = ('numpy', 'pandas', 'pyarrow', 'scipy')
+# Run in a fresh interpreter; prints the measurement as JSON
+# Peak RSS comes from VmHWM where available: ru_maxrss survives exec on Linux, so it would
+# report the benchmark command's own peak
+STARTUP_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+{code}
+seconds = time.perf_counter() - start
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+try:
+    with open('/proc/self/status') as f:
+        peak_kb = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+except (OSError, StopIteration):
+    pass
+print(json.dumps({{
+    'seconds': seconds,
+    'peak_rss_mb': round(peak_kb / 1024, 1),
+    'heavy_modules': [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+def make_dataset(n_rows: int, n_cols: int = 5, seed: int = 0) -> pd.DataFrame:
+    """
+    Build a synthetic dataset shaped like the CET sample: a unique name, a roll number,
+    marks, a rank and a reservation category. Columns beyond the first five cycle through
+    float scores, integer marks, low-cardinality categories and text rank tiers, so every
+    branch of anonymize_data is exercised.
+    """
+    rng = np.random.default_rng(seed)
+    data = {
+        'Name': 'Student' + pd.Series(np.arange(n_rows)).astype(str),
+        'RollNo': np.arange(100, 100 + n_rows),
+        'Marks': rng.integers(100, 200, n_rows),
+        'Rank': rng.permutation(n_rows) + 1,
+        'Category': rng.choice(CATEGORIES, n_rows, p=CATEGORY_WEIGHTS),
+    }
+    for i in range(n_cols - len(BASE_COLUMNS)):
+        kind = i % 4
+        if kind == 0:
+            data[f'Score_{i}'] = rng.normal(60, 15, n_rows)
+        elif kind == 1:
+            data[f'Marks_{i}'] = rng.integers(0, 100, n_rows)
+        elif kind == 2:
+            data[f'Group_{i}'] = rng.choice(GROUP_LEVELS, n_rows, p=GROUP_WEIGHTS)
+        else:
+            data[f'Rank_{i}'] = rng.choice(RANK_TIERS, n_rows)
+    return pd.DataFrame(data).iloc[:, :n_cols]
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _run_stage(stage: str, n_rows: int, n_cols: int, seed: int, repeat: int, conn) -> None:
+    # Runs in a forked child, so the peak RSS belongs to this stage alone
+    try:
+        from . import viz_utils
+        from .privacy_utils import anonymize_data
+        from .profile_utils import profile_dataset
+
+        df = make_dataset(n_rows, n_cols, seed=seed)
+        rss_before = _peak_rss_mb()
+
+        stage_funcs = {
+            'profile': lambda: profile_dataset(df),
+            'anonymize': lambda: anonymize_data(df, rng=seed),
+            'stats': lambda: viz_utils.generate_basic_stats(df),
+            'compare': lambda: viz_utils.compare_datasets(df, dataset_hash=f"bench-{time.monotonic_ns()}"),
+        }
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            stage_funcs[stage]()
+            timings.append(time.perf_counter() - start)
+        conn.send({
+            'seconds': min(timings),
+            'mean_seconds': sum(timings) / len(timings),
+            'rss_before_mb': round(rss_before, 1),
+            'peak_rss_mb': round(_peak_rss_mb(), 1),
+        })
+    except Exception as e:
+        conn.send({'error': f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+def run_stage(stage: str, n_rows: int, n_cols: int, seed: int = 0, repeat: int = 1) -> dict:
+    """
+    Time one stage on a freshly generated dataset in a separate process.
+
+    Returns:
+    dict: rows, cols, stage, best and mean seconds over `repeat` runs, RSS after generating
+          the dataset and peak RSS (MB), or an 'error' entry if the stage failed.
+    """
+    ctx = multiprocessing.get_context('fork')
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_run_stage, args=(stage, n_rows, n_cols, seed, repeat, child_conn))
+    process.start()
+    child_conn.close()
+    try:
+        result = parent_conn.recv()
+    except EOFError:
+        # The child died without reporting, most likely killed by the OOM killer
+        result = {'error': f"benchmark process exited with code {process.exitcode}"}
+    process.join()
+    return {'rows': n_rows, 'cols': n_cols, 'stage': stage, **result}
+
+def run_startup(target: str, repeat: int = 1) -> dict:
+    """
+    Time one STARTUP_TARGETS entry in `repeat` fresh interpreters (using the current
+    DJANGO_SETTINGS_MODULE). Interpreter start-up itself is not counted.
+
+    Returns:
+    dict: rows and cols (0), stage ('startup:<target>'), best and mean seconds, peak RSS (MB)
+          and the HEAVY_MODULES that were imported, or an 'error' entry if the process failed.
+    """
+    script = STARTUP_SCRIPT.format(code=STARTUP_TARGETS[target], heavy=HEAVY_MODULES)
+    key = {'rows': 0, 'cols': 0, 'stage': f"startup:{target}"}
+    runs = []
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True)
+        if process.returncode != 0:
+            lines = process.stderr.strip().splitlines() or [f"exit code {process.returncode}"]
+            return {**key, 'error': lines[-1]}
+        runs.append(json.loads(process.stdout.strip().splitlines()[-1]))
+    timings = [run['seconds'] for run in runs]
+    return {
+        **key,
+        'seconds': min(timings),
+        'mean_seconds': sum(timings) / len(timings),
+        'peak_rss_mb': max(run['peak_rss_mb'] for run in runs),
+        'heavy_modules': runs[-1]['heavy_modules'],
+    }
+
+def environment_info() -> dict:
+    """Machine and library details stored with every result file"""
+    import platform
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+def compare_results(results: list, baseline: list, threshold: float = 0.2) -> list:
+    """
+    Match results with the baseline on (rows, cols, stage).
+
+    Returns:
+    list: One dict per matched entry with the time and peak RSS ratios (current / baseline)
+          and a 'regression' flag when either grew by more than `threshold`, or when a
+          startup benchmark imports a heavy module the baseline did not.
+    """
+    baseline_by_key = {(b['rows'], b['cols'], b['stage']): b for b in baseline if 'error' not in b}
+    comparisons = []
+    for result in results:
+        base = baseline_by_key.get((result['rows'], result['cols'], result['stage']))
+        if base is None or 'error' in result:
+            continue
+        time_ratio = result['seconds'] / base['seconds'] if base['seconds'] else float('inf')
+        rss_ratio = result['peak_rss_mb'] / base['peak_rss_mb'] if base['peak_rss_mb'] else float('inf')
+        new_modules = sorted(set(result.get('heavy_modules', ())) - set(base.get('heavy_modules', ())))
+        comparisons.append({
+            'rows': result['rows'],
+            'cols': result['cols'],
+            'stage': result['stage'],
+            'seconds': result['seconds'],
+            'baseline_seconds': base['seconds'],
+            'time_ratio': time_ratio,
+            'rss_ratio': rss_ratio,
+            'new_modules': new_modules,
+            'regression': time_ratio > 1 + threshold or rss_ratio > 1 + threshold or bool(new_modules),
+        })
+    return comparisons
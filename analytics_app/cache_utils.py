@@ -0,0 +1,481 @@
+"""
+Cache utilities for parsed uploads.
+Provides:
+1. file_hash: Content hash (SHA-256) of an uploaded file, used as the cache key.
+2. load_dataset: Parse an upload once into an Arrow IPC file and memory-map it on later loads
+   (read_arrow: the memory-mapped DataFrame view of an Arrow file; arrow_parts / read_parts:
+   the Arrow files of appended data, stored one part per append). Large CSVs are parsed and
+   cleaned batch by batch instead of loaded (stream_upload).
+3. load_profile: DatasetProfile of an upload, computed once and stored next to its Arrow file
+   (sketched record batch by record batch above settings.APPROXIMATE_STATS_MIN_ROWS).
+   dataset_files / iter_arrow_chunks: The cached Arrow files of a dataset, and their batches.
+   use_sample / sample_rows: Whether a dataset is analysed on a sample of its rows
+   (settings.ANALYSIS_SAMPLE_ROWS), and the sample, read from the memory-mapped files.
+4. evict_cache: LRU eviction of cached Arrow files once the cache grows past its size cap.
+5. optimize_dtypes: Compact column dtypes at ingest (categories, downcast numbers, Arrow strings).
+6. concat_frames: Append rows to a dataset, reconciling the compacted dtypes of the parts.
+"""
+import hashlib
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+from django.conf import settings
+
+from .profile_utils import DatasetProfile, is_text_column, profile_dataset
+from .timing_utils import timed
+
+# Read uploads in 1 MB blocks when hashing
+HASH_BLOCK_SIZE = 1024 * 1024
+CACHE_SUFFIX = '.arrow'
+PROFILE_SUFFIX = '.profile'
+# Mergeable summaries of appended datasets (see append_utils)
+SUMMARY_SUFFIX = '.summary'
+# Values the missing values of appended rows (see append_utils), or of uploads parsed batch by
+# batch (see stream_upload), were filled with
+FILL_SUFFIX = '.fill'
+# Schema metadata of an Arrow file holding only appended rows: the name of the file it extends
+APPENDED_TO_KEY = b'appended_to'
+# Text columns with at most this fraction of distinct values are stored as categories
+CATEGORY_MAX_FRACTION = 0.5
+
+def cache_dir() -> str:
+    """Directory holding the cached Arrow files (created on demand)"""
+    os.makedirs(settings.DATASET_CACHE_DIR, exist_ok=True)
+    return settings.DATASET_CACHE_DIR
+
+def file_hash(filepath) -> str:
+    """Return the SHA-256 hex digest of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+@timed('read_upload')
+def read_upload(filepath) -> pd.DataFrame:
+    """Parse a raw upload, choosing the reader from the file extension"""
+    from .upload_utils import CHAIN_SUFFIX, chain_parts
+    # Try to determine if the file is CSV, Excel, etc.
+    if filepath.endswith(CHAIN_SUFFIX):
+        # An appended version: its parent followed by the appended rows
+        parent, rows = chain_parts(filepath)
+        return concat_frames(read_upload(parent), read_upload(rows))
+    if filepath.endswith(('.xls', '.xlsx')):
+        df = pd.read_excel(filepath)
+    else:
+        # Default to CSV if unsure
+        df = pd.read_csv(filepath)
+    # Arrow needs string column names (Excel headers can be numbers)
+    df.columns = [str(col) for col in df.columns]
+    return optimize_dtypes(df)
+
+def _compact_column(series: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(series):
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        # Only plain numpy integers: nullable ones (Int64, ...) keep their missing-value semantics
+        if isinstance(series.dtype, np.dtype):
+            return pd.to_numeric(series, downcast='integer')
+        return series
+    if pd.api.types.is_float_dtype(series):
+        # float32 only when every value survives the round trip unchanged
+        if series.dtype == 'float64':
+            narrow = series.astype('float32')
+            if (narrow.astype('float64') == series)[series.notna()].all():
+                return narrow
+        return series
+    if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+        n_values = series.count()
+        if n_values == 0:
+            return series
+        if series.nunique() <= CATEGORY_MAX_FRACTION * n_values:
+            return series.astype('category')
+        # High-cardinality text stays text, but in Arrow memory rather than Python objects
+        if pd.api.types.is_object_dtype(series) and pd.api.types.infer_dtype(series, skipna=True) == 'string':
+            return series.astype('string[pyarrow]')
+    return series
+
+@timed('optimize_dtypes')
+def optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Shrink a freshly parsed DataFrame: low-cardinality text columns become categories,
+    integers are downcast to the narrowest type holding their range, floats become float32
+    when that is lossless, and remaining object text columns become Arrow-backed strings.
+    """
+    return pd.DataFrame({col: _compact_column(df[col]) for col in df.columns}, index=df.index)
+
+def concat_frames(df: pd.DataFrame, *rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Append `rows` (one or more frames with the same columns, any order) to `df`. The parts were
+    compacted separately, so categorical columns are merged with the union of their categories
+    instead of falling back to object, and other columns take the common dtype of the parts.
+    """
+    columns = {}
+    for col in df.columns:
+        parts = [part[col].reset_index(drop=True) for part in (df, *rows)]
+        if len({is_text_column(part) for part in parts}) > 1:
+            # A column parsed as numbers in one part and as text in another is kept as text
+            parts = [part if is_text_column(part) else part.astype('str') for part in parts]
+        if any(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            parts = [part.astype('category') for part in parts]
+            if len({str(part.cat.categories.dtype) for part in parts}) > 1:
+                parts = [part.astype('str').astype('category') for part in parts]
+            columns[col] = pd.Series(pd.api.types.union_categoricals(parts, ignore_order=True), name=col)
+        else:
+            columns[col] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+@timed('fillna')
+def clean_dataset(df: pd.DataFrame) -> pd.DataFrame:
+    """Fill missing values in numeric columns with mean, in categorical with most frequent"""
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].fillna(df[col].mean())
+        else:
+            mode = df[col].mode()
+            df[col] = df[col].fillna(mode[0] if not mode.empty else "Unknown")
+    return df
+
+def cache_path(digest: str, variant: str = 'raw', suffix: str = CACHE_SUFFIX) -> str:
+    """Path of a cached file (Arrow by default) for a content hash and variant ('raw' or 'clean')"""
+    return os.path.join(cache_dir(), f"{digest}.{variant}{suffix}")
+
+def read_arrow(path: str) -> pd.DataFrame:
+    """
+    DataFrame over a memory-mapped Arrow IPC file. Numeric columns without missing values and
+    text columns are not copied out of the map, so only the pages that are used get read. Their
+    arrays are read-only: operations on whole columns return new arrays, but setting single
+    values (df.loc[i, col] = x) needs a copy of the frame first. Columns with missing numbers and
+    the codes of categorical columns are converted into memory.
+    """
+    return feather.read_table(path, memory_map=True).to_pandas(split_blocks=True)
+
+def parent_part(path: str) -> str:
+    """Path of the Arrow file that the rows of `path` were appended to, or None for complete data"""
+    with pa.memory_map(path) as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    parent = metadata.get(APPENDED_TO_KEY)
+    return os.path.join(os.path.dirname(path), parent.decode()) if parent else None
+
+def arrow_parts(path: str) -> list:
+    """The Arrow files holding the data of `path`, oldest first (one file unless rows were appended)"""
+    parts = [path]
+    while (parent := parent_part(parts[0])) is not None:
+        parts.insert(0, parent)
+    return parts
+
+def read_parts(paths: list) -> pd.DataFrame:
+    """DataFrame of the rows of several Arrow files (see arrow_parts); one file is only memory-mapped"""
+    frames = [read_arrow(path) for path in paths]
+    return frames[0] if len(frames) == 1 else concat_frames(*frames)
+
+def write_arrow(df: pd.DataFrame, path: str, appended_to: str = None, **kwargs) -> None:
+    """
+    Write a DataFrame as an uncompressed Arrow IPC file. `appended_to` names the Arrow file (in
+    the same directory) whose rows these rows follow. kwargs go to feather.write_feather.
+    """
+    table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+    if appended_to is not None:
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               APPENDED_TO_KEY: os.path.basename(appended_to).encode()})
+    feather.write_feather(table, path, compression='uncompressed', **kwargs)
+
+def iter_arrow_chunks(paths: list):
+    """DataFrames of the record batches of Arrow files, one batch at a time"""
+    for path in paths:
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i).to_pandas()
+
+def use_sample(n_rows: int) -> bool:
+    """Whether comparisons and sweeps of a dataset this size run on a sample (settings.ANALYSIS_SAMPLE_ROWS)"""
+    sample_rows = settings.ANALYSIS_SAMPLE_ROWS
+    return sample_rows is not None and n_rows > sample_rows
+
+def sample_rows(paths: list, n_rows: int, rng=None) -> pd.DataFrame:
+    """
+    DataFrame of n_rows uniformly sampled rows of Arrow files (see arrow_parts), in file order.
+    Only the sampled rows are read from the memory maps. The same seed picks the same positions
+    in files with the same number of rows, e.g. a dataset and its release.
+    """
+    tables = [feather.read_table(path, memory_map=True) for path in paths]
+    total = sum(table.num_rows for table in tables)
+    picks = np.sort(np.random.default_rng(rng).choice(total, size=min(n_rows, total), replace=False))
+    frames, offset = [], 0
+    for table in tables:
+        part = picks[(picks >= offset) & (picks < offset + table.num_rows)] - offset
+        frames.append(table.take(part).to_pandas())
+        offset += table.num_rows
+    return frames[0] if len(frames) == 1 else concat_frames(*frames)
+
+def arrow_rows(paths: list) -> int:
+    """Number of rows in Arrow files, read from their metadata"""
+    rows = 0
+    for path in paths:
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            rows += sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+    return rows
+
+@timed('cache_read')
+def _read_cached(*paths: str) -> pd.DataFrame:
+    # Memory-map the Arrow IPC files: no parsing, and mostly no copying (see read_arrow)
+    df = read_parts(paths)
+    # Bump the modification times so eviction sees these files as recently used
+    for path in paths:
+        os.utime(path)
+    return df
+
+def write_cached(df: pd.DataFrame, path: str, appended_to: str = None) -> None:
+    # Write to a temporary file first so concurrent readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write_arrow(df, tmp_path, appended_to=appended_to)
+    os.replace(tmp_path, path)
+    evict_cache(keep=path)
+
+def load_dataset(filepath, clean: bool = False, digest: str = None) -> pd.DataFrame:
+    """
+    Load an uploaded dataset through the columnar cache.
+
+    Parameters:
+    filepath (str): Path of the raw upload.
+    clean (bool): Return the dataset with missing values filled (see clean_dataset).
+    digest (str): Content hash of the upload, if already known. Computed otherwise.
+
+    Returns:
+    pd.DataFrame: The parsed (and optionally cleaned) dataset.
+    """
+    from .upload_utils import CHAIN_SUFFIX
+    digest = digest or file_hash(filepath)
+    if str(filepath).endswith(CHAIN_SUFFIX):
+        # Appended versions are cached as one part per append (see append_utils)
+        from .append_utils import dataset_parts
+        return _read_cached(*dataset_parts(filepath, digest, clean=clean))
+    path = cache_path(digest, 'clean' if clean else 'raw')
+    if os.path.exists(path):
+        return _read_cached(path)
+    if use_streaming_conversion(filepath) and stream_upload(filepath, digest):
+        return _read_cached(path)
+
+    raw_path = cache_path(digest, 'raw')
+    if os.path.exists(raw_path):
+        df = _read_cached(raw_path)
+    else:
+        df = read_upload(filepath)
+        write_cached(df, raw_path)
+
+    if clean:
+        df = clean_dataset(df)
+        write_cached(df, path)
+    return df
+
+def dataset_files(filepath, clean: bool = False, digest: str = None) -> list:
+    """The cached Arrow files of a dataset, oldest part first, parsing it into the cache if needed"""
+    from .upload_utils import CHAIN_SUFFIX
+    digest = digest or file_hash(filepath)
+    if str(filepath).endswith(CHAIN_SUFFIX):
+        from .append_utils import dataset_parts
+        return dataset_parts(filepath, digest, clean=clean)
+    path = cache_path(digest, 'clean' if clean else 'raw')
+    if not os.path.exists(path) and not (use_streaming_conversion(filepath) and stream_upload(filepath, digest)):
+        load_dataset(filepath, clean=clean, digest=digest)
+    return [path]
+
+def use_streaming_conversion(filepath) -> bool:
+    """Whether an upload is parsed batch by batch (CSVs of settings.STREAMING_CONVERSION_MIN_BYTES or more)"""
+    min_bytes = settings.STREAMING_CONVERSION_MIN_BYTES
+    return (min_bytes is not None and str(filepath).lower().endswith('.csv')
+            and os.path.getsize(filepath) >= min_bytes)
+
+def _compact_dtype(col_stats: dict, n_rows: int):
+    # The dtype _compact_column gives a whole column, decided from its stats (see
+    # privacy_utils.collect_column_stats) so that every batch is stored with the same schema.
+    # Text columns with more distinct values than the stats count stay text
+    kind = col_stats['kind']
+    if kind == 'int':
+        return next(np.dtype(dtype) for dtype in (np.int8, np.int16, np.int32, np.int64)
+                    if np.iinfo(dtype).min <= col_stats['min'] and col_stats['max'] <= np.iinfo(dtype).max)
+    if kind == 'float' and col_stats['float32']:
+        return np.dtype('float32')
+    if kind == 'object':
+        counts, n_values = col_stats['counts'], n_rows - col_stats['nulls']
+        if counts is not None and n_values and len(counts) <= CATEGORY_MAX_FRACTION * n_values:
+            return pd.CategoricalDtype(sorted(counts))
+    return None
+
+def _most_frequent(path: str, col: str):
+    # Most frequent value of a cached column, the smallest of tied ones as Series.mode() sorts
+    # them; counted by Arrow over the memory-mapped column
+    counts = pc.value_counts(pc.drop_null(feather.read_table(path, columns=[col], memory_map=True).column(col)))
+    if len(counts) == 0:
+        return "Unknown"
+    values, frequencies = counts.field('values'), counts.field('counts')
+    return pc.min(pc.filter(values, pc.equal(frequencies, pc.max(frequencies)))).as_py()
+
+def _write_chunks(chunks, path: str) -> None:
+    # write_cached for a dataset given as DataFrames of the same columns and dtypes, written as
+    # they come (one or more record batches each)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    writer, schema = None, None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                writer = pa.ipc.new_file(tmp_path, schema)
+            writer.write_table(table)
+        writer.close()
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    evict_cache(keep=path)
+
+@timed('stream_upload')
+def stream_upload(filepath, digest: str) -> bool:
+    """
+    Parse a CSV upload into its raw and cleaned cache files without loading it. A first pass
+    gathers the column stats (see privacy_utils.collect_column_stats), which fix the compact
+    dtype of every column and the values clean_dataset fills gaps with; the second parses the
+    file chunk by chunk into the raw file, and the cleaned file is written batch by batch from
+    the raw one. The fill values are stored with the cleaned file (FILL_SUFFIX).
+
+    Returns:
+    bool: False (nothing is stored) when the file has no rows.
+    """
+    from .privacy_utils import clean_column_stats, collect_column_stats, parse_dtypes
+    chunksize = settings.STREAMING_CHUNK_ROWS
+    stats = collect_column_stats(filepath, chunksize=chunksize, drop_identifiers=False)
+    if stats['n_rows'] == 0:
+        return False
+    dtypes = {col: dtype for col, col_stats in stats['columns'].items()
+              if (dtype := _compact_dtype(col_stats, stats['n_rows'])) is not None}
+    raw_path = cache_path(digest, 'raw')
+    _write_chunks((chunk.astype(dtypes) for chunk in pd.read_csv(filepath, chunksize=chunksize,
+                                                                 dtype=parse_dtypes(stats))), raw_path)
+
+    # Text columns with too many distinct values for the stats to know their most frequent one
+    # are counted in the raw file
+    known = {col: _most_frequent(raw_path, col) for col, col_stats in stats['columns'].items()
+             if col_stats['kind'] == 'object' and col_stats['nulls'] and col_stats['counts'] is None}
+    _, fill = clean_column_stats(stats, known=known)
+    _write_chunks((chunk.fillna(fill).astype(dict(chunk.dtypes)) for chunk in iter_arrow_chunks([raw_path])),
+                  cache_path(digest, 'clean'))
+    fill_path = cache_path(digest, 'clean', FILL_SUFFIX)
+    tmp_path = f"{fill_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(fill, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, fill_path)
+    return True
+
+def stored_fill(digest: str) -> dict:
+    """The fill values stored with a dataset's cleaned data (FILL_SUFFIX), or None"""
+    path = cache_path(digest, 'clean', FILL_SUFFIX)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def load_profile(filepath, clean: bool = False, digest: str = None, df: pd.DataFrame = None) -> DatasetProfile:
+    """
+    Load the cached DatasetProfile of an upload, profiling it on first use.
+
+    A dataset that is not already loaded is profiled from its cached Arrow files: with
+    mergeable sketches, one record batch at a time, when it has APPROXIMATE_STATS_MIN_ROWS rows
+    or more or was parsed batch by batch (see sketch_utils and stream_upload), and exactly
+    otherwise. Loaded datasets are profiled exactly.
+
+    Parameters:
+    filepath (str): Path of the raw upload.
+    clean (bool): Profile the cleaned variant of the dataset (see load_dataset).
+    digest (str): Content hash of the upload, if already known.
+    df (pd.DataFrame): The already loaded dataset, to avoid reading it again on a miss.
+
+    Returns:
+    DatasetProfile: The profile of the dataset.
+    """
+    from .upload_utils import CHAIN_SUFFIX
+    digest = digest or file_hash(filepath)
+    path = cache_path(digest, 'clean' if clean else 'raw', PROFILE_SUFFIX)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            profile = pickle.load(f)
+        # Exact profiles are always reused, sketched ones while the dataset is still large
+        # enough to be sketched. Appended versions are always profiled from merged summaries
+        # (see append_utils)
+        if (not profile.approximate or use_approximate_stats(profile.n_rows) or filepath.endswith(CHAIN_SUFFIX)
+                or use_streaming_conversion(filepath)):
+            os.utime(path)
+            return profile
+
+    if df is None:
+        paths = dataset_files(filepath, clean=clean, digest=digest)
+        if use_approximate_stats(arrow_rows(paths)) or use_streaming_conversion(filepath):
+            from .sketch_utils import sketch_chunks, sketch_profile
+            profile = sketch_profile(*sketch_chunks(iter_arrow_chunks(paths)))
+            save_profile(profile, digest, clean=clean)
+            return profile
+        df = _read_cached(*paths)
+    profile = profile_dataset(df)
+    save_profile(profile, digest, clean=clean)
+    return profile
+
+def save_profile(profile: DatasetProfile, digest: str, clean: bool = False) -> None:
+    """Store the profile of a dataset where load_profile finds it"""
+    path = cache_path(digest, 'clean' if clean else 'raw', PROFILE_SUFFIX)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(profile, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def use_approximate_stats(n_rows: int) -> bool:
+    """Whether datasets of this size are sketched when profiled from the cache (settings.APPROXIMATE_STATS_MIN_ROWS)"""
+    min_rows = settings.APPROXIMATE_STATS_MIN_ROWS
+    return min_rows is not None and n_rows >= min_rows
+
+def evict_cache(max_bytes: int = None, keep: str = None) -> list:
+    """
+    Delete least recently used cached Arrow files until they fit in max_bytes.
+    Profiles and summaries are small and never evicted: the summaries of appended versions
+    hold the merged statistics appends build on, which their data alone does not reproduce.
+
+    Parameters:
+    max_bytes (int): Size cap, defaults to settings.DATASET_CACHE_MAX_BYTES.
+    keep (str): Path that must not be evicted (e.g. the file just written).
+
+    Returns:
+    list: Paths of the removed files.
+    """
+    if max_bytes is None:
+        max_bytes = settings.DATASET_CACHE_MAX_BYTES
+    entries = []
+    with os.scandir(cache_dir()) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.endswith(CACHE_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    # Oldest modification time first = least recently used
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed.append(path)
+    return removed
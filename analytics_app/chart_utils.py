@@ -0,0 +1,160 @@
+"""
+Chart aggregates for client-side (plotly) rendering.
+Provides:
+1. chart_columns: The numeric (or numeric-looking) columns worth charting, from the dataset profile.
+2. numeric_block: Extract columns as one contiguous float64 block (one row per column).
+3. histogram_data: Histogram bins and a Gaussian KDE curve for one column.
+4. grid_histogram_data: The same chart from a GridHistogram (see sketch_utils), without the data.
+5. correlation_data: Pairwise (NaN-aware) Pearson correlations with the strongest pairs, clustered
+   and downsampled for wide tables (see correlation_utils).
+6. chart_data: All of the above for a DataFrame, as a small JSON-serializable dict.
+
+The browser draws the charts, so the server only ships a few KB of numbers per chart
+instead of rasterizing PNGs.
+"""
+import numpy as np
+import pandas as pd
+
+from .correlation_utils import correlation_matrix, correlation_report
+from .profile_utils import DatasetProfile, profile_dataset
+
+# Histogram bars per column
+HIST_BINS = 30
+# Points on each KDE curve
+KDE_POINTS = 128
+# The KDE is computed by binning the data on a fine grid and smoothing it with a Gaussian
+# kernel, which costs O(n + grid) instead of O(n * points)
+KDE_GRID = 1024
+# Significant digits kept in the payload
+PRECISION = 6
+
+def chart_columns(profile: DatasetProfile) -> list:
+    """
+    Numeric columns plus text columns that convert to numbers, in frame order,
+    skipping columns where more than half of the values are missing or not numeric.
+    """
+    numeric_set = set(profile.numeric_columns)
+    return [col for col in profile.columns
+            if (col in numeric_set or col in profile.numeric_like)
+            and profile.coerced_null_count(col) <= 0.5 * profile.n_rows]
+
+def numeric_block(df: pd.DataFrame, columns: list, profile: DatasetProfile) -> np.ndarray:
+    """Return the columns as rows of one float64 block (non-numeric values become NaN)"""
+    numeric_set = set(profile.numeric_columns)
+    block = np.empty((len(columns), profile.n_rows), dtype='float64')
+    for i, col in enumerate(columns):
+        values = df[col] if col in numeric_set else pd.to_numeric(df[col], errors='coerce')
+        block[i] = values.to_numpy(dtype='float64', na_value=np.nan)
+    return block
+
+def _rounded(values) -> list:
+    # Trim the payload to PRECISION significant digits; NaN becomes None (null in JSON)
+    return [float(f"{v:.{PRECISION}g}") if np.isfinite(v) else None for v in np.asarray(values, dtype='float64')]
+
+def _grid_density(grid_counts: np.ndarray, step: float, bandwidth: float, n_values: int) -> np.ndarray:
+    # Gaussian kernel sampled on the grid, truncated at 4 bandwidths
+    half_width = min(len(grid_counts), int(np.ceil(4 * bandwidth / step)))
+    offsets = np.arange(-half_width, half_width + 1) * step
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    return np.convolve(grid_counts, kernel, mode='same') / n_values
+
+def histogram_data(values: np.ndarray) -> dict:
+    """
+    Histogram of the finite values and a Gaussian KDE (Scott's rule bandwidth) scaled to
+    the histogram's counts, so both can share one axis as in seaborn's histplot(kde=True).
+
+    Returns:
+    dict: bin_edges, counts, kde_x and kde_y (empty KDE lists when the values are constant).
+    """
+    values = values[np.isfinite(values)]
+    if values.size == 0:
+        return {'bin_edges': [], 'counts': [], 'kde_x': [], 'kde_y': []}
+    counts, edges = np.histogram(values, bins=HIST_BINS)
+    result = {'bin_edges': _rounded(edges), 'counts': counts.tolist(), 'kde_x': [], 'kde_y': []}
+
+    std = values.std(ddof=1) if values.size > 1 else 0.0
+    if not std > 0:
+        return result
+    bandwidth = std * values.size ** (-1 / 5)
+    low, high = values.min() - 3 * bandwidth, values.max() + 3 * bandwidth
+    grid_counts, grid_edges = np.histogram(values, bins=KDE_GRID, range=(low, high))
+    density = _grid_density(grid_counts, grid_edges[1] - grid_edges[0], bandwidth, values.size)
+    centers = (grid_edges[:-1] + grid_edges[1:]) / 2
+    picks = np.linspace(0, KDE_GRID - 1, KDE_POINTS).round().astype(int)
+    bin_width = edges[1] - edges[0]
+    result['kde_x'] = _rounded(centers[picks])
+    result['kde_y'] = _rounded(density[picks] * values.size * bin_width)
+    return result
+
+def grid_histogram_data(grid) -> dict:
+    """
+    histogram_data computed from a GridHistogram. Bars are rebuilt from the grid's fine bins
+    (counts are exact up to the share of one fine bin at each bar edge) and the KDE is
+    smoothed on the grid itself.
+    """
+    if grid.count == 0:
+        return {'bin_edges': [], 'counts': [], 'kde_x': [], 'kde_y': []}
+    grid_edges = grid.edges()
+    if grid.max > grid.min:
+        edges = np.linspace(grid.min, grid.max, HIST_BINS + 1)
+    else:
+        # np.histogram's range for constant values
+        edges = np.linspace(grid.min - 0.5, grid.max + 0.5, HIST_BINS + 1)
+    if grid.integral and grid.width <= 1:
+        # At most one whole number per fine bin, sitting at a point inside it: count each fine
+        # bin in the bar holding its center
+        centers = (grid_edges[:-1] + grid_edges[1:]) / 2
+        bars = np.clip(np.searchsorted(edges, centers, side='right') - 1, 0, HIST_BINS - 1)
+        counts = np.bincount(bars, weights=grid.counts, minlength=HIST_BINS).astype('int64')
+    else:
+        # Continuous values: interpolate the cumulative counts linearly inside each fine bin
+        cumulative = np.interp(edges, grid_edges, np.concatenate([[0], np.cumsum(grid.counts)]))
+        cumulative[0], cumulative[-1] = 0, grid.count
+        counts = np.diff(np.rint(cumulative)).astype('int64')
+    result = {'bin_edges': _rounded(edges), 'counts': counts.tolist(), 'kde_x': [], 'kde_y': []}
+
+    if not grid.std > 0:
+        return result
+    bandwidth = grid.std * grid.count ** (-1 / 5)
+    # Empty bins around the grid so the curve's tails are not cut off at the data's range
+    pad = int(np.ceil(4 * bandwidth / grid.width))
+    density = _grid_density(np.pad(grid.counts, pad), grid.width, bandwidth, grid.count)
+    centers = grid.low + (np.arange(-pad, grid.bins + pad) + 0.5) * grid.width
+    kde_x = np.linspace(grid.min - 3 * bandwidth, grid.max + 3 * bandwidth, KDE_POINTS)
+    result['kde_x'] = _rounded(kde_x)
+    result['kde_y'] = _rounded(np.interp(kde_x, centers, density, left=0, right=0)
+                               * grid.count * (edges[1] - edges[0]))
+    return result
+
+def correlation_data(block: np.ndarray, labels: list, sample_rows: int = None) -> dict:
+    """Pairwise-complete Pearson correlation of the block's rows (see correlation_utils.correlation_report)"""
+    matrix, n_used = correlation_matrix(block, sample_rows=sample_rows)
+    return correlation_report(matrix, labels, n_used, block.shape[1])
+
+def chart_data(df: pd.DataFrame, profile: DatasetProfile = None, grids: dict = None,
+               correlation: bool = True, block: np.ndarray = None) -> dict:
+    """
+    Precompute every chart for a DataFrame: a histogram with KDE for each chartable
+    column and the correlation matrix when there are at least 2 of them.
+    `grids` maps columns to GridHistograms kept up to date incrementally (see append_utils);
+    those columns' histograms are drawn from them instead of from the data.
+    With `correlation=False` the matrix is left out (compare_datasets correlates both
+    datasets together, see correlation_utils.compare_correlations); `block` is the
+    numeric_block of the chart columns when the caller already has it.
+
+    Returns:
+    dict: {'histograms': [{'column', 'bin_edges', 'counts', 'kde_x', 'kde_y'}, ...],
+           'correlation': {'columns', 'matrix', 'groups', 'top_pairs', ...} or None}
+    """
+    if profile is None:
+        profile = profile_dataset(df)
+    grids = grids or {}
+    columns = chart_columns(profile)
+    if block is None:
+        block = numeric_block(df, columns, profile)
+    labels = [str(col) for col in columns]
+    return {
+        'histograms': [{'column': label, **(grid_histogram_data(grids[col]) if col in grids else histogram_data(row))}
+                       for col, label, row in zip(columns, labels, block)],
+        'correlation': correlation_data(block, labels) if correlation and len(columns) >= 2 else None,
+    }
@@ -0,0 +1,238 @@
+"""
+Correlation engine for wide tables.
+Provides:
+1. correlation_matrix / CorrelationAccumulator: Pairwise-complete (NaN-aware) Pearson
+   correlations of the rows of a block, from a few float32 matrix products (BLAS) per slab
+   of rows; optionally on a uniform sample of the rows, or accumulated slab by slab.
+2. top_pairs: The most strongly correlated column pairs.
+3. cluster_order / downsample: Order columns so correlated ones sit together, and average
+   the matrix into at most a given number of column groups so wide tables stay readable.
+4. correlation_report: All of the above for one block, as a JSON-serializable dict.
+5. compare_correlations: Reports for the original and anonymized blocks plus their drift
+   (anon - orig), all from one pass over both blocks stacked together.
+
+This module does not import Django, so pool workers can use it on its own.
+"""
+import numpy as np
+
+# Rows multiplied at a time. Each slab is accumulated in float32 by BLAS and the slab results
+# are summed in float64, which bounds the float32 rounding error by the slab size.
+SLAB_ROWS = 65_536
+# Strongest pairs listed
+TOP_PAIRS = 20
+# Heatmaps wider than this are clustered and averaged down to this many column groups
+HEATMAP_MAX_COLUMNS = 40
+# Significant digits kept in the payload
+PRECISION = 4
+
+
+class CorrelationAccumulator:
+    """
+    Pairwise-complete Pearson correlations of k variables accumulated over slabs of
+    positions (see correlation_matrix). Values are shifted by `shift` (one value per
+    variable, ideally near its mean) before narrowing to float32, so the products do not
+    lose precision to large offsets; correlations do not change under shifts.
+    """
+
+    def __init__(self, shift: np.ndarray):
+        self.shift = np.asarray(shift, dtype='float64').reshape(-1, 1)
+        k = len(self.shift)
+        self.n = 0
+        self.pair_counts, self.sums, self.squares, self.cross = (np.zeros((k, k)) for _ in range(4))
+
+    def add(self, slab: np.ndarray) -> None:
+        """Add a (k x positions) slab; NaN and infinite values are missing"""
+        with np.errstate(invalid='ignore'):
+            slab = (slab - self.shift).astype('float32')
+        mask = np.isfinite(slab)
+        self.n += slab.shape[1]
+        if mask.all():
+            self.cross += slab @ slab.T
+            self.pair_counts += slab.shape[1]
+            self.sums += slab.sum(axis=1, dtype='float64')[:, None]
+            self.squares += np.einsum('ij,ij->i', slab, slab, dtype='float64')[:, None]
+        else:
+            values = np.where(mask, slab, np.float32(0))
+            present = mask.astype('float32')
+            self.cross += values @ values.T
+            self.pair_counts += present @ present.T
+            self.sums += values @ present.T
+            self.squares += (values * values) @ present.T
+
+    def matrix(self) -> np.ndarray:
+        """k x k float64 correlation matrix with NaN where undefined"""
+        pair_counts, sums = self.pair_counts, self.sums
+        with np.errstate(invalid='ignore', divide='ignore'):
+            covariance = self.cross - sums * sums.T / pair_counts
+            variance = self.squares - sums * sums / pair_counts
+            matrix = covariance / np.sqrt(variance * variance.T)
+        # Fewer than 2 shared values, or a constant column: undefined, as in pandas
+        matrix[(pair_counts < 2) | ~np.isfinite(matrix)] = np.nan
+        np.clip(matrix, -1, 1, out=matrix)
+        defined = ~np.isnan(np.diag(matrix))
+        matrix[np.diag_indices(len(matrix))] = np.where(defined, 1.0, np.nan)
+        return matrix
+
+
+def row_means(block: np.ndarray) -> np.ndarray:
+    """Mean of each row over its finite values (0 for rows without any)"""
+    finite = np.isfinite(block)
+    totals = np.where(finite, block, 0).sum(axis=1)
+    return totals / np.maximum(finite.sum(axis=1), 1)
+
+def correlation_matrix(block: np.ndarray, sample_rows: int = None, rng=None, slab_rows: int = SLAB_ROWS) -> tuple:
+    """
+    Pearson correlation of every pair of rows of `block` (one row per column of the dataset),
+    each pair over the positions where both are finite, like DataFrame.corr().
+
+    With missing values, every entry needs its own pair counts and sums. These are all
+    matrix products of the zero-filled values X and the finite mask M:
+    n = M M', s = X M', q = X^2 M' and c = X X', so
+    r_ij = (c - s_ij s_ji / n) / sqrt((q_ij - s_ij^2 / n)(q_ji - s_ji^2 / n)).
+    Slabs without missing values need only the one product X X'.
+
+    Parameters:
+    block (np.ndarray): 2-D array, one row per column of the dataset.
+    sample_rows (int): Estimate from this many uniformly sampled positions when there are more.
+    rng (int or np.random.Generator): Seed or generator for the sample.
+    slab_rows (int): Positions multiplied at a time.
+
+    Returns:
+    tuple: (k x k float64 correlation matrix with NaN where undefined, number of positions used)
+    """
+    n = block.shape[1]
+    if sample_rows is not None and n > sample_rows:
+        picks = np.sort(np.random.default_rng(rng).choice(n, size=sample_rows, replace=False))
+        block = block[:, picks]
+        n = sample_rows
+
+    accumulator = CorrelationAccumulator(row_means(block))
+    for start in range(0, n, slab_rows):
+        accumulator.add(block[:, start:start + slab_rows])
+    return accumulator.matrix(), n
+
+def top_pairs(matrix: np.ndarray, labels: list, k: int = TOP_PAIRS) -> list:
+    """The k column pairs with the largest absolute correlation, strongest first"""
+    rows, cols = np.triu_indices(len(labels), 1)
+    values = matrix[rows, cols]
+    valid = np.flatnonzero(~np.isnan(values))
+    strongest = valid[np.argsort(-np.abs(values[valid]), kind='stable')[:k]]
+    return [{'a': labels[rows[i]], 'b': labels[cols[i]], 'r': _round(values[i])} for i in strongest]
+
+def cluster_order(matrix: np.ndarray) -> np.ndarray:
+    """Column order from average-linkage clustering on 1 - |r| (undefined pairs count as uncorrelated)"""
+    if len(matrix) < 3:
+        return np.arange(len(matrix))
+    # Imported here: scipy.cluster is slow to import and only wide heatmaps are clustered
+    from scipy.cluster.hierarchy import leaves_list, linkage
+    from scipy.spatial.distance import squareform
+    distance = 1 - np.abs(np.nan_to_num(matrix))
+    np.fill_diagonal(distance, 0)
+    distance = np.clip((distance + distance.T) / 2, 0, 1)
+    return leaves_list(linkage(squareform(distance, checks=False), method='average'))
+
+def downsample(matrix: np.ndarray, labels: list, max_columns: int = HEATMAP_MAX_COLUMNS) -> tuple:
+    """
+    Average a (clustered) matrix over consecutive groups of columns so it has at most
+    max_columns rows and columns. Returns (matrix, group labels, groups of column labels).
+    """
+    k = len(labels)
+    if k <= max_columns:
+        return matrix, list(labels), [[label] for label in labels]
+    bounds = np.linspace(0, k, max_columns + 1).round().astype(int)
+    groups = [list(labels[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:])]
+    # Sums of each block through cumulative sums along both axes (NaN counts as missing)
+    valid = ~np.isnan(matrix)
+    totals = np.add.reduceat(np.add.reduceat(np.where(valid, matrix, 0), bounds[:-1], axis=0), bounds[:-1], axis=1)
+    counts = np.add.reduceat(np.add.reduceat(valid.astype('int64'), bounds[:-1], axis=0), bounds[:-1], axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        averaged = totals / counts
+    names = [group[0] if len(group) == 1 else f"{group[0]} … {group[-1]} ({len(group)})" for group in groups]
+    return averaged, names, groups
+
+def _round(value) -> float:
+    return float(f"{value:.{PRECISION}g}") if np.isfinite(value) else None
+
+def _rounded(matrix: np.ndarray) -> list:
+    return [[_round(value) for value in row] for row in matrix]
+
+def correlation_report(matrix: np.ndarray, labels: list, n_used: int, n_rows: int, order: np.ndarray = None,
+                       max_columns: int = HEATMAP_MAX_COLUMNS) -> dict:
+    """
+    JSON payload for one correlation matrix: the heatmap (clustered and downsampled when wider
+    than max_columns, in `order` if given), the strongest pairs, and how many rows were used.
+    """
+    labels = [str(label) for label in labels]
+    wide = len(labels) > max_columns
+    if wide and order is None:
+        order = cluster_order(matrix)
+    if order is not None:
+        matrix = matrix[np.ix_(order, order)]
+        labels = [labels[i] for i in order]
+    heatmap, names, groups = downsample(matrix, labels, max_columns)
+    return {
+        'columns': names,
+        'matrix': _rounded(heatmap),
+        # Column labels behind each heatmap row when columns were averaged together
+        'groups': groups if wide else None,
+        'clustered': order is not None,
+        'top_pairs': top_pairs(matrix, labels),
+        'rows_used': int(n_used),
+        'sampled': n_used < n_rows,
+    }
+
+def compare_correlations(orig_block: np.ndarray, orig_labels: list, anon_block: np.ndarray, anon_labels: list,
+                         sample_rows: int = None, rng=None, max_columns: int = HEATMAP_MAX_COLUMNS) -> dict:
+    """
+    Correlation reports of the original and anonymized blocks and the drift between them.
+    Both blocks (same rows, as a release keeps the rows of its dataset) are stacked and
+    correlated in one pass, sampling the same positions from both; the drift is anon - orig
+    over the columns they share, shown in the original's cluster order. The original's top
+    pairs also carry their anonymized correlation ('anon_r').
+
+    Returns:
+    dict: {'orig': report or None, 'anon': report or None,
+           'drift': {'columns', 'matrix', 'groups', 'max_abs', 'mean_abs'} or None}
+    """
+    orig_labels, anon_labels = [str(label) for label in orig_labels], [str(label) for label in anon_labels]
+    n_rows = orig_block.shape[1]
+    stacked = np.vstack([orig_block, anon_block]) if anon_block.shape[1] == n_rows else orig_block
+    matrix, n_used = correlation_matrix(stacked, sample_rows=sample_rows, rng=rng)
+    k = len(orig_labels)
+    orig_matrix = matrix[:k, :k]
+    if stacked is orig_block:
+        anon_matrix, anon_used = correlation_matrix(anon_block, sample_rows=sample_rows, rng=rng)
+    else:
+        anon_matrix, anon_used = matrix[k:, k:], n_used
+
+    result = {'orig': None, 'anon': None, 'drift': None}
+    order = cluster_order(orig_matrix) if k > max_columns else None
+    if k >= 2:
+        result['orig'] = correlation_report(orig_matrix, orig_labels, n_used, n_rows, order, max_columns)
+    if len(anon_labels) >= 2:
+        result['anon'] = correlation_report(anon_matrix, anon_labels, anon_used, anon_block.shape[1],
+                                            max_columns=max_columns)
+
+    anon_index = {label: i for i, label in enumerate(anon_labels)}
+    shared = [i for i, label in enumerate(orig_labels) if label in anon_index]
+    if len(shared) >= 2:
+        if order is not None:
+            position = {i: p for p, i in enumerate(order)}
+            shared.sort(key=position.get)
+        picks = [anon_index[orig_labels[i]] for i in shared]
+        if result['orig']:
+            # The same pairs after anonymization, for a side-by-side table
+            for pair in result['orig']['top_pairs']:
+                a, b = anon_index.get(pair['a']), anon_index.get(pair['b'])
+                pair['anon_r'] = None if a is None or b is None else _round(anon_matrix[a, b])
+        drift = anon_matrix[np.ix_(picks, picks)] - orig_matrix[np.ix_(shared, shared)]
+        heatmap, names, groups = downsample(drift, [orig_labels[i] for i in shared], max_columns)
+        off_diagonal = np.abs(drift[~np.eye(len(shared), dtype=bool)])
+        result['drift'] = {
+            'columns': names,
+            'matrix': _rounded(heatmap),
+            'groups': groups if len(shared) > max_columns else None,
+            'max_abs': _round(np.nanmax(off_diagonal)) if np.isfinite(off_diagonal).any() else None,
+            'mean_abs': _round(np.nanmean(off_diagonal)) if np.isfinite(off_diagonal).any() else None,
+        }
+    return result
@@ -0,0 +1,179 @@
+"""
+Downloads of complete anonymized releases.
+Provides:
+1. EXPORT_FORMATS / export_path: The download formats (CSV, gzip-compressed CSV, Parquet) and
+   where the finished export of a release is kept.
+2. iter_export: The bytes of a release in a download format, one record batch at a time.
+3. tee_export: Stream the export of a release while storing it, for the first download of it.
+4. parse_range: Interpret an HTTP Range header against the size of a stored export.
+5. iter_file: Bytes of a file (or of a byte range of it) in bounded chunks.
+
+A release is read batch by batch from its memory-mapped Arrow file (see release_utils), so
+neither encoding nor serving an export needs more memory than a few batches, whatever the
+size of the dataset. Encoding is deterministic (no timestamps in the gzip header), so an
+export's bytes, and the ETag naming them, stay the same if it is ever encoded again.
+"""
+import gzip
+import os
+import threading
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from .release_utils import RELEASE_SUFFIX, release_batches, release_path
+
+# Format: (file extension, content type)
+EXPORT_FORMATS = {
+    'csv': ('.csv', 'text/csv'),
+    'csv.gz': ('.csv.gz', 'application/gzip'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+# Bytes read from a stored export per streamed chunk
+EXPORT_CHUNK_BYTES = 1024 ** 2
+# Compression level of csv.gz exports. Downloads are encoded while they are sent, so speed
+# matters more than size: level 1 (nginx's default) compresses ~5x faster than level 6 and
+# makes files only ~12% larger (Python's default, 9, is slower still)
+GZIP_LEVEL = 1
+# Rows per Parquet row group, gathered from several release batches so the file stays compact
+PARQUET_ROW_GROUP_ROWS = 100_000
+
+
+class _StreamBuffer:
+    # Write-only file object: everything written is kept until drained, while tell() keeps
+    # counting from the start of the stream (the Parquet writer records offsets with it)
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def export_path(digest: str, epsilon: float, output_format: str) -> str:
+    """Path of the stored export of a release: the release's path with the format's extension"""
+    return release_path(digest, epsilon)[:-len(RELEASE_SUFFIX)] + EXPORT_FORMATS[output_format][0]
+
+def _csv_schema(schema: pa.Schema) -> pa.Schema:
+    # The CSV writer takes plain values: categories (dictionary arrays) are written as their values
+    return pa.schema([pa.field(field.name, field.type.value_type) if pa.types.is_dictionary(field.type) else field
+                      for field in schema])
+
+def iter_export(path: str, output_format: str):
+    """
+    Yield the bytes of the release stored at `path` encoded as `output_format`, one chunk per
+    record batch of the release (one per row group for Parquet), ending with the format's trailer.
+    Appended releases are read part by part (see release_utils.release_batches).
+    """
+    buffer = _StreamBuffer()
+    schema, batches = release_batches(path)
+    if output_format == 'parquet':
+        writer = pq.ParquetWriter(buffer, schema)
+        pending, rows, written = [], 0, False
+        for batch in batches:
+            pending.append(batch)
+            rows += batch.num_rows
+            if rows >= PARQUET_ROW_GROUP_ROWS:
+                writer.write_table(pa.Table.from_batches(pending, schema=schema), row_group_size=rows)
+                pending, rows, written = [], 0, True
+                yield buffer.drain()
+        if pending or not written:
+            writer.write_table(pa.Table.from_batches(pending, schema=schema), row_group_size=max(rows, 1))
+        writer.close()
+        yield buffer.drain()
+        return
+
+    schema = _csv_schema(schema)
+    # mtime=0 keeps the gzip header (and so the bytes of the export) the same on every run
+    sink = (gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=GZIP_LEVEL, mtime=0)
+            if output_format == 'csv.gz' else buffer)
+    writer = pa_csv.CSVWriter(sink, schema, write_options=pa_csv.WriteOptions(quoting_style='needed'))
+    written = False
+    for batch in batches:
+        writer.write_batch(batch.cast(schema))
+        written = True
+        data = buffer.drain()
+        if data:
+            yield data
+    if not written:
+        writer.write_table(schema.empty_table())
+    writer.close()
+    if sink is not buffer:
+        sink.close()
+    yield buffer.drain()
+
+def tee_export(release: str, output_format: str, path: str):
+    """
+    Yield the export of the release stored at `release` (see iter_export) while writing the
+    same bytes to `path`, so the first download is sent as it is encoded and later ones
+    (Range requests included) are served from the file. The file is published only once the
+    whole export has been written; a download that stops early leaves nothing behind.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in iter_export(release, output_format):
+                f.write(chunk)
+                yield chunk
+        # Exports are deterministic, so a copy published concurrently has the same bytes
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def parse_range(header: str, size: int):
+    """
+    The byte range requested by a Range header, as (start, end) with `end` inclusive.
+
+    Returns None when the whole file should be sent: no header, a header that is not a
+    single byte range, or multiple ranges (which servers may answer with the full content).
+    Raises ValueError when the range cannot be satisfied (416).
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, dash, last = header[len('bytes='):].strip().partition('-')
+    if not dash or not (first or last) or not all(part.isdigit() for part in (first, last) if part):
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        # Not a valid range, so the header is ignored
+        return None
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise ValueError("Range starts past the end of the file")
+    return start, end
+
+def iter_file(path: str, start: int = 0, end: int = None, chunk_bytes: int = EXPORT_CHUNK_BYTES):
+    """Yield bytes start..end (inclusive; to the end of the file by default) of a file in chunks"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = (os.fstat(f.fileno()).st_size if end is None else end + 1) - start
+        while remaining > 0:
+            chunk = f.read(min(chunk_bytes, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
@@ -0,0 +1,144 @@
+"""
+Background jobs for the visualization pipeline.
+Provides:
+1. enqueue_analysis: Queue (or reuse) a compare_datasets run for an uploaded dataset.
+2. claim_next_job: Atomically move the oldest queued job to running.
+3. requeue: Put a finished or failed job back on the queue.
+4. heartbeat / requeue_stale_jobs: Renew the lease of running jobs, and requeue running jobs
+   whose lease expired (their runner died).
+5. run_job: Execute a job and store its result; called inside the `run_jobs` worker pool.
+
+The queue is the AnalysisJob table itself, so no external broker is needed.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AnalysisJob
+from .timing_utils import collect, server_timing_header
+
+# Percent complete reported when each stage starts
+STAGE_PROGRESS = {
+    'load': 10,
+    'anonymize': 30,
+    'stats': 50,
+    'charts': 70,
+}
+
+def enqueue_analysis(user, filepath: str, digest: str = '', epsilon: float = 1.0,
+                     retry: bool = False) -> AnalysisJob:
+    """
+    Return the latest job analysing this dataset for this user, creating it if needed.
+    Queued, running, finished and failed jobs for the same content hash and epsilon are all
+    reused, so reloading the page never starts the pipeline again; a failed job is only run
+    again when the user asks for it (`retry`).
+    """
+    existing = (AnalysisJob.objects
+                .filter(user=user, file_path=filepath, file_hash=digest, epsilon=epsilon)
+                .order_by('-created_at')
+                .first())
+    if existing:
+        if retry and existing.status == AnalysisJob.STATUS_FAILED:
+            requeue(existing)
+        return existing
+    return AnalysisJob.objects.create(user=user, file_path=filepath, file_hash=digest, epsilon=epsilon)
+
+def claim_next_job():
+    """Mark the oldest queued job as running and return it, or None if the queue is empty"""
+    with transaction.atomic():
+        job = (AnalysisJob.objects
+               .filter(status=AnalysisJob.STATUS_QUEUED)
+               .order_by('created_at')
+               .first())
+        if job is None:
+            return None
+        # Conditional update so two runners can never claim the same job
+        claimed = (AnalysisJob.objects
+                   .filter(pk=job.pk, status=AnalysisJob.STATUS_QUEUED)
+                   .update(status=AnalysisJob.STATUS_RUNNING, started_at=timezone.now(),
+                           heartbeat_at=timezone.now()))
+    return job if claimed else None
+
+def requeue(job: AnalysisJob) -> None:
+    """
+    Put a finished or failed job back on the queue: a retry the user asked for, or a result
+    stored before chart data was part of it
+    """
+    AnalysisJob.objects.filter(pk=job.pk).update(
+        status=AnalysisJob.STATUS_QUEUED, stage='', progress=0, result=None, error='',
+        started_at=None, heartbeat_at=None, finished_at=None)
+    job.refresh_from_db()
+
+def heartbeat(job_ids) -> None:
+    """Renew the lease of running jobs; the runner executing them calls this while it polls"""
+    AnalysisJob.objects.filter(pk__in=list(job_ids), status=AnalysisJob.STATUS_RUNNING).update(
+        heartbeat_at=timezone.now())
+
+def requeue_stale_jobs(lease_seconds: float = None) -> int:
+    """
+    Requeue running jobs whose lease has not been renewed for `lease_seconds` (default
+    JOB_LEASE_SECONDS): their runner died. Jobs of live runners keep being renewed and are
+    never taken over, so two runners never execute the same job. Returns the number requeued.
+    """
+    lease_seconds = settings.JOB_LEASE_SECONDS if lease_seconds is None else lease_seconds
+    expired = timezone.now() - timedelta(seconds=lease_seconds)
+    return AnalysisJob.objects.filter(status=AnalysisJob.STATUS_RUNNING, heartbeat_at__lt=expired).update(
+        status=AnalysisJob.STATUS_QUEUED, stage='', progress=0, started_at=None, heartbeat_at=None)
+
+def _set_stage(job_id: int, stage: str) -> None:
+    AnalysisJob.objects.filter(pk=job_id).update(stage=stage, progress=STAGE_PROGRESS.get(stage, 0))
+
+def run_job(job_id: int) -> str:
+    """Run compare_datasets for a job, recording progress and the final result. Returns the status."""
+    # Imported here so the worker processes only pay for pandas when they run a job
+    from .append_utils import incremental_charts
+    from .cache_utils import (arrow_parts, arrow_rows, dataset_files, file_hash, load_dataset, load_profile,
+                              sample_rows, use_sample)
+    from .release_utils import ensure_release, load_release
+    from .viz_utils import compare_datasets
+
+    job = AnalysisJob.objects.get(pk=job_id)
+    try:
+        digest = job.file_hash or file_hash(job.file_path)
+        # Stage timings (read, fillna, anonymize, stats, charts, ...) are stored with the result
+        with collect() as timings:
+            _set_stage(job_id, 'load')
+            paths = dataset_files(job.file_path, clean=True, digest=digest)
+            n_rows = arrow_rows(paths)
+            if use_sample(n_rows):
+                # Large datasets are compared on the same sampled rows of the data and of its
+                # release, which is stored without loading the data (see release_utils.ensure_release)
+                df = sample_rows(paths, settings.ANALYSIS_SAMPLE_ROWS, rng=0)
+                _set_stage(job_id, 'anonymize')
+                release = ensure_release(job.file_path, epsilon=job.epsilon, digest=digest)
+                anon_df = sample_rows(arrow_parts(release), settings.ANALYSIS_SAMPLE_ROWS, rng=0)
+                # Profiled from the sample, and charted from it rather than the merged summaries
+                profile, incremental = None, None
+            else:
+                df = load_dataset(job.file_path, clean=True, digest=digest)
+                profile = load_profile(job.file_path, clean=True, digest=digest, df=df)
+                _set_stage(job_id, 'anonymize')
+                # The same stored release the dashboard shows, so no fresh noise is drawn
+                anon_df = load_release(job.file_path, epsilon=job.epsilon, digest=digest,
+                                       df=df, profile=profile)
+                # Appended versions: histograms and the release profile from the merged summaries
+                incremental = incremental_charts(job.file_path, digest, job.epsilon, anon_df=anon_df)
+            result = compare_datasets(df, epsilon=job.epsilon, progress=lambda stage: _set_stage(job_id, stage),
+                                      dataset_hash=digest, profile=profile, anon_df=anon_df,
+                                      incremental=incremental)
+        if use_sample(n_rows):
+            result['sample'] = {'rows': len(df), 'of': n_rows}
+        result['timings'] = server_timing_header(timings)
+    except Exception as e:
+        AnalysisJob.objects.filter(pk=job_id).update(
+            status=AnalysisJob.STATUS_FAILED, error=f"Error reading the dataset: {str(e)}",
+            finished_at=timezone.now())
+        return AnalysisJob.STATUS_FAILED
+
+    status = AnalysisJob.STATUS_FAILED if result.get('error') else AnalysisJob.STATUS_DONE
+    AnalysisJob.objects.filter(pk=job_id).update(
+        status=status, stage='done', progress=100, result=result,
+        error=result.get('error', ''), finished_at=timezone.now())
+    return status
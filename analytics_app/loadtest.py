@@ -0,0 +1,388 @@
+"""
+Load-testing harness: concurrent virtual analysts against a locally running server.
+Provides:
+1. VirtualUser: One analyst with its own cookies (session and CSRF token) running the
+   signup -> login -> upload -> dashboard -> visualize flow, waiting for the analysis job
+   like the visualize page does.
+2. Recorder: Thread-safe latencies and failures of every request, per endpoint.
+3. RssSampler: Background sampling of the resident memory of the server's process trees.
+4. start_server: Start `manage.py runserver` and `manage.py run_jobs` for a run.
+5. summarize: Throughput, p50/p95/p99 latency and error rate per endpoint, as a JSON-serializable dict.
+6. compare_loadtests: Compare a load test report against a stored baseline and flag capacity regressions.
+
+Used by the `loadtest` management command. Only the standard library is used to talk to the
+server, so the harness measures the server and not an HTTP client library.
+"""
+import http.cookiejar
+import json
+import math
+import os
+import re
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from urllib.parse import urlencode
+
+# Steps timed separately; 'visualize:ready' is the time from opening the visualize page
+# until its analysis is done, i.e. how long the analyst waits for the results
+ENDPOINTS = ['signup', 'login', 'upload', 'dashboard', 'visualize', 'job_status', 'job_charts', 'visualize:ready']
+# Accounts created by a run share this prefix, so they can be removed afterwards
+USERNAME_PREFIX = 'loadtest-'
+# Seconds a request may take before it counts as failed
+REQUEST_TIMEOUT = 120
+
+CSRF_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+JOB_STATUS_RE = re.compile(r'data-status-url="([^"]+)"')
+CHARTS_RE = re.compile(r'data-charts-url="([^"]+)"')
+
+
+class Recorder:
+    """Latencies (seconds) and failures per endpoint, shared by all virtual users"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.flows = {'completed': 0, 'failed': 0}
+        self.failures = []
+
+    def record(self, endpoint: str, seconds: float, ok: bool, detail: str = '') -> None:
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+                # A few examples are enough to see what went wrong
+                if len(self.failures) < 20:
+                    self.failures.append(f"{endpoint}: {detail}")
+
+    def finish_flow(self, ok: bool) -> None:
+        with self.lock:
+            self.flows['completed' if ok else 'failed'] += 1
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Every request is timed on its own, so redirects are returned instead of followed
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class FlowError(Exception):
+    """A step of a virtual user's flow failed, so the rest of the flow cannot run"""
+
+
+class VirtualUser:
+    """
+    One analyst: a cookie jar plus the flow of requests a browser makes. Every request is
+    recorded in the Recorder with whether its status was the one a working server returns.
+    """
+
+    def __init__(self, base_url: str, username: str, recorder: Recorder, poll_interval: float = 1.0,
+                 job_timeout: float = 600):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = f"Lt-{secrets.token_hex(12)}"
+        self.recorder = recorder
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect())
+
+    def request(self, endpoint: str, path: str, data: bytes = None, headers: dict = None,
+                expect=(200,)) -> tuple:
+        """
+        Send one request and record its latency under `endpoint`.
+
+        Returns:
+        tuple: (status, body text, Location header). Raises FlowError if the status is not in `expect`.
+        """
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers or {})
+        if data is not None:
+            request.add_header('Referer', self.base_url + path)
+        start = time.perf_counter()
+        try:
+            try:
+                with self.opener.open(request, timeout=REQUEST_TIMEOUT) as response:
+                    status, body, location = response.status, response.read(), response.headers.get('Location', '')
+            except urllib.error.HTTPError as e:
+                # Redirects and error pages arrive as HTTPError
+                status, body, location = e.code, e.read(), e.headers.get('Location', '')
+        except (OSError, urllib.error.URLError) as e:
+            self.recorder.record(endpoint, time.perf_counter() - start, False, f"{type(e).__name__}: {e}")
+            raise FlowError(f"{endpoint}: {e}")
+        seconds = time.perf_counter() - start
+        ok = status in expect
+        self.recorder.record(endpoint, seconds, ok, f"HTTP {status}")
+        if not ok:
+            raise FlowError(f"{endpoint}: HTTP {status}")
+        return status, body.decode('utf-8', 'replace'), location
+
+    def _csrf_token(self, endpoint: str, path: str) -> str:
+        # The form page sets the CSRF cookie and carries the token
+        _, body, _ = self.request(endpoint, path)
+        match = CSRF_RE.search(body)
+        if match is None:
+            raise FlowError(f"{endpoint}: no CSRF token on {path}")
+        return match.group(1)
+
+    def post_form(self, endpoint: str, path: str, fields: dict, expect=(302,)) -> tuple:
+        token = self._csrf_token(endpoint, path)
+        data = urlencode({'csrfmiddlewaretoken': token, **fields}).encode()
+        return self.request(endpoint, path, data, {'Content-Type': 'application/x-www-form-urlencoded'}, expect)
+
+    def signup(self) -> None:
+        self.post_form('signup', '/signup/', {'username': self.username, 'password1': self.password,
+                                              'password2': self.password})
+
+    def login(self) -> None:
+        self.post_form('login', '/login/', {'username': self.username, 'password': self.password})
+
+    def upload(self, dataset_path: str) -> None:
+        token = self._csrf_token('upload', '/')
+        boundary = uuid.uuid4().hex
+        with open(dataset_path, 'rb') as f:
+            content = f.read()
+        parts = [
+            f'--{boundary}\r\nContent-Disposition: form-data; name="csrfmiddlewaretoken"\r\n\r\n{token}\r\n'.encode(),
+            (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+             f'filename="{os.path.basename(dataset_path)}"\r\nContent-Type: text/csv\r\n\r\n').encode(),
+            content,
+            f'\r\n--{boundary}--\r\n'.encode(),
+        ]
+        # A form error re-renders the page with 200, so only the redirect to the dashboard counts
+        self.request('upload', '/', b''.join(parts), {'Content-Type': f'multipart/form-data; boundary={boundary}'},
+                     expect=(302,))
+
+    def dashboard(self, epsilon: float) -> None:
+        self.request('dashboard', f"/dashboard/?epsilon={epsilon:g}")
+
+    def visualize(self, epsilon: float) -> None:
+        """Open the visualize page, poll its job until it finishes and load the charts, like the page's script"""
+        start = time.perf_counter()
+        _, body, _ = self.request('visualize', f"/visualize/?epsilon={epsilon:g}")
+        match = JOB_STATUS_RE.search(body)
+        if match is not None:
+            status_path = match.group(1)
+            deadline = time.monotonic() + self.job_timeout
+            while True:
+                _, status_body, _ = self.request('job_status', status_path)
+                status = json.loads(status_body)['status']
+                if status in ('done', 'failed'):
+                    break
+                if time.monotonic() > deadline:
+                    self.recorder.record('visualize:ready', time.perf_counter() - start, False, 'job timed out')
+                    raise FlowError(f"visualize: job still {status} after {self.job_timeout:g}s")
+                time.sleep(self.poll_interval)
+            if status == 'failed':
+                self.recorder.record('visualize:ready', time.perf_counter() - start, False, 'job failed')
+                raise FlowError("visualize: job failed")
+            # The page reloads itself once the job is done
+            _, body, _ = self.request('visualize', f"/visualize/?epsilon={epsilon:g}")
+        # Finished results fetch their chart data
+        charts = CHARTS_RE.search(body)
+        if charts is not None:
+            self.request('job_charts', charts.group(1))
+        self.recorder.record('visualize:ready', time.perf_counter() - start, True)
+
+    def run(self, dataset_path: str, epsilon: float, iterations: int = 1) -> None:
+        """The whole flow; a failed step ends this user's flow and counts it as failed"""
+        try:
+            self.signup()
+            self.login()
+            for _ in range(iterations):
+                self.upload(dataset_path)
+                self.dashboard(epsilon)
+                self.visualize(epsilon)
+        except FlowError:
+            self.recorder.finish_flow(False)
+        else:
+            self.recorder.finish_flow(True)
+
+
+def _process_tree(pid: int) -> list:
+    # pid and all of its descendants (the CPU pool and its forkserver, the job workers, ...), from /proc
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The command name may contain spaces; the parent pid follows the closing parenthesis
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+def _rss_mb(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class RssSampler(threading.Thread):
+    """
+    Samples the total resident memory of each named process tree (e.g. the web server and
+    the job runner with their worker processes) every `interval` seconds. Linux only; on other
+    systems no samples are taken.
+    """
+
+    def __init__(self, pids: dict, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.pids = pids
+        self.interval = interval
+        self.samples = {name: [] for name in pids}
+        self.totals = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while os.path.isdir('/proc') and not self.stopped.is_set():
+            total = 0.0
+            for name, pid in self.pids.items():
+                rss = sum(_rss_mb(p) for p in _process_tree(pid))
+                self.samples[name].append(rss)
+                total += rss
+            self.totals.append(total)
+            self.stopped.wait(self.interval)
+
+    def stop(self) -> dict:
+        """Stop sampling and return {'peak_mb', 'mean_mb', 'by_process': {name: peak MB}}"""
+        self.stopped.set()
+        self.join()
+        if not self.totals:
+            return None
+        return {
+            'peak_mb': round(max(self.totals), 1),
+            'mean_mb': round(sum(self.totals) / len(self.totals), 1),
+            'by_process': {name: round(max(samples), 1) for name, samples in self.samples.items() if samples},
+        }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(manage_py: str, job_workers: int = 2, port: int = None, timeout: float = 60) -> tuple:
+    """
+    Start `manage.py runserver` (without the autoreloader) and `manage.py run_jobs`, and wait
+    until the server answers.
+
+    Returns:
+    tuple: (base URL, {'web': Popen, 'jobs': Popen}). Stop them with stop_server.
+    """
+    port = port or _free_port()
+    python = [sys.executable, manage_py]
+    processes = {
+        'web': subprocess.Popen([*python, 'runserver', '--noreload', f"127.0.0.1:{port}"],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL),
+        'jobs': subprocess.Popen([*python, 'run_jobs', '--workers', str(job_workers), '--poll-interval', '0.2'],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL),
+    }
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(f"{base_url}/login/", timeout=5):
+                return base_url, processes
+        except (OSError, urllib.error.URLError):
+            if time.monotonic() > deadline or processes['web'].poll() is not None:
+                stop_server(processes)
+                raise RuntimeError(f"The server did not start on port {port}")
+            time.sleep(0.2)
+
+def stop_server(processes: dict) -> None:
+    for process in processes.values():
+        process.terminate()
+    for process in processes.values():
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def _percentile(ordered: list, q: float) -> float:
+    # Nearest-rank percentile of sorted values: the smallest value with at least q% of the values at or below it
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(recorder: Recorder, duration: float, rss: dict = None) -> dict:
+    """
+    Report of a run: per endpoint the request count, error count and rate, and mean/p50/p95/
+    p99/max latency in milliseconds; overall throughput (requests per second), error rate and
+    completed flows; and the server's memory (see RssSampler.stop).
+    """
+    endpoints = {}
+    for endpoint in ENDPOINTS:
+        latencies = sorted(recorder.latencies.get(endpoint, []))
+        if not latencies:
+            continue
+        errors = recorder.errors.get(endpoint, 0)
+        endpoints[endpoint] = {
+            'requests': len(latencies),
+            'errors': errors,
+            'error_rate': round(errors / len(latencies), 4),
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 1),
+            **{f"p{q}_ms": round(_percentile(latencies, q) * 1000, 1) for q in (50, 95, 99)},
+            'max_ms': round(latencies[-1] * 1000, 1),
+        }
+    # visualize:ready spans several requests, so it is not a request itself
+    requests = sum(e['requests'] for name, e in endpoints.items() if name != 'visualize:ready')
+    errors = sum(e['errors'] for name, e in endpoints.items() if name != 'visualize:ready')
+    return {
+        'duration_seconds': round(duration, 3),
+        'requests': requests,
+        'throughput_rps': round(requests / duration, 2) if duration else None,
+        'error_rate': round(errors / requests, 4) if requests else None,
+        'flows': dict(recorder.flows),
+        'flows_per_minute': round(recorder.flows['completed'] / duration * 60, 2) if duration else None,
+        'endpoints': endpoints,
+        'server_rss': rss,
+        'failures': list(recorder.failures),
+    }
+
+def compare_loadtests(summary: dict, baseline: dict, threshold: float = 0.2) -> list:
+    """
+    Compare a summary with a baseline summary of the same scenario.
+
+    Returns:
+    list: One dict per metric (throughput, error rate, peak RSS and each endpoint's p95) with
+          the baseline and current values and a 'regression' flag when it got worse by more
+          than `threshold` (relative), or when errors appear where the baseline had none.
+    """
+    comparisons = []
+
+    def compare(metric, current, base, higher_is_better=False):
+        if current is None or base is None:
+            return
+        if base:
+            ratio = current / base
+            worse = ratio < 1 - threshold if higher_is_better else ratio > 1 + threshold
+        else:
+            ratio = None
+            worse = current > 0 and not higher_is_better
+        comparisons.append({'metric': metric, 'baseline': base, 'current': current, 'ratio': ratio,
+                            'regression': worse})
+
+    compare('throughput_rps', summary['throughput_rps'], baseline.get('throughput_rps'), higher_is_better=True)
+    compare('error_rate', summary['error_rate'], baseline.get('error_rate'))
+    compare('server_rss_peak_mb', (summary.get('server_rss') or {}).get('peak_mb'),
+            (baseline.get('server_rss') or {}).get('peak_mb'))
+    for endpoint, stats in summary['endpoints'].items():
+        base = baseline.get('endpoints', {}).get(endpoint)
+        if base:
+            compare(f"{endpoint} p95_ms", stats['p95_ms'], base['p95_ms'])
+    return comparisons
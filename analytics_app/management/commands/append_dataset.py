@@ -0,0 +1,64 @@
+"""
+Append rows to a stored dataset.
+
+    python manage.py append_dataset <dataset hash or file> day1.csv day2.csv
+    python manage.py append_dataset data/base.csv new_rows.csv --epsilon 0.5
+
+The dataset is a stored upload or appended version (by content hash or path), or any
+CSV/Excel file, which is stored first. Each rows file becomes a new version on top of the
+previous one; only the new rows are summarized and anonymized. Prints the path and hash of
+every version so pipelines can keep appending to the latest one.
+"""
+import os
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics_app.append_utils import append_rows
+from analytics_app.release_utils import load_release
+from analytics_app.upload_utils import CHAIN_SUFFIX, UploadError, store_upload, upload_path
+
+# Extensions a stored dataset can have
+STORED_EXTENSIONS = ('.csv', '.xlsx', '.xls', CHAIN_SUFFIX)
+
+
+def _store(path: str) -> tuple:
+    with open(path, 'rb') as f:
+        return store_upload(File(f, name=os.path.basename(path)))
+
+
+class Command(BaseCommand):
+    help = "Append CSV/Excel rows to a stored dataset, updating its statistics and releases incrementally"
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', help="Content hash of a stored dataset, or a dataset file")
+        parser.add_argument('rows', nargs='+', help="Files with the rows to append, in order")
+        parser.add_argument('--epsilon', type=float, action='append',
+                            help="Also create the release for this epsilon first, so it is extended "
+                                 "too (repeatable; existing releases are always extended)")
+
+    def handle(self, *args, **options):
+        dataset = options['dataset']
+        try:
+            if os.path.isfile(dataset):
+                filepath, digest = _store(dataset)
+            else:
+                stored = [upload_path(dataset, ext) for ext in STORED_EXTENSIONS]
+                filepath = next((path for path in stored if os.path.exists(path)), None)
+                if filepath is None:
+                    raise CommandError(f"No stored dataset or file: {dataset}")
+                digest = dataset
+
+            for epsilon in options['epsilon'] or []:
+                if epsilon <= 0:
+                    raise CommandError("Epsilon must be positive")
+                load_release(filepath, epsilon=epsilon, digest=digest)
+
+            for rows in options['rows']:
+                if not os.path.isfile(rows):
+                    raise CommandError(f"Not found: {rows}")
+                rows_path, _ = _store(rows)
+                filepath, digest = append_rows(filepath, digest, rows_path)
+                self.stdout.write(f"{rows}: version {digest} ({filepath})")
+        except (UploadError, ValueError) as e:
+            raise CommandError(str(e))
@@ -0,0 +1,119 @@
+"""
+Benchmark the anonymize -> stats -> charts pipeline on synthetic data.
+
+    python manage.py benchmark --rows 10000 100000 --cols 5 50 --output results.json
+    python manage.py benchmark --baseline benchmarks/baseline.json --fail-on-regression
+    python manage.py benchmark --save-baseline benchmarks/baseline.json
+    python manage.py benchmark --startup --baseline benchmarks/startup.json --fail-on-regression
+
+Every (rows, cols, stage) combination runs in its own process, so the peak RSS reported
+is that stage's alone. Results are written as JSON and can be compared with a stored baseline.
+
+--startup measures process start-up instead: Django setup, loading the URLconf and
+`manage.py check`, each in fresh interpreters. Pandas, numpy, scipy and the other
+HEAVY_MODULES must not be imported by any of them; with --fail-on-regression, one that is
+fails the run even without a baseline.
+"""
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics_app.benchmarks import (STAGES, STARTUP_TARGETS, compare_results, environment_info, run_stage,
+                                      run_startup)
+
+
+class Command(BaseCommand):
+    help = "Time anonymize_data, generate_basic_stats and compare_datasets on synthetic data"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                            help="Row counts to benchmark (up to 10M)")
+        parser.add_argument('--cols', type=int, nargs='+', default=[5, 50],
+                            help="Column counts to benchmark (5 to 500)")
+        parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per stage; the fastest is reported")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Result file (default: benchmarks/results/<timestamp>.json)")
+        parser.add_argument('--baseline', help="Baseline result file to compare against")
+        parser.add_argument('--save-baseline', help="Also write the results to this baseline file")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="Relative slowdown or memory growth counted as a regression")
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help="Exit with an error if any regression is found")
+        parser.add_argument('--startup', action='store_true',
+                            help="Benchmark process start-up (import time) instead of the pipeline")
+
+    def handle(self, *args, **options):
+        results = self.run_startup(options) if options['startup'] else self.run_pipeline(options)
+
+        report = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'environment': environment_info(),
+            'options': {key: options[key] for key in ('rows', 'cols', 'stages', 'repeat', 'seed', 'startup')},
+            'results': results,
+        }
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', 'results', f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+        for path in filter(None, [output, options['save_baseline']]):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {path}")
+
+        if options['baseline']:
+            self.compare(results, options)
+        if options['startup'] and options['fail_on_regression']:
+            heavy = sorted({name for result in results for name in result.get('heavy_modules', ())})
+            if heavy:
+                raise CommandError(f"Start-up imports {', '.join(heavy)}; import them where they are used")
+
+    def run_startup(self, options):
+        results = []
+        for target in STARTUP_TARGETS:
+            result = run_startup(target, repeat=options['repeat'])
+            results.append(result)
+            if 'error' in result:
+                self.stdout.write(self.style.ERROR(f"{result['stage']:>16} {result['error']}"))
+            else:
+                line = (f"{result['stage']:>16} {result['seconds']:9.3f}s "
+                        f"peak RSS {result['peak_rss_mb']:9.1f} MB "
+                        f"heavy modules: {', '.join(result['heavy_modules']) or 'none'}")
+                self.stdout.write(self.style.ERROR(line) if result['heavy_modules'] else line)
+        return results
+
+    def run_pipeline(self, options):
+        results = []
+        for n_cols in options['cols']:
+            if n_cols < 5:
+                raise CommandError("Datasets need at least the 5 sample columns")
+            for n_rows in options['rows']:
+                for stage in options['stages']:
+                    result = run_stage(stage, n_rows, n_cols, seed=options['seed'], repeat=options['repeat'])
+                    results.append(result)
+                    if 'error' in result:
+                        self.stdout.write(self.style.ERROR(
+                            f"{stage:>10} {n_rows:>10} x {n_cols:<4} {result['error']}"))
+                    else:
+                        self.stdout.write(
+                            f"{stage:>10} {n_rows:>10} x {n_cols:<4} {result['seconds']:9.3f}s "
+                            f"peak RSS {result['peak_rss_mb']:9.1f} MB")
+        return results
+
+    def compare(self, results, options):
+        with open(options['baseline']) as f:
+            baseline = json.load(f)['results']
+        comparisons = compare_results(results, baseline, threshold=options['threshold'])
+        regressions = [c for c in comparisons if c['regression']]
+        for c in comparisons:
+            line = (f"{c['stage']:>10} {c['rows']:>10} x {c['cols']:<4} "
+                    f"{c['baseline_seconds']:9.3f}s -> {c['seconds']:9.3f}s "
+                    f"(time x{c['time_ratio']:.2f}, memory x{c['rss_ratio']:.2f})")
+            if c['new_modules']:
+                line += f" now imports {', '.join(c['new_modules'])}"
+            self.stdout.write(self.style.ERROR(line) if c['regression'] else line)
+        self.stdout.write(f"{len(comparisons)} compared, {len(regressions)} regression(s)")
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{len(regressions)} benchmark regression(s) above {options['threshold']:.0%}")
@@ -0,0 +1,169 @@
+"""
+Load-test a local server with concurrent virtual analysts.
+
+    python manage.py loadtest --users 20 --rows 10000 --cols 10
+    python manage.py loadtest --users 50 --ramp-up 30 --output loadtest.json
+    python manage.py loadtest --baseline benchmarks/loadtest.json --fail-on-regression
+    python manage.py loadtest --url http://127.0.0.1:8000 --server-pid 1234 --server-pid 1240
+
+Every virtual user signs up, logs in, uploads its own synthetic dataset (benchmarks.make_dataset),
+opens the dashboard and the visualize page, and waits for the analysis like the page does
+(see loadtest.VirtualUser). Without --url, `runserver` and `run_jobs` are started for the run on
+a free port and stopped afterwards. Reports throughput, p50/p95/p99 latency per endpoint, error
+rate and the server's resident memory, written as JSON so runs can be compared with a baseline.
+
+The accounts (and with them their datasets and jobs) are deleted after the run unless
+--keep-users is given; the uploads stay in the content-addressed store.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics_app.benchmarks import environment_info, make_dataset
+from analytics_app.loadtest import (ENDPOINTS, USERNAME_PREFIX, Recorder, RssSampler, VirtualUser,
+                                    compare_loadtests, start_server, stop_server, summarize)
+
+
+class Command(BaseCommand):
+    help = "Simulate concurrent analysts (signup -> login -> upload -> dashboard -> visualize) against a local server"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help="Concurrent virtual users")
+        parser.add_argument('--rows', type=int, default=10_000, help="Rows of each user's dataset")
+        parser.add_argument('--cols', type=int, default=10, help="Columns of each user's dataset (at least 5)")
+        parser.add_argument('--epsilon', type=float, default=1.0)
+        parser.add_argument('--iterations', type=int, default=1,
+                            help="Times each user uploads and analyses its dataset after logging in")
+        parser.add_argument('--ramp-up', type=float, default=0.0,
+                            help="Seconds over which the users are started (0: all at once)")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the first user's dataset")
+        parser.add_argument('--url', help="Base URL of an already running server (default: start one)")
+        parser.add_argument('--server-pid', type=int, action='append', default=[],
+                            help="With --url: process whose memory (with its children) is sampled; repeatable")
+        parser.add_argument('--job-workers', type=int, default=2, help="run_jobs workers of a started server")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between job status polls")
+        parser.add_argument('--job-timeout', type=float, default=600,
+                            help="Seconds a user waits for its analysis before giving up")
+        parser.add_argument('--keep-users', action='store_true', help="Do not delete the accounts created by the run")
+        parser.add_argument('--output', help="Result file (default: benchmarks/results/loadtest-<timestamp>.json)")
+        parser.add_argument('--baseline', help="Load test result file to compare against")
+        parser.add_argument('--save-baseline', help="Also write the results to this baseline file")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="Relative drop in throughput or growth in latency/memory counted as a regression")
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help="Exit with an error if any regression is found")
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['iterations'] < 1:
+            raise CommandError("--users and --iterations must be at least 1")
+        if options['cols'] < 5:
+            raise CommandError("Datasets need at least the 5 sample columns")
+        if options['epsilon'] <= 0:
+            raise CommandError("--epsilon must be positive")
+
+        run_prefix = f"{USERNAME_PREFIX}{time.strftime('%Y%m%d%H%M%S')}-"
+        with tempfile.TemporaryDirectory(prefix='loadtest_') as data_dir:
+            # Datasets are written before the clock starts; each user gets different data, like real analysts
+            datasets = []
+            for i in range(options['users']):
+                path = os.path.join(data_dir, f"loadtest_{i}.csv")
+                make_dataset(options['rows'], options['cols'], seed=options['seed'] + i).to_csv(path, index=False)
+                datasets.append(path)
+
+            processes = None
+            if options['url']:
+                base_url = options['url']
+                pids = {f"pid {pid}": pid for pid in options['server_pid']}
+            else:
+                try:
+                    base_url, processes = start_server(os.path.join(settings.BASE_DIR, 'manage.py'),
+                                                       job_workers=options['job_workers'])
+                except RuntimeError as e:
+                    raise CommandError(str(e))
+                pids = {name: process.pid for name, process in processes.items()}
+                self.stdout.write(f"Started runserver and run_jobs ({options['job_workers']} workers) at {base_url}")
+
+            try:
+                summary = self.run(base_url, datasets, run_prefix, pids, options)
+            finally:
+                if processes:
+                    stop_server(processes)
+                if not options['keep_users']:
+                    get_user_model().objects.filter(username__startswith=run_prefix).delete()
+
+        self.print_summary(summary)
+        report = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'environment': environment_info(),
+            'options': {key: options[key] for key in ('users', 'rows', 'cols', 'epsilon', 'iterations',
+                                                      'ramp_up', 'seed', 'job_workers', 'poll_interval')},
+            'server': options['url'] or 'runserver',
+            'summary': summary,
+        }
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', 'results', f"loadtest-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        for path in filter(None, [output, options['save_baseline']]):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {path}")
+
+        if options['baseline']:
+            self.compare(summary, options)
+
+    def run(self, base_url, datasets, run_prefix, pids, options):
+        recorder = Recorder()
+        sampler = RssSampler(pids)
+        sampler.start()
+        users = [VirtualUser(base_url, f"{run_prefix}{i}", recorder, poll_interval=options['poll_interval'],
+                             job_timeout=options['job_timeout'])
+                 for i in range(len(datasets))]
+        threads = [threading.Thread(target=user.run, args=(path, options['epsilon'], options['iterations']))
+                   for user, path in zip(users, datasets)]
+        delay = options['ramp_up'] / len(threads)
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+            time.sleep(delay)
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - start
+        return summarize(recorder, duration, sampler.stop())
+
+    def print_summary(self, summary):
+        self.stdout.write(f"{'endpoint':>16} {'requests':>9} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for endpoint in ENDPOINTS:
+            stats = summary['endpoints'].get(endpoint)
+            if stats:
+                line = (f"{endpoint:>16} {stats['requests']:>9} {stats['errors']:>7} "
+                        f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+                self.stdout.write(self.style.ERROR(line) if stats['errors'] else line)
+        flows = summary['flows']
+        self.stdout.write(f"{summary['requests']} requests in {summary['duration_seconds']:.1f}s "
+                          f"({summary['throughput_rps']} req/s), error rate {summary['error_rate']:.2%}, "
+                          f"{flows['completed']} flows completed, {flows['failed']} failed")
+        if summary['server_rss']:
+            rss = summary['server_rss']
+            by_process = ', '.join(f"{name} {peak:.1f} MB" for name, peak in rss['by_process'].items())
+            self.stdout.write(f"Server RSS peak {rss['peak_mb']:.1f} MB, mean {rss['mean_mb']:.1f} MB ({by_process})")
+        for failure in summary['failures']:
+            self.stdout.write(self.style.WARNING(f"  {failure}"))
+
+    def compare(self, summary, options):
+        with open(options['baseline']) as f:
+            baseline = json.load(f)['summary']
+        comparisons = compare_loadtests(summary, baseline, threshold=options['threshold'])
+        regressions = [c for c in comparisons if c['regression']]
+        for c in comparisons:
+            ratio = f"x{c['ratio']:.2f}" if c['ratio'] is not None else "new"
+            line = f"{c['metric']:>24} {c['baseline']:>10} -> {c['current']:>10} ({ratio})"
+            self.stdout.write(self.style.ERROR(line) if c['regression'] else line)
+        self.stdout.write(f"{len(comparisons)} compared, {len(regressions)} regression(s)")
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{len(regressions)} load test regression(s) above {options['threshold']:.0%}")
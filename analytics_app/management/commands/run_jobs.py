@@ -0,0 +1,95 @@
+"""
+Worker for queued AnalysisJobs.
+
+    python manage.py run_jobs --workers 4
+
+Polls the AnalysisJob table and runs each job in a process pool. No external broker is needed.
+While a job runs, the runner renews its lease (AnalysisJob.heartbeat_at) on every poll; any
+runner requeues running jobs whose lease expired (JOB_LEASE_SECONDS), i.e. whose runner died.
+Jobs of live runners are never taken over, so several runners can share the queue.
+"""
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from analytics_app.jobs import claim_next_job, heartbeat, requeue_stale_jobs, run_job
+from analytics_app.models import AnalysisJob
+
+
+def _run_in_worker(job_id):
+    try:
+        return run_job(job_id)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Run queued dataset analysis jobs in a local process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Number of worker processes")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to wait between polls when the queue is empty")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is empty instead of polling forever")
+
+    def _new_pool(self, workers):
+        # Forked workers inherit the configured Django setup, so they can use the ORM directly
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+
+        pool = self._new_pool(workers)
+        running = {}
+        self.stdout.write(f"Job runner started with {workers} worker(s)")
+        try:
+            while True:
+                # Keep the leases of our jobs; jobs of runners that died would otherwise stay stuck forever
+                if running:
+                    heartbeat(running)
+                stale = requeue_stale_jobs()
+                if stale:
+                    self.stdout.write(f"Re-queued {stale} abandoned job(s)")
+
+                # Collect finished jobs
+                broken = False
+                for job_id, future in list(running.items()):
+                    if future.done():
+                        del running[job_id]
+                        try:
+                            status = future.result()
+                        except Exception as e:
+                            # The worker process itself died (e.g. killed by the OOM killer)
+                            broken = broken or isinstance(e, BrokenProcessPool)
+                            AnalysisJob.objects.filter(pk=job_id).update(
+                                status=AnalysisJob.STATUS_FAILED, error=f"Worker failed: {str(e)}",
+                                finished_at=timezone.now())
+                            status = AnalysisJob.STATUS_FAILED
+                        self.stdout.write(f"Job {job_id}: {status}")
+                if broken and not running:
+                    pool.shutdown(wait=False)
+                    pool = self._new_pool(workers)
+
+                # Fill free worker slots from the queue
+                while not broken and len(running) < workers:
+                    job = claim_next_job()
+                    if job is None:
+                        break
+                    self.stdout.write(f"Job {job.pk}: started ({job.file_path})")
+                    # Never share an open database connection with a forked child
+                    connections.close_all()
+                    running[job.pk] = pool.submit(_run_in_worker, job.pk)
+
+                if options['once'] and not running:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping job runner")
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
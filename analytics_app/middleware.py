@@ -0,0 +1,49 @@
+"""
+Request middleware for the analytics app.
+Provides:
+1. ServerTimingMiddleware: Times each request and the pipeline stages it runs, and reports
+   them in a Server-Timing response header, the latency histogram and the timing log.
+"""
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .timing_utils import collect, record, server_timing_header
+
+
+class ServerTimingMiddleware:
+    # Works in both modes, so async views stay async under ASGI
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with collect() as timings:
+            response = self.get_response(request)
+        return self.finish(request, response, timings, start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with collect() as timings:
+            response = await self.get_response(request)
+        return self.finish(request, response, timings, start)
+
+    def finish(self, request, response, timings, start):
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        # Histogram entries are per view (e.g. 'view:dashboard') so slow pages stand out
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.url_name if match and match.url_name else 'unresolved'
+        record(f"view:{view_name}", duration_ms, method=request.method, path=request.path,
+               status=response.status_code)
+
+        timings.append(('total', duration_ms))
+        response['Server-Timing'] = server_timing_header(timings)
+        return response
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics_app', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Dataset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='datasets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-updated_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DatasetVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=500)),
+                ('file_path', models.CharField(max_length=500)),
+                ('file_hash', models.CharField(max_length=64)),
+                ('n_rows', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('n_columns', models.PositiveIntegerField(blank=True, null=True)),
+                ('schema', models.JSONField(blank=True, default=list)),
+                ('profile', models.JSONField(blank=True, null=True)),
+                ('artifacts', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='analytics_app.dataset')),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='analytics_app.datasetversion')),
+            ],
+            options={
+                'ordering': ['-number'],
+            },
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='current_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='analytics_app.datasetversion'),
+        ),
+        migrations.CreateModel(
+            name='Release',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('epsilon', models.FloatField()),
+                ('anonymization_version', models.PositiveSmallIntegerField()),
+                ('path', models.CharField(max_length=500)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='releases', to='analytics_app.datasetversion')),
+            ],
+            options={
+                'ordering': ['epsilon'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='datasetversion',
+            index=models.Index(fields=['file_hash'], name='analytics_a_file_ha_269218_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='datasetversion',
+            constraint=models.UniqueConstraint(fields=('dataset', 'number'), name='unique_dataset_version_number'),
+        ),
+        migrations.AddIndex(
+            model_name='dataset',
+            index=models.Index(fields=['owner', '-updated_at'], name='analytics_a_owner_i_b06e2c_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='release',
+            constraint=models.UniqueConstraint(fields=('version', 'epsilon', 'anonymization_version'), name='unique_release'),
+        ),
+    ]
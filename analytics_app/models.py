@@ -1,3 +1,119 @@
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class Dataset(models.Model):
+    """A dataset a user uploaded; appending rows to it adds versions (see registry)."""
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='datasets')
+    name = models.CharField(max_length=255)
+    # The version the dataset was last uploaded or appended as
+    current_version = models.ForeignKey('DatasetVersion', null=True, blank=True, on_delete=models.SET_NULL,
+                                        related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['owner', '-updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.owner})"
+
+
+class DatasetVersion(models.Model):
+    """
+    One content-addressed state of a dataset: an upload or an appended chain file (see
+    upload_utils). Schema, row count and a profile summary are stored once the dataset has
+    been parsed, so pages can show them without loading the data.
+    """
+    dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE, related_name='versions')
+    number = models.PositiveIntegerField()  # 1 for the upload, +1 per append
+    parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    name = models.CharField(max_length=500)  # File names, e.g. "base.csv + day1.csv"
+    file_path = models.CharField(max_length=500)
+    file_hash = models.CharField(max_length=64)
+    n_rows = models.PositiveBigIntegerField(null=True, blank=True)
+    n_columns = models.PositiveIntegerField(null=True, blank=True)
+    # [[column, dtype], ...] in column order
+    schema = models.JSONField(default=list, blank=True)
+    # Null counts, distinct counts and describe() statistics of the cleaned dataset
+    profile = models.JSONField(null=True, blank=True)
+    # Paths of the cached Arrow files and profile (see cache_utils)
+    artifacts = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-number']
+        constraints = [
+            models.UniqueConstraint(fields=['dataset', 'number'], name='unique_dataset_version_number'),
+        ]
+        indexes = [
+            models.Index(fields=['file_hash']),
+        ]
+
+    @property
+    def described(self) -> bool:
+        return self.n_rows is not None
+
+    def __str__(self):
+        return f"{self.dataset.name} v{self.number}"
+
+
+class Release(models.Model):
+    """A stored anonymized release of a dataset version (see release_utils)."""
+    version = models.ForeignKey(DatasetVersion, on_delete=models.CASCADE, related_name='releases')
+    epsilon = models.FloatField()
+    anonymization_version = models.PositiveSmallIntegerField()
+    path = models.CharField(max_length=500)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['epsilon']
+        constraints = [
+            models.UniqueConstraint(fields=['version', 'epsilon', 'anonymization_version'],
+                                    name='unique_release'),
+        ]
+
+    def __str__(self):
+        return f"{self.version} at epsilon {self.epsilon}"
+
+
+class AnalysisJob(models.Model):
+    """A queued compare_datasets run, picked up by the `run_jobs` management command."""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='analysis_jobs')
+    file_path = models.CharField(max_length=500)
+    file_hash = models.CharField(max_length=64, blank=True)
+    epsilon = models.FloatField(default=1.0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    stage = models.CharField(max_length=50, blank=True)
+    progress = models.PositiveSmallIntegerField(default=0)  # Percent complete
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Lease of a running job, renewed by its runner (see jobs.heartbeat / requeue_stale_jobs)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['user', 'file_hash', 'epsilon']),
+        ]
+
+    def __str__(self):
+        return f"Job {self.pk} ({self.status}) for {self.file_path}"
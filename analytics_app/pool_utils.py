@@ -0,0 +1,142 @@
+"""
+Bounded process pool for CPU-heavy work started from views.
+Provides:
+1. submit: Queue a function on the shared pool (used for background conversions), raising
+   PoolSaturated instead of queueing when too much work is already pending.
+2. run_in_pool: Await a function on the pool from an async view (through submit), adding the
+   stage timings recorded in the worker to the request's (Server-Timing).
+3. PoolSaturated: Raised by submit and run_in_pool; views answer it with 503 and a Retry-After header.
+4. saturated: Whether submit would currently raise PoolSaturated.
+
+Workers are started through a forkserver (forking a threaded ASGI/WSGI server is unsafe)
+and call django.setup() once, so pooled functions can use settings and the ORM. Calls run
+through timing_utils.run_collected, and the stage timings they return are added to this
+process's latency histogram, which the metrics view serves.
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from .timing_utils import extend_collected, observe_all, run_collected
+
+_pool = None
+_pool_lock = threading.Lock()
+# Calls made through submit that are running or queued (own lock: futures cancelled
+# while _pool_lock is held release their slot from inside the shutdown)
+_pending = 0
+_pending_lock = threading.Lock()
+
+class PoolSaturated(Exception):
+    """Every worker is busy and the pending queue is full"""
+
+def _init_worker(settings_module: str) -> None:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+def get_pool() -> ProcessPoolExecutor:
+    """The process pool shared by the views of this process (created on first use)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.CPU_POOL_WORKERS,
+                mp_context=multiprocessing.get_context('forkserver'),
+                initializer=_init_worker,
+                initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'privacy_analytics.settings'),),
+            )
+        return _pool
+
+def _reset_pool() -> None:
+    # A worker died (e.g. killed for memory); the executor is unusable and is recreated on next use
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def _submit(func, *args):
+    try:
+        return get_pool().submit(func, *args)
+    except BrokenProcessPool:
+        _reset_pool()
+        return get_pool().submit(func, *args)
+
+def submit(func, *args):
+    """
+    Queue func(*args) on the pool; returns a concurrent.futures.Future of its result, whose
+    `timings` attribute holds the stage timings recorded by the call once it is done.
+    Raises PoolSaturated when CPU_POOL_MAX_PENDING calls are already running or queued.
+    """
+    global _pending
+    with _pending_lock:
+        if _pending >= settings.CPU_POOL_MAX_PENDING:
+            raise PoolSaturated()
+        _pending += 1
+    try:
+        worker_future = _submit(run_collected, func, *args)
+    except BaseException:
+        _release()
+        raise
+    # The slot is held until the worker is done with the call, even if whoever waits for it
+    # stops waiting (a client that disconnects cancels the returned future, not the worker)
+    worker_future.add_done_callback(_release)
+    future = Future()
+    future.timings = []
+    future.add_done_callback(functools.partial(_cancel_queued, worker_future))
+    worker_future.add_done_callback(functools.partial(_unwrap, future))
+    return future
+
+def _cancel_queued(worker_future: Future, future: Future) -> None:
+    # Nobody waits for the result any more: drop the call if no worker has started it yet
+    if future.cancelled():
+        worker_future.cancel()
+
+def _unwrap(future: Future, worker_future: Future) -> None:
+    # Resolve submit's future with the call's own result; run_collected's timings go to the histogram
+    if worker_future.cancelled():
+        future.cancel()
+        return
+    if not future.set_running_or_notify_cancel():
+        # Cancelled while the worker ran; its timings still belong in this process's histogram
+        if worker_future.exception() is None:
+            observe_all(*worker_future.result()[1:])
+        return
+    error = worker_future.exception()
+    if error is not None:
+        future.set_exception(error)
+        return
+    result, timings, pid = worker_future.result()
+    observe_all(timings, pid)
+    future.timings = timings
+    future.set_result(result)
+
+def saturated() -> bool:
+    """Whether submit would currently raise PoolSaturated"""
+    return _pending >= settings.CPU_POOL_MAX_PENDING
+
+def _release(_future=None) -> None:
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+
+async def run_in_pool(func, *args):
+    """
+    Run func(*args) in the pool and await its result without blocking the event loop.
+    The stage timings recorded in the worker join those of the current request.
+    Raises PoolSaturated when CPU_POOL_MAX_PENDING calls are already running or queued.
+    """
+    future = submit(func, *args)
+    try:
+        result = await asyncio.wrap_future(future)
+    except BrokenProcessPool:
+        _reset_pool()
+        raise
+    extend_collected(future.timings)
+    return result
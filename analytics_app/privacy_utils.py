@@ -4,18 +4,242 @@ Provides:
 1. remove_pii: Function to remove personally identifiable information (PII) from a DataFrame.
 2. adding_noise: Function to add Gaussian noise to numerical columns for differential privacy.
 3. generalizing_categorical: Function to generalize categorical data into broader categories.
+4. collect_column_stats / anonymize_csv: Two-pass streaming variant of anonymize_data for
+   CSV files that do not fit in memory. column_stats_plan, clean_column_stats, parse_dtypes
+   and iter_anonymized_chunks are its steps, also used to store releases of large uploads
+   (see release_utils.stream_release) and to parse them into the cache (cache_utils.stream_upload).
+5. anonymization_plan / anonymize_rows: The per-column decisions of anonymize_data (noise
+   scales, rank quintiles, rare values) fixed from a profile, and applied to new rows
+   appended to an already released dataset.
 """
+import bisect
+import logging
+import os
+from dataclasses import dataclass, field
+
 import pandas as pd
 import numpy as np
 
+from .profile_utils import DatasetProfile, is_text_column, profile_dataset
+from .timing_utils import timed
+
+logger = logging.getLogger(__name__)
+
 # List of common PII columns to remove
 DIRECT_IDENTIFIERS = ['name', 'email', 'phone', 'address', 'ssn', 'dob', 'rollno', 'mobile', 'id', 'user_id', 'student_id']
 
-def group_rare_values(x, rare_list):
-    """Helper function to group rare values"""
-    return "Other" if x in rare_list else x
+# Categorical columns with more unique values than this are left untouched
+MAX_GENERALIZE_CARDINALITY = 20
+# Categorical columns with at most this many unique values get rare-value grouping
+MAX_GROUPING_CARDINALITY = 10
+# Values seen in fewer than this fraction of rows are considered rare
+RARE_VALUE_FRACTION = 0.05
+RANK_LABELS = ["Top 20%", "20-40%", "40-60%", "60-80%", "Bottom 20%"]
+
+# Bump whenever anonymize_data's output changes (noise, generalization rules, ...), so stored
+# releases (see release_utils) are rebuilt instead of served from the old algorithm
+ANONYMIZATION_VERSION = 1
+
+# Rows of Laplace noise drawn at a time, bounding the size of the noise buffer
+NOISE_BLOCK_ROWS = 65_536
+# Default number of rows read per chunk by the streaming functions. Chunks are whole
+# multiples of NOISE_BLOCK_ROWS, so they draw noise exactly as anonymize_data does
+DEFAULT_CHUNKSIZE = 2 * NOISE_BLOCK_ROWS
+
+@dataclass
+class AnonymizationPlan:
+    """What anonymize_data does to each column, as decided from a dataset profile"""
+    epsilon: float
+    n_rows: int
+    dropped: list
+    # Numeric columns: Laplace noise scale, decimals kept and whether the column is integer
+    noise: dict = field(default_factory=dict)
+    # Rank columns: value counts the quintiles are taken over (None if the profile has none)
+    ranks: dict = field(default_factory=dict)
+    # Low-cardinality columns: values kept as they are, and rare values grouped as "Other"
+    kept: dict = field(default_factory=dict)
+    rare: dict = field(default_factory=dict)
+
+def anonymization_plan(profile: DatasetProfile, epsilon: float = 1.0) -> AnonymizationPlan:
+    """Decide how anonymize_data treats each column of a profiled dataset"""
+    plan = AnonymizationPlan(epsilon=epsilon, n_rows=profile.n_rows,
+                             dropped=[col for col in profile.columns if is_direct_identifier(col)])
+    kept_cols = [col for col in profile.columns if col not in plan.dropped]
+    numeric_set = set(profile.numeric_columns)
+    for col in kept_cols:
+        if col in numeric_set:
+            col_stats = profile.numeric_stats.loc[col]
+            is_int = pd.api.types.is_integer_dtype(pd.api.types.pandas_dtype(profile.dtypes[col]))
+            # Round to reasonable precision to avoid exposing exact noise values: integer columns
+            # stay integers, float columns keep more decimals the smaller their magnitude
+            # (Laplace noise has zero mean, so the original mean predicts the noisy one)
+            plan.noise[col] = (noise_scale(col_stats['max'] - col_stats['min'], epsilon),
+                               0 if is_int else rounding_decimals(col_stats['mean']), is_int)
+        elif (is_text_column(pd.Series(dtype=profile.dtypes[col]))
+              and profile.nunique[col] <= MAX_GENERALIZE_CARDINALITY):
+            if "rank" in col.lower():
+                plan.ranks[col] = profile.value_counts.get(col)
+            elif profile.nunique[col] <= MAX_GROUPING_CARDINALITY:
+                counts = profile.value_counts[col]
+                rare = rare_values(counts, profile.n_rows)
+                plan.rare[col] = rare
+                plan.kept[col] = counts.index.difference(rare, sort=False).tolist()
+    return plan
+
+def _add_noise(df: pd.DataFrame, plan: AnonymizationPlan, rng: np.random.Generator) -> pd.DataFrame:
+    # Add noise to the plan's numeric columns all at once on one 2-D array
+    numeric_cols = [col for col in df.columns if col in plan.noise]
+    if not numeric_cols:
+        return df
+    scales = np.array([plan.noise[col][0] for col in numeric_cols], dtype='float64')
+    decimals = np.array([plan.noise[col][1] for col in numeric_cols])
+    is_int = np.array([plan.noise[col][2] for col in numeric_cols])
+
+    block = np.asfortranarray(df[numeric_cols].to_numpy(dtype='float64', na_value=np.nan, copy=True))
+    add_laplace_noise(block, scales, decimals, rng)
+
+    # Build the result on top of the noisy block without copying it, then put the
+    # remaining columns back at their original positions. Noisy integers are widened to
+    # int64, as noise can push them outside the range of a downcast input column
+    # (nullable integer columns become Int64 so missing values stay missing)
+    noisy = pd.DataFrame(block, columns=numeric_cols, index=df.index, copy=False)
+    if is_int.any():
+        noisy = noisy.astype({col: 'int64' if isinstance(df[col].dtype, np.dtype) else 'Int64'
+                              for col, col_is_int in zip(numeric_cols, is_int) if col_is_int})
+    for position, col in enumerate(df.columns):
+        if col not in noisy.columns:
+            noisy.insert(position, col, df[col])
+    return noisy
+
+def anonymize_rows(df: pd.DataFrame, plan: AnonymizationPlan, rng=None) -> pd.DataFrame:
+    """
+    Anonymize rows appended to a released dataset with the plan of that release, so the
+    new rows get the same noise scales and generalization rules as the old ones.
+    Rank columns are bucketed by where each value would fall among the released rows, and
+    values of low-cardinality columns that were not common in the release become "Other".
+    """
+    rng = np.random.default_rng(rng)
+    df = _add_noise(df.drop(columns=[col for col in plan.dropped if col in df.columns]), plan, rng)
+
+    for col, value_counts in plan.ranks.items():
+        if col not in df.columns:
+            continue
+        if value_counts is None:
+            # No value counts in the release's profile: bucket the new rows on their own
+            df[col] = pd.qcut(df[col].rank(method='first'), q=5, labels=RANK_LABELS)
+            continue
+        counts = value_counts.to_dict()
+        offsets, edges = _rank_buckets(counts, int(value_counts.sum()))
+        keys = sorted(offsets)
+        # A released value's rows span ranks offset+1 .. offset+count; new rows of that value
+        # are spread over the same span in order of appearance (as rank(method='first') spread
+        # the released ones). Unseen values take the rank where they would be inserted.
+        values = df[col].astype(object)
+        start, span = {}, {}
+        for value in values.dropna().unique():
+            if value in offsets:
+                start[value], span[value] = offsets[value], counts[value]
+            else:
+                position = bisect.bisect_left(keys, value)
+                start[value] = offsets[keys[position]] if position < len(keys) else edges[-1] - 1
+                span[value] = 1
+        occurrence = values.groupby(values).cumcount()
+        seen = values.map(values.value_counts())
+        rank = values.map(start) + 1 + (occurrence * values.map(span) // seen)
+        df[col] = pd.cut(rank, bins=edges, labels=RANK_LABELS, include_lowest=True)
+
+    for col, kept in plan.kept.items():
+        if col in df.columns:
+            kept = set(kept)
+            rare = [value for value in df[col].dropna().unique() if value not in kept]
+            if rare:
+                df[col] = replace_rare(df[col], rare)
+    return df
+
+def replace_rare(series: pd.Series, rare) -> pd.Series:
+    """Replace the rare values of a column with "Other", keeping its dtype"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Remap the category codes instead of touching every value
+        rare = set(rare)
+        categories = [cat for cat in series.cat.categories if cat not in rare]
+        if 'Other' not in categories:
+            categories.append('Other')
+        position = {cat: i for i, cat in enumerate(categories)}
+        # The trailing -1 keeps missing values (code -1) missing
+        lookup = np.array([position['Other' if cat in rare else cat] for cat in series.cat.categories] + [-1])
+        return pd.Series(pd.Categorical.from_codes(lookup[series.cat.codes.to_numpy()], categories),
+                         index=series.index, name=series.name)
+    return series.mask(series.isin(rare), "Other")
+
+def rank_buckets(series: pd.Series, value_counts: pd.Series) -> pd.Series:
+    """
+    pd.qcut(series.rank(method='first'), q=5) computed from the column's value counts
+    (used with sketch-based profiles): each row's rank is its value's offset in sorted order
+    plus its occurrence number, found by hashing instead of sorting every row.
+    """
+    offsets, edges = _rank_buckets(value_counts.to_dict(), int(value_counts.sum()))
+    occurrence = series.groupby(series, observed=True).cumcount() + 1
+    rank = series.astype(object).map(offsets) + occurrence
+    return pd.cut(rank, bins=edges, labels=RANK_LABELS, include_lowest=True)
+
+def is_direct_identifier(col) -> bool:
+    """Return True if the column name looks like a direct identifier (PII)"""
+    return any(identifier in str(col).lower() for identifier in DIRECT_IDENTIFIERS)
+
+def noise_scale(data_range: float, epsilon: float) -> float:
+    """Laplace scale for a column: higher epsilon = less noise, lower epsilon = more noise"""
+    return data_range * (0.1 / epsilon)
+
+def rounding_decimals(mean: float) -> int:
+    """Number of decimals to keep for a noisy float column with the given mean"""
+    magnitude = np.log10(abs(mean)) if mean != 0 and np.isfinite(mean) else 0
+    return max(2, int(4 - magnitude))  # More decimals for smaller numbers
+
+def add_laplace_noise(block: np.ndarray, scales: np.ndarray, decimals: np.ndarray,
+                      rng: np.random.Generator) -> np.ndarray:
+    """
+    Add Laplace noise in place to a 2-D (rows x columns) float64 block, with one noise scale
+    per column, then round every column to its own number of decimals (0 for integer columns).
+    Noise is drawn in row blocks of NOISE_BLOCK_ROWS, so no full-size noise matrix is allocated.
+    """
+    n_rows, n_cols = block.shape
+    for start in range(0, n_rows, NOISE_BLOCK_ROWS):
+        stop = min(start + NOISE_BLOCK_ROWS, n_rows)
+        noise = unit_laplace(rng, stop - start, n_cols)
+        noise *= scales
+        block[start:stop] += noise
+    return round_columns(block, decimals)
+
+def unit_laplace(rng: np.random.Generator, n_rows: int, n_cols: int) -> np.ndarray:
+    """
+    Draw a (rows x columns) block of Laplace(0, 1) noise; Laplace(0, b) noise is this times b.
+    Laplace(0, 1) is E * S with E ~ Exp(1) and S a random sign; numpy's ziggurat exponential
+    sampler makes this much faster than Generator.laplace.
+    """
+    # Drawn column-major (then transposed) to match the layout of pandas' numeric blocks
+    noise = rng.standard_exponential((n_cols, n_rows)).T
+    signs = rng.integers(0, 2, size=(n_cols, n_rows), dtype=np.int8).T
+    signs *= 2
+    signs -= 1
+    noise *= signs
+    return noise
+
+def round_columns(block: np.ndarray, decimals: np.ndarray) -> np.ndarray:
+    """Round every column of a float block in place to its own number of decimals"""
+    # Vectorized per-column round(): scale up, round to integer, scale back down
+    factors = np.power(10.0, decimals)
+    block *= factors
+    np.rint(block, out=block)
+    block /= factors
+    return block
+
+def rare_values(value_counts: pd.Series, n_rows: int) -> list:
+    """Values whose frequency is below RARE_VALUE_FRACTION of all rows"""
+    return value_counts[value_counts < n_rows * RARE_VALUE_FRACTION].index.tolist()
 
-def anonymize_data(df: pd.DataFrame, epsilon: float = 1.0) -> pd.DataFrame:
+@timed('anonymize')
+def anonymize_data(df: pd.DataFrame, epsilon: float = 1.0, profile: DatasetProfile = None,
+                   rng=None) -> pd.DataFrame:
     """
     Anonymizes the given DataFrame by removing PII, adding noise to numerical data,
     and generalizing categorical data.
@@ -25,61 +249,292 @@ def anonymize_data(df: pd.DataFrame, epsilon: float = 1.0) -> pd.DataFrame:
     epsilon (float): Privacy parameter controlling the privacy-utility tradeoff.
                      Lower values provide stronger privacy but more noise.
                      Default is 1.0, which is a moderate level of privacy.
+    profile (DatasetProfile): Profile of df (see profile_dataset); computed if not given.
+                              Column ranges, means and value counts are read from it
+                              instead of rescanning the data.
+    rng (int or np.random.Generator): Seed or generator for the noise. Pass a fixed
+                                      seed to make runs reproducible (e.g. for benchmarks).
     
     Returns:
     pd.DataFrame: The anonymized DataFrame.
     """
-    df = df.copy()
-
-    # Drop direct identifiers if present
-    for col in df.columns:
-        if any(identifier in col.lower() for identifier in DIRECT_IDENTIFIERS):
-            df.drop(col, axis=1, inplace=True)
-            print(f"Dropped column: {col} as it may contain personal identifiers")
-
-    # Add noise to numerical columns
-    numeric_cols = df.select_dtypes(include=["int64", "float64"]).columns
-    for col in numeric_cols:
-        # Calculate column-specific scale for noise based on data range and epsilon
-        data_range = df[col].max() - df[col].min()
-        # Scale noise based on data range and epsilon
-        # Higher epsilon = less noise, lower epsilon = more noise
-        scale = data_range * (0.1 / epsilon)
-        
-        # Generate noise with appropriate scale
-        noise = np.random.laplace(0, scale, size=len(df))
-        
-        # Add noise to the column
-        df[col] = df[col] + noise
-        
-        # Round to reasonable precision to avoid exposing exact noise values
-        # Number of decimal places depends on the scale of the data
-        if df[col].dtype == 'int64':
-            df[col] = df[col].round().astype('int64')
-        else:
-            # For float columns, determine appropriate rounding
-            magnitude = np.log10(abs(df[col].mean())) if df[col].mean() != 0 else 0
-            decimals = max(2, int(4 - magnitude))  # More decimals for smaller numbers
-            df[col] = df[col].round(decimals)
-
-    # Generalize categorical columns
-    for col in df.select_dtypes(include=["object", "category"]).columns:
-        # Skip columns with too many unique values (likely not good candidates for generalization)
-        if df[col].nunique() > 20:
-            continue
-            
-        if "rank" in col.lower():
+    if profile is None:
+        profile = profile_dataset(df)
+    rng = np.random.default_rng(rng)
+    # Noise scales (from each column's data range and epsilon), rounding and generalization
+    # rules are decided from the profile up front; see anonymization_plan
+    plan = anonymization_plan(profile, epsilon)
+
+    # Drop direct identifiers if present (drop returns a new frame, the input is left untouched)
+    for col in plan.dropped:
+        logger.info("Dropped column: %s as it may contain personal identifiers", col)
+    df = df.drop(columns=plan.dropped)
+
+    # Add noise to numerical columns (any width: int8 ... float64)
+    df = _add_noise(df, plan, rng)
+
+    # Generalize categorical columns (object, string or category dtype) with at most
+    # MAX_GENERALIZE_CARDINALITY unique values (the others are not good candidates)
+    for col in [col for col in df.columns if is_text_column(df[col])]:
+        if col in plan.ranks:
             # Create quantile-based categories for rank columns
-            df[col] = pd.qcut(df[col].rank(method='first'), q=5, 
-                              labels=["Top 20%", "20-40%", "40-60%", "60-80%", "Bottom 20%"])
-        elif df[col].nunique() <= 10:
+            if profile.approximate and plan.ranks[col] is not None:
+                df[col] = rank_buckets(df[col], plan.ranks[col])
+            else:
+                df[col] = pd.qcut(df[col].rank(method='first'), q=5, labels=RANK_LABELS)
+        elif plan.rare.get(col):
             # For low-cardinality categorical columns, apply k-anonymity
             # by grouping rare categories together
-            value_counts = df[col].value_counts()
-            rare_values = value_counts[value_counts < len(df) * 0.05].index.tolist()
-            
-            if rare_values:
-                # Using numpy's where is more efficient than apply with lambda
-                df[col] = np.where(df[col].isin(rare_values), "Other", df[col])
+            df[col] = replace_rare(df[col], plan.rare[col])
     
-    return df
\ No newline at end of file
+    return df
+
+def _widen_kind(kind: str, other: str) -> str:
+    # The kind of a column parsed as `kind` in some chunks and `other` in others, as
+    # read_csv would parse it at once: integers with floats are floats, anything else mixed is text
+    if kind is None or kind == other:
+        return other
+    if {kind, other} <= {'int', 'float'}:
+        return 'float'
+    return 'object'
+
+def collect_column_stats(filepath, chunksize: int = DEFAULT_CHUNKSIZE, drop_identifiers: bool = True) -> dict:
+    """
+    First pass of the streaming anonymizer: scan a CSV chunk by chunk and gather
+    the per-column summaries anonymize_data would otherwise compute on the full DataFrame.
+
+    Parameters:
+    filepath: Path (or file-like object) of the CSV to scan.
+    chunksize (int): Number of rows read per chunk.
+    drop_identifiers (bool): Leave out direct identifiers (listed as dropped); False keeps
+                             every column (see cache_utils.stream_upload).
+
+    Returns:
+    dict: {'n_rows': int, 'dropped': [...], 'columns': {col: summary}} where each summary holds
+          the column kind ('bool', 'int', 'float' or 'object'), missing values, count, sum, min,
+          max, whether float32 holds every number exactly, and the value counts (None once the
+          column has more than MAX_GENERALIZE_CARDINALITY unique values).
+    """
+    header = pd.read_csv(filepath, nrows=0).columns
+    if hasattr(filepath, 'seek'):
+        filepath.seek(0)
+    dropped = [col for col in header if drop_identifiers and is_direct_identifier(col)]
+    kept = [col for col in header if col not in dropped]
+
+    columns = {col: {'kind': None, 'nulls': 0, 'count': 0, 'sum': 0.0, 'min': None, 'max': None,
+                     'float32': True, 'counts': {}}
+               for col in kept}
+    n_rows = 0
+    for chunk in pd.read_csv(filepath, usecols=kept, chunksize=chunksize):
+        n_rows += len(chunk)
+        for col in kept:
+            stats = columns[col]
+            series = chunk[col]
+            stats['nulls'] += int(series.isna().sum())
+
+            # A column is only numeric if every chunk parsed as numeric, and only integer
+            # if no chunk needed floats (e.g. because of missing values)
+            if pd.api.types.is_bool_dtype(series):
+                kind = 'bool'
+            elif pd.api.types.is_integer_dtype(series):
+                kind = 'int'
+            elif pd.api.types.is_numeric_dtype(series):
+                kind = 'float'
+            else:
+                kind = 'object'
+            stats['kind'] = _widen_kind(stats['kind'], kind)
+
+            if kind in ('int', 'float'):
+                values = series.dropna()
+                if len(values):
+                    stats['count'] += len(values)
+                    stats['sum'] += float(values.sum())
+                    chunk_min, chunk_max = values.min(), values.max()
+                    stats['min'] = chunk_min if stats['min'] is None else min(stats['min'], chunk_min)
+                    stats['max'] = chunk_max if stats['max'] is None else max(stats['max'], chunk_max)
+                    if stats['float32']:
+                        values = values.astype('float64')
+                        stats['float32'] = bool((values.astype('float32').astype('float64') == values).all())
+
+            # Value counts are only needed for generalization, so stop tracking them as soon as
+            # the column becomes too diverse; this keeps memory independent of the file size
+            if stats['counts'] is not None:
+                # Counted before converting to text, so diverse columns are never converted
+                counts = series.value_counts()
+                if len(counts) <= MAX_GENERALIZE_CARDINALITY:
+                    for value, count in counts.items():
+                        stats['counts'][str(value)] = stats['counts'].get(str(value), 0) + int(count)
+                if len(counts) > MAX_GENERALIZE_CARDINALITY or len(stats['counts']) > MAX_GENERALIZE_CARDINALITY:
+                    stats['counts'] = None
+
+    if hasattr(filepath, 'seek'):
+        filepath.seek(0)
+    return {'n_rows': n_rows, 'dropped': dropped, 'columns': columns}
+
+def clean_column_stats(stats: dict, known: dict = None):
+    """
+    The stats of a CSV as clean_dataset leaves it, and the values it fills missing values
+    with: the mean of numeric columns and the most frequent value of the others.
+    `known` maps text columns to fill values found otherwise (see cache_utils.stream_upload),
+    used instead of the most frequent value the stats may not know.
+
+    Returns:
+    tuple: (stats, fill) with fill mapping each column that has missing values to its
+           fill value, or None when a text column has missing values but too many distinct
+           values for its most frequent one to be known from collect_column_stats.
+    """
+    known = known or {}
+    columns, fill = {}, {}
+    for col, col_stats in stats['columns'].items():
+        col_stats = dict(col_stats)
+        columns[col] = col_stats
+        nulls = col_stats['nulls']
+        if not nulls:
+            continue
+        if col_stats['kind'] in ('int', 'float'):
+            # Filling with the mean leaves the mean, minimum and maximum unchanged
+            mean = col_stats['sum'] / col_stats['count'] if col_stats['count'] else np.nan
+            fill[col] = mean
+            if col_stats['count']:
+                col_stats['count'] += nulls
+                col_stats['sum'] += nulls * mean
+        else:
+            counts = col_stats['counts']
+            if col in known:
+                fill[col] = known[col]
+            elif counts is None:
+                return None
+            else:
+                # Series.mode() sorts tied values, so the smallest of them is used
+                top = max(counts.values(), default=0)
+                fill[col] = min((value for value, count in counts.items() if count == top), default="Unknown")
+            if counts is not None:
+                col_stats['counts'] = {**counts, fill[col]: counts.get(fill[col], 0) + nulls}
+        col_stats['nulls'] = 0
+    return {**stats, 'columns': columns}, fill
+
+def parse_dtypes(stats: dict) -> dict:
+    """read_csv dtypes that parse every chunk of a CSV as the whole column would be parsed"""
+    return {col: str if col_stats['kind'] == 'object' else 'float64'
+            for col, col_stats in stats['columns'].items() if col_stats['kind'] in ('object', 'float')}
+
+def column_stats_plan(stats: dict, epsilon: float = 1.0) -> AnonymizationPlan:
+    """The anonymization_plan of a CSV summarized by collect_column_stats"""
+    n_rows = stats['n_rows']
+    plan = AnonymizationPlan(epsilon=epsilon, n_rows=n_rows, dropped=list(stats['dropped']))
+    for col, col_stats in stats['columns'].items():
+        if col_stats['kind'] in ('int', 'float'):
+            count = col_stats['count']
+            data_range = col_stats['max'] - col_stats['min'] if count else np.nan
+            mean = col_stats['sum'] / count if count else np.nan
+            is_int = col_stats['kind'] == 'int'
+            plan.noise[col] = (noise_scale(data_range, epsilon), 0 if is_int else rounding_decimals(mean), is_int)
+        elif col_stats['kind'] == 'object' and col_stats['counts'] is not None:
+            counts = pd.Series(col_stats['counts'], dtype='int64')
+            if "rank" in col.lower():
+                plan.ranks[col] = counts
+            elif len(counts) <= MAX_GROUPING_CARDINALITY:
+                rare = rare_values(counts, n_rows)
+                plan.rare[col] = rare
+                plan.kept[col] = counts.index.difference(rare, sort=False).tolist()
+    return plan
+
+def _rank_buckets(counts: dict, n_values: int) -> tuple:
+    """
+    Precompute what pd.qcut(col.rank(method='first'), q=5) needs so it can be applied per chunk:
+    the rank offset of every distinct value and the bucket edges over ranks 1..n_values.
+    """
+    offsets, running = {}, 0
+    for value in sorted(counts):
+        offsets[value] = running
+        running += counts[value]
+    # Linear-interpolated quantiles of 1..n, as computed by qcut, in closed form
+    edges = [1 + q * (n_values - 1) for q in np.linspace(0, 1, len(RANK_LABELS) + 1)]
+    return offsets, edges
+
+def iter_anonymized_chunks(filepath, plan: AnonymizationPlan, stats: dict,
+                           chunksize: int = DEFAULT_CHUNKSIZE, rng=None, fill: dict = None):
+    """
+    Second pass of the streaming anonymizer: read a CSV chunk by chunk and yield each chunk
+    anonymized by `plan` exactly as anonymize_data would anonymize it as part of the whole
+    file. The chunk size is rounded up to a multiple of NOISE_BLOCK_ROWS, so for the same
+    seed every value gets the same noise as in anonymize_data.
+
+    Parameters:
+    filepath: Path (or file-like object) of the CSV.
+    plan (AnonymizationPlan): From column_stats_plan.
+    stats (dict): From collect_column_stats (or clean_column_stats).
+    chunksize (int): Number of rows processed at a time (at least NOISE_BLOCK_ROWS).
+    rng (int or np.random.Generator): Seed or generator for the noise.
+    fill (dict): Fill values for missing values (see clean_column_stats), applied first.
+    """
+    rng = np.random.default_rng(rng)
+    chunksize = max(1, -(-chunksize // NOISE_BLOCK_ROWS)) * NOISE_BLOCK_ROWS
+    columns = stats['columns']
+    dtypes = parse_dtypes(stats)
+    ranks = {col: _rank_buckets(counts.to_dict(), int(counts.sum())) for col, counts in plan.ranks.items()}
+    seen = {col: {} for col in ranks}
+
+    if hasattr(filepath, 'seek'):
+        filepath.seek(0)
+    for chunk in pd.read_csv(filepath, usecols=list(columns), chunksize=chunksize, dtype=dtypes):
+        if fill:
+            chunk = chunk.fillna(fill)
+        # Same Laplace mechanism as anonymize_data, applied to this chunk only
+        chunk = _add_noise(chunk, plan, rng)
+
+        for col, (offsets, edges) in ranks.items():
+            # Reproduce rank(method='first') across chunks: a value's global rank is its
+            # offset in sorted order plus how many times it has been seen so far
+            values = chunk[col]
+            occurrence = values.groupby(values).cumcount() + 1
+            seen_before = values.map(seen[col]).fillna(0)
+            rank = values.map(offsets) + seen_before + occurrence
+            chunk[col] = pd.cut(rank, bins=edges, labels=RANK_LABELS, include_lowest=True)
+            for value, count in values.value_counts().items():
+                seen[col][value] = seen[col].get(value, 0) + int(count)
+
+        for col, rare in plan.rare.items():
+            if rare:
+                chunk[col] = replace_rare(chunk[col], rare)
+        yield chunk
+
+@timed('anonymize_csv')
+def anonymize_csv(filepath, output, epsilon: float = 1.0, chunksize: int = DEFAULT_CHUNKSIZE,
+                  stats: dict = None, rng=None) -> dict:
+    """
+    Streaming counterpart of anonymize_data for CSVs that are too large to load at once.
+    The file is read twice: collect_column_stats gathers column ranges and value counts,
+    then every chunk gets the same noise scale and generalization rules and is appended
+    to the output. Peak memory depends on chunksize, not on the size of the file, and the
+    output is what anonymize_data returns for the whole file with the same seed.
+
+    Parameters:
+    filepath: Path (or file-like object) of the CSV to anonymize.
+    output: Path (or writable text file-like object) for the anonymized CSV.
+    epsilon (float): Privacy parameter, see anonymize_data.
+    chunksize (int): Number of rows processed at a time (see iter_anonymized_chunks).
+    stats (dict): Result of collect_column_stats, if the first pass was already done.
+    rng (int or np.random.Generator): Seed or generator for the noise.
+
+    Returns:
+    dict: The column stats used, including the list of dropped PII columns.
+    """
+    if stats is None:
+        stats = collect_column_stats(filepath, chunksize=chunksize)
+    for col in stats['dropped']:
+        logger.info("Dropped column: %s as it may contain personal identifiers", col)
+    plan = column_stats_plan(stats, epsilon)
+
+    close_output = False
+    if isinstance(output, (str, bytes, os.PathLike)):
+        output = open(output, 'w', newline='')
+        close_output = True
+    try:
+        for i, chunk in enumerate(iter_anonymized_chunks(filepath, plan, stats, chunksize=chunksize, rng=rng)):
+            chunk.to_csv(output, header=(i == 0), index=False)
+    finally:
+        if close_output:
+            output.close()
+
+    return stats
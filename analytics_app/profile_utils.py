@@ -0,0 +1,120 @@
+"""
+Dataset profiling shared by anonymization, statistics and plotting.
+Provides:
+1. DatasetProfile: Per-column summaries of a DataFrame (describe() statistics, null counts,
+   cardinality and value counts) computed once and reused by every consumer.
+2. profile_dataset: Build a DatasetProfile with vectorized reductions over the whole numeric block.
+"""
+import warnings
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from .timing_utils import timed
+
+# Value counts are only kept for columns with at most this many distinct values,
+# which covers every generalization rule in anonymize_data
+MAX_TRACKED_VALUES = 20
+
+# Rows of the describe()-style statistics table, in describe() order
+STAT_ROWS = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+
+def is_text_column(series: pd.Series) -> bool:
+    """True for object, string and categorical columns (the ones chart_utils tries to coerce to numbers)"""
+    return (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+            or isinstance(series.dtype, pd.CategoricalDtype))
+
+def is_numeric_column(series: pd.Series) -> bool:
+    """True for numeric columns of any width (int8 ... float64, nullable too), excluding booleans"""
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+@dataclass
+class DatasetProfile:
+    n_rows: int
+    columns: list
+    dtypes: dict
+    null_counts: dict
+    # describe().transpose() of the numeric columns
+    numeric_stats: pd.DataFrame
+    # Distinct values of each non-numeric column
+    nunique: dict = field(default_factory=dict)
+    # Value counts of non-numeric columns with at most MAX_TRACKED_VALUES distinct values
+    value_counts: dict = field(default_factory=dict)
+    # For text columns: how many values pd.to_numeric can parse
+    numeric_like: dict = field(default_factory=dict)
+    # True when built from sketches (see sketch_utils); error_bounds then holds the
+    # quantile rank error, the relative error of nunique and per-column count errors
+    approximate: bool = False
+    error_bounds: dict = field(default_factory=dict)
+
+    @property
+    def numeric_columns(self) -> list:
+        return list(self.numeric_stats.index)
+
+    def coerced_null_count(self, col) -> int:
+        """Missing values of a column once text columns are coerced to numbers"""
+        if col in self.numeric_like:
+            return self.n_rows - self.numeric_like[col]
+        return self.null_counts[col]
+
+def _numeric_stats(block: np.ndarray, columns: list) -> pd.DataFrame:
+    if not columns:
+        return pd.DataFrame(columns=STAT_ROWS, dtype='float64')
+    # All-NaN columns legitimately produce NaN statistics; silence numpy's warnings about them
+    with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)
+        count = (~np.isnan(block)).sum(axis=0)
+        quartiles = np.nanpercentile(block, [25, 50, 75], axis=0)
+        stats = np.vstack([
+            count,
+            np.nanmean(block, axis=0),
+            np.nanstd(block, axis=0, ddof=1),
+            np.nanmin(block, axis=0),
+            quartiles,
+            np.nanmax(block, axis=0),
+        ])
+    return pd.DataFrame(stats.T, index=columns, columns=STAT_ROWS)
+
+@timed('profile')
+def profile_dataset(df: pd.DataFrame) -> DatasetProfile:
+    """
+    Profile a DataFrame in a constant number of passes: one vectorized reduction over the
+    numeric block and one value_counts per non-numeric column. Datasets too large to load
+    are sketched batch by batch instead (see cache_utils.load_profile and sketch_utils).
+
+    Parameters:
+    df (pd.DataFrame): The dataset to profile.
+
+    Returns:
+    DatasetProfile: Summaries consumed by anonymize_data, generate_basic_stats and chart_utils.
+    """
+    numeric_cols = [col for col in df.columns if is_numeric_column(df[col])]
+    block = df[numeric_cols].to_numpy(dtype='float64', na_value=np.nan) if numeric_cols else np.empty((len(df), 0))
+
+    profile = DatasetProfile(
+        n_rows=len(df),
+        columns=list(df.columns),
+        dtypes={col: str(dtype) for col, dtype in df.dtypes.items()},
+        null_counts=df.isna().sum().astype(int).to_dict(),
+        numeric_stats=_numeric_stats(block, numeric_cols),
+    )
+
+    for col in df.columns:
+        if col in numeric_cols:
+            continue
+        # value_counts gives the cardinality too, so nunique needs no separate pass
+        counts = df[col].value_counts()
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            # Categoricals also count categories with no rows left; drop them
+            counts = counts[counts > 0]
+            if is_text_column(df[col]):
+                # Parse each category once instead of every row
+                parsed = pd.to_numeric(pd.Series(counts.index.astype(object)), errors='coerce')
+                profile.numeric_like[col] = int(counts[parsed.notna().to_numpy()].sum())
+        elif is_text_column(df[col]):
+            profile.numeric_like[col] = int(pd.to_numeric(df[col], errors='coerce').notna().sum())
+        profile.nunique[col] = len(counts)
+        if len(counts) <= MAX_TRACKED_VALUES:
+            profile.value_counts[col] = counts
+    return profile
@@ -0,0 +1,103 @@
+"""
+Dataset registry: the database records behind a user's datasets.
+Provides:
+1. register_upload: The DatasetVersion of an upload, creating the Dataset on first upload
+   (uploading the same content again reopens the existing dataset).
+2. register_append: Record an appended version of a dataset and make it the current one.
+3. version_metadata: Schema, row count, profile summary and cached artifact paths of a
+   parsed dataset, from its cached profile. Runs inside pool workers.
+4. save_metadata: Store version_metadata on a version.
+5. record_release: Record the stored release of a version for an epsilon.
+
+Views keep only the id of the current DatasetVersion in the session and resolve the
+dataset's path, hash and metadata from it with one indexed query.
+"""
+import math
+
+from django.db import transaction
+from django.db.models import Max
+
+from .models import Dataset, DatasetVersion, Release
+
+def register_upload(user, filepath: str, digest: str, name: str) -> DatasetVersion:
+    """
+    Return the user's version with this content hash, or create a new dataset for the upload.
+    Reopening an existing version makes it the current version of its dataset again.
+    """
+    version = (DatasetVersion.objects.select_related('dataset')
+               .filter(dataset__owner=user, file_hash=digest).first())
+    if version is not None:
+        dataset = version.dataset
+        dataset.current_version = version
+        dataset.save(update_fields=['current_version', 'updated_at'])
+        return version
+    with transaction.atomic():
+        dataset = Dataset.objects.create(owner=user, name=name)
+        version = DatasetVersion.objects.create(dataset=dataset, number=1, name=name,
+                                                file_path=filepath, file_hash=digest)
+        dataset.current_version = version
+        dataset.save(update_fields=['current_version', 'updated_at'])
+    return version
+
+def register_append(parent: DatasetVersion, filepath: str, digest: str, rows_name: str) -> DatasetVersion:
+    """Record the version made by appending `rows_name` to `parent` (reused if it exists) as current"""
+    dataset = parent.dataset
+    with transaction.atomic():
+        version = dataset.versions.filter(file_hash=digest).first()
+        if version is None:
+            number = (dataset.versions.aggregate(last=Max('number'))['last'] or 0) + 1
+            version = DatasetVersion.objects.create(dataset=dataset, number=number, parent=parent,
+                                                    name=f"{parent.name} + {rows_name}",
+                                                    file_path=filepath, file_hash=digest)
+        dataset.current_version = version
+        dataset.save(update_fields=['current_version', 'updated_at'])
+    version.dataset = dataset
+    return version
+
+def _json_number(value):
+    # NaN and infinity are not valid JSON
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+def version_metadata(filepath: str, digest: str) -> dict:
+    """
+    Metadata of a dataset version from the cached profile of its cleaned data (profiled
+    first if it is not cached yet).
+
+    Returns:
+    dict: Field values for save_metadata: n_rows, n_columns, schema, profile and artifacts.
+    """
+    # Imported here so the web process does not load pandas just to query the registry
+    from .cache_utils import PROFILE_SUFFIX, cache_path, load_profile
+    profile = load_profile(filepath, clean=True, digest=digest)
+    return {
+        'n_rows': int(profile.n_rows),
+        'n_columns': len(profile.columns),
+        'schema': [[str(col), str(profile.dtypes[col])] for col in profile.columns],
+        'profile': {
+            'approximate': bool(profile.approximate),
+            'null_counts': {str(col): int(count) for col, count in profile.null_counts.items()},
+            'nunique': {str(col): int(count) for col, count in profile.nunique.items()},
+            'numeric_stats': {str(col): {stat: _json_number(value) for stat, value in row.items()}
+                              for col, row in profile.numeric_stats.iterrows()},
+        },
+        'artifacts': {
+            'raw': cache_path(digest, 'raw'),
+            'clean': cache_path(digest, 'clean'),
+            'profile': cache_path(digest, 'clean', PROFILE_SUFFIX),
+        },
+    }
+
+def save_metadata(version: DatasetVersion, metadata: dict) -> None:
+    for field, value in metadata.items():
+        setattr(version, field, value)
+    version.save(update_fields=list(metadata))
+
+def record_release(version: DatasetVersion, epsilon: float) -> Release:
+    """Register the stored release of a version (see release_utils.load_release) once"""
+    from .privacy_utils import ANONYMIZATION_VERSION
+    from .release_utils import release_path
+    release, _ = Release.objects.get_or_create(
+        version=version, epsilon=epsilon, anonymization_version=ANONYMIZATION_VERSION,
+        defaults={'path': release_path(version.file_hash, epsilon)})
+    return release
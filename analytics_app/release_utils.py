@@ -0,0 +1,270 @@
+"""
+Store of anonymized releases.
+Provides:
+1. release_path: Location of the release of a dataset for an epsilon and anonymization version.
+2. load_release: Anonymize a dataset once per (dataset hash, epsilon, ANONYMIZATION_VERSION)
+   and serve the stored noisy output to every later caller.
+3. ensure_release / preview_release: Make sure a release is stored (returning its path), and
+   read only the first rows of a stored release.
+   release_batches: The record batches of a stored release, across the parts of appended ones.
+4. stream_release: Store the release of a large CSV upload in two passes over the file
+   (see privacy_utils.anonymize_csv) instead of loading the dataset into memory.
+5. load_plan / stored_epsilons: The anonymization plan a release was made with, and the
+   epsilons a dataset has releases for; appends extend those releases (see append_utils).
+6. check_epsilon: Refuse a new release beyond settings.MAX_EPSILON, or at an epsilon outside
+   settings.RELEASE_EPSILONS once the dataset has MAX_OTHER_RELEASES of those.
+
+Re-running anonymize_data draws fresh noise, and every extra draw of the same data spends
+more of the privacy budget (averaging releases cancels the noise out). Releases are therefore
+written exactly once and are not subject to the dataset cache's LRU eviction. A release
+extended by an append stores only the new rows and names the release they follow (see
+cache_utils.arrow_parts), so earlier rows are never rewritten.
+"""
+import os
+import pickle
+import re
+
+import pandas as pd
+import pyarrow as pa
+from django.conf import settings
+
+from .cache_utils import (arrow_parts, concat_frames, file_hash, load_dataset, load_profile, read_parts, stored_fill,
+                          write_arrow)
+from .privacy_utils import (ANONYMIZATION_VERSION, AnonymizationPlan, anonymization_plan, anonymize_data,
+                            clean_column_stats, collect_column_stats, column_stats_plan, iter_anonymized_chunks)
+from .timing_utils import timed
+
+RELEASE_SUFFIX = '.arrow'
+PLAN_SUFFIX = '.plan'
+# Rows per record batch in a release file; preview_release only reads the batches it needs
+RELEASE_BATCH_ROWS = 10_000
+
+def release_dir() -> str:
+    """Directory holding the stored releases (created on demand)"""
+    os.makedirs(settings.RELEASE_STORE_DIR, exist_ok=True)
+    return settings.RELEASE_STORE_DIR
+
+def release_path(digest: str, epsilon: float) -> str:
+    """Path of the release of a dataset for an epsilon under the current ANONYMIZATION_VERSION"""
+    return os.path.join(release_dir(), f"{digest}.e{float(epsilon)!r}.v{ANONYMIZATION_VERSION}{RELEASE_SUFFIX}")
+
+def stored_epsilons(digest: str) -> list:
+    """Epsilons for which a dataset has a release under the current ANONYMIZATION_VERSION"""
+    pattern = re.compile(rf"{re.escape(digest)}\.e(.+)\.v{ANONYMIZATION_VERSION}{re.escape(RELEASE_SUFFIX)}$")
+    matches = (pattern.match(name) for name in os.listdir(release_dir()))
+    return sorted(float(match.group(1)) for match in matches if match)
+
+def check_epsilon(digest: str, epsilon: float) -> None:
+    """
+    Raise ValueError if a dataset may not get a new release at `epsilon`. Every release is a
+    separate noise draw kept for good, so besides settings.RELEASE_EPSILONS a dataset only gets
+    a few (settings.MAX_OTHER_RELEASES), and none above settings.MAX_EPSILON.
+    """
+    if not 0 < epsilon <= settings.MAX_EPSILON:
+        raise ValueError(f"Epsilon must be a positive number up to {settings.MAX_EPSILON:g}")
+    if epsilon in settings.RELEASE_EPSILONS:
+        return
+    others = [e for e in stored_epsilons(digest) if e not in settings.RELEASE_EPSILONS]
+    if len(others) >= settings.MAX_OTHER_RELEASES:
+        raise ValueError(f"This dataset already has releases at epsilons {', '.join(f'{e:g}' for e in others)}; "
+                         f"use one of those or of {', '.join(f'{e:g}' for e in settings.RELEASE_EPSILONS)}")
+
+def _publish_once(tmp_path: str, path: str) -> bool:
+    # Hard-link the finished file into place: this fails if another process published the
+    # release first, in which case its copy wins and ours is discarded (one noise draw only)
+    try:
+        os.link(tmp_path, path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(tmp_path)
+
+@timed('release')
+def load_release(filepath, epsilon: float = 1.0, digest: str = None, df: pd.DataFrame = None,
+                 profile=None) -> pd.DataFrame:
+    """
+    Return the anonymized release of an upload, creating and storing it on first use.
+    The release is built from the cleaned dataset (see cache_utils.clean_dataset), which is
+    what both the dashboard and the comparison page show.
+
+    Parameters:
+    filepath (str): Path of the raw upload.
+    epsilon (float): Privacy parameter of the release.
+    digest (str): Content hash of the upload, if already known.
+    df (pd.DataFrame): The cleaned dataset, if already loaded.
+    profile (DatasetProfile): Its profile, if already loaded.
+
+    Returns:
+    pd.DataFrame: The anonymized dataset (memory-mapped from the store when it already exists).
+    """
+    digest = digest or file_hash(filepath)
+    path = release_path(digest, epsilon)
+    if not os.path.exists(path):
+        _create_release(filepath, epsilon, digest, path, df=df, profile=profile)
+    return read_parts(arrow_parts(path))
+
+def _create_release(filepath, epsilon: float, digest: str, path: str, df: pd.DataFrame = None,
+                    profile=None) -> None:
+    check_epsilon(digest, epsilon)
+    # Large CSVs are streamed unless the caller already holds the dataset in memory
+    if df is None and use_streaming_release(filepath) and stream_release(filepath, epsilon, path,
+                                                                         fill=stored_fill(digest)):
+        return
+    if df is None:
+        df = load_dataset(filepath, clean=True, digest=digest)
+    if profile is None:
+        profile = load_profile(filepath, clean=True, digest=digest, df=df)
+    anon_df = anonymize_data(df, epsilon=epsilon, profile=profile)
+    publish_release(anon_df, path, anonymization_plan(profile, epsilon))
+
+def publish_release(anon_df: pd.DataFrame, path: str, plan: AnonymizationPlan, appended_to: str = None) -> bool:
+    """
+    Store a release and the plan it was made with. Returns False (and stores nothing) if
+    another process published the release first. `appended_to` is the stored release that
+    `anon_df` holds the appended rows of.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write_arrow(anon_df, tmp_path, appended_to=appended_to, chunksize=RELEASE_BATCH_ROWS)
+    return _publish_with_plan(tmp_path, path, plan)
+
+def _publish_with_plan(tmp_path: str, path: str, plan: AnonymizationPlan) -> bool:
+    if not _publish_once(tmp_path, path):
+        return False
+    if not os.path.exists(path + PLAN_SUFFIX):
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(plan, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path + PLAN_SUFFIX)
+    return True
+
+def load_plan(filepath, epsilon: float = 1.0, digest: str = None, profile=None) -> AnonymizationPlan:
+    """
+    The anonymization plan (noise scales, generalization rules) of a dataset's release.
+    Releases stored before plans were kept get the plan anonymize_data derives from the profile.
+    """
+    digest = digest or file_hash(filepath)
+    path = release_path(digest, epsilon) + PLAN_SUFFIX
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    if profile is None:
+        profile = load_profile(filepath, clean=True, digest=digest)
+    return anonymization_plan(profile, epsilon)
+
+def use_streaming_release(filepath) -> bool:
+    """Whether a release of this upload is streamed (CSVs of settings.STREAMING_RELEASE_MIN_BYTES or more)"""
+    min_bytes = settings.STREAMING_RELEASE_MIN_BYTES
+    return (min_bytes is not None and str(filepath).lower().endswith('.csv')
+            and os.path.getsize(filepath) >= min_bytes)
+
+@timed('stream_release')
+def stream_release(filepath, epsilon: float, path: str, fill: dict = None) -> bool:
+    """
+    Store the release of a CSV upload at `path` without loading it: one pass gathers
+    the column stats (and the fill values of clean_dataset), the second anonymizes the file
+    chunk by chunk into the release's record batches. `fill` holds the fill values the
+    cached cleaned data was made with, if it was parsed batch by batch (cache_utils.stored_fill).
+
+    Returns:
+    bool: False (nothing is stored) when the upload cannot be streamed: it is empty, or has
+          a text column with missing values and too many distinct values to know the value
+          clean_dataset fills in (and no `fill` for it).
+    """
+    chunksize = settings.STREAMING_CHUNK_ROWS
+    cleaned = clean_column_stats(collect_column_stats(filepath, chunksize=chunksize), known=fill)
+    if cleaned is None or cleaned[0]['n_rows'] == 0:
+        return False
+    stats, fill = cleaned
+    plan = column_stats_plan(stats, epsilon)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    writer, schema = None, None
+    try:
+        for chunk in iter_anonymized_chunks(filepath, plan, stats, chunksize=chunksize, fill=fill):
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                writer = pa.ipc.new_file(tmp_path, schema)
+            writer.write_table(table, max_chunksize=RELEASE_BATCH_ROWS)
+        writer.close()
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    # Another process may have published the release first; its copy is kept
+    _publish_with_plan(tmp_path, path, plan)
+    return True
+
+def ensure_release(filepath, epsilon: float = 1.0, digest: str = None) -> str:
+    """
+    Path of the stored release of a dataset, created first if it does not exist yet.
+    Large CSV uploads are streamed (see stream_release) rather than loaded.
+    """
+    digest = digest or file_hash(filepath)
+    path = release_path(digest, epsilon)
+    if not os.path.exists(path):
+        _create_release(filepath, epsilon, digest, path)
+    return path
+
+def preview_release(filepath, epsilon: float = 1.0, n_rows: int = 10, digest: str = None) -> pd.DataFrame:
+    """
+    Return the first n_rows of a release, reading only the record batches that hold them.
+    The release is created first if it does not exist yet.
+    """
+    path = ensure_release(filepath, epsilon=epsilon, digest=digest)
+    frames, rows = [], 0
+    # The first rows are in the first part unless it holds fewer than n_rows
+    for part in arrow_parts(path):
+        if frames and rows >= n_rows:
+            break
+        with pa.memory_map(part) as source:
+            reader = pa.ipc.open_file(source)
+            batches, part_rows = [], 0
+            for i in range(reader.num_record_batches):
+                if rows + part_rows >= n_rows:
+                    break
+                batch = reader.get_batch(i)
+                batches.append(batch)
+                part_rows += batch.num_rows
+            table = pa.Table.from_batches(batches, schema=reader.schema)
+            frames.append(table.slice(0, n_rows - rows).to_pandas())
+        rows += len(frames[-1])
+    return frames[0] if len(frames) == 1 else concat_frames(*frames)
+
+def _common_schema(schemas: list) -> pa.Schema:
+    # The parts of an appended release were typed separately: categories are decoded to their
+    # values and each column takes a type all parts cast to (text if one part holds numbers
+    # and another text)
+    decoded = [pa.schema([pa.field(field.name, field.type.value_type) if pa.types.is_dictionary(field.type)
+                          else field for field in schema]) for schema in schemas]
+    fields = []
+    for name in decoded[0].names:
+        try:
+            fields.append(pa.unify_schemas([pa.schema([schema.field(name)]) for schema in decoded],
+                                           promote_options='permissive').field(0))
+        except (pa.ArrowTypeError, pa.ArrowInvalid):
+            fields.append(pa.field(name, pa.large_string()))
+    return pa.schema(fields)
+
+def _iter_part_batches(parts: list, schema: pa.Schema):
+    for part in parts:
+        with pa.memory_map(part) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                yield batch if len(parts) == 1 else batch.select(schema.names).cast(schema)
+
+def release_batches(path: str) -> tuple:
+    """
+    (schema, iterator of record batches) of the stored release at `path`. The batches of an
+    appended release come from all its parts, oldest first, cast to one schema.
+    """
+    parts = arrow_parts(path)
+    schemas = []
+    for part in parts:
+        with pa.memory_map(part) as source:
+            schemas.append(pa.ipc.open_file(source).schema)
+    schema = schemas[0] if len(parts) == 1 else _common_schema(schemas)
+    return schema, _iter_part_batches(parts, schema)
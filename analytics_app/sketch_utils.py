@@ -0,0 +1,482 @@
+"""
+Mergeable sketches for approximate statistics on very large datasets.
+Provides:
+1. HyperLogLog: Distinct-value counts in a few KB, within about 1% relative error.
+2. KLLSketch: Quantiles and ranks in O(k log n) memory, within a bounded rank error.
+3. FrequencySketch: Count-Min table plus Misra-Gries heavy hitters, for value counts and
+   rare-category detection.
+4. ColumnSketch / sketch_chunks: One streaming pass over a dataset, chunk by chunk (e.g. the
+   record batches of its cached Arrow file), building every sketch a profile needs.
+5. sketch_profile: A DatasetProfile built from the sketches, with its error bounds.
+6. GridHistogram: Counts on a fixed number of equal-width bins that widen as the data grows,
+   plus exact moments; enough to redraw a histogram and KDE without the data.
+
+Every sketch has a merge() method, so chunks (or processes) can be sketched independently
+and combined afterwards.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from .profile_utils import (MAX_TRACKED_VALUES, STAT_ROWS, DatasetProfile, is_numeric_column,
+                            is_text_column)
+
+# HyperLogLog precision: 2**14 registers, relative standard error 1.04 / sqrt(2**14) ~ 0.8%
+HLL_PRECISION = 14
+# KLL accuracy parameter; the normalized rank error is kll_rank_error(KLL_K) ~ 1.3%
+KLL_K = 200
+# Count-Min table size: estimates exceed the true count by at most e / width * n
+# with probability 1 - exp(-depth)
+CMS_WIDTH = 2048
+CMS_DEPTH = 4
+# Heavy-hitter counters per column; columns with fewer distinct values are counted exactly
+HEAVY_HITTERS = 64
+# Rows per chunk when summarizing an in-memory DataFrame (see append_utils.DatasetSummary)
+SKETCH_CHUNK_ROWS = 1_000_000
+# Bins of a GridHistogram (the KDE grid of chart_utils)
+GRID_BINS = 1024
+
+def kll_rank_error(k: int = KLL_K) -> float:
+    """Normalized rank error of a KLL quantile at 99% confidence (the Apache DataSketches bound)"""
+    return 2.296 / k ** 0.9723
+
+def hash_values(values: pd.Series) -> np.ndarray:
+    """64-bit hashes of the non-missing values; numbers are hashed as float64 so 1 and 1.0 agree"""
+    values = values.dropna()
+    if is_numeric_column(values):
+        values = values.astype('float64')
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+class HyperLogLog:
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype='uint8')
+
+    def update_hashes(self, hashes: np.ndarray) -> None:
+        if hashes.size == 0:
+            return
+        remainder_bits = 64 - self.precision
+        index = (hashes >> np.uint64(remainder_bits)).astype(np.intp)
+        remainder = hashes & np.uint64((1 << remainder_bits) - 1)
+        # Position of the leftmost 1 bit of the remainder (1-based). The remainder has at most
+        # 50 bits, so float64 holds it exactly and log2 gives the bit position without rounding.
+        with np.errstate(divide='ignore'):
+            top_bit = np.floor(np.log2(remainder.astype('float64')))
+        rho = np.where(remainder == 0, remainder_bits + 1, remainder_bits - top_bit).astype('uint8')
+        np.maximum.at(self.registers, index, rho)
+
+    def update(self, values: pd.Series) -> None:
+        self.update_hashes(hash_values(values))
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype('int32')))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Small cardinalities: linear counting over the empty registers is more accurate
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch: a stack of compactors where an item at level h stands for 2**h
+    input values. A full level is sorted and every other item (random offset) is promoted.
+    """
+
+    def __init__(self, k: int = KLL_K, seed=None):
+        self.k = k
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self) -> None:
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(self.levels[level])
+                # An odd item out stays at this level so the promoted weight is exact
+                keep = items[:len(items) % 2]
+                items = items[len(keep):]
+                promoted = items[self._rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def update(self, values) -> None:
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        self.n += values.size
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other: 'KLLSketch') -> None:
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self._compress()
+
+    def _weighted_items(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], np.cumsum(weights[order])
+
+    def quantiles(self, qs) -> np.ndarray:
+        """Approximate quantiles (qs in [0, 1]); NaN when the sketch is empty"""
+        qs = np.asarray(qs, dtype='float64')
+        if self.n == 0:
+            return np.full(qs.shape, np.nan)
+        items, cumulative = self._weighted_items()
+        positions = np.searchsorted(cumulative, qs * cumulative[-1], side='left')
+        result = items[np.minimum(positions, len(items) - 1)]
+        # The extremes are tracked exactly
+        return np.where(qs <= 0, self.min, np.where(qs >= 1, self.max, result))
+
+    def rank(self, values) -> np.ndarray:
+        """Approximate fraction of values <= each of the given values"""
+        items, cumulative = self._weighted_items()
+        positions = np.searchsorted(items, np.asarray(values, dtype='float64'), side='right')
+        return np.where(positions == 0, 0.0, cumulative[np.maximum(positions - 1, 0)] / cumulative[-1])
+
+    @property
+    def rank_error(self) -> float:
+        return kll_rank_error(self.k)
+
+
+class FrequencySketch:
+    """
+    Value frequencies: a Count-Min table answers "how often does x occur" for any value
+    (never underestimating), and Misra-Gries counters keep the candidate frequent values.
+    While a column has at most `capacity` distinct values the counters are exact. Columns
+    found to have far more distinct values (see ColumnSketch) stop feeding the counters,
+    which would otherwise cost a full value_counts per chunk, and rely on the table alone.
+    """
+
+    # Whether the counted values are numbers: estimate() must hash values the way update() did
+    numeric = False
+
+    def __init__(self, width: int = CMS_WIDTH, depth: int = CMS_DEPTH, capacity: int = HEAVY_HITTERS, seed: int = 0):
+        self.width = width
+        self.table = np.zeros((depth, width), dtype='int64')
+        # Multiply-shift hash family: one odd 64-bit multiplier per row
+        rng = np.random.default_rng(seed)
+        self._multipliers = rng.integers(1, 2 ** 63, size=depth, dtype='uint64') * np.uint64(2) + np.uint64(1)
+        self._shift = np.uint64(64 - int(math.log2(width)))
+        self.capacity = capacity
+        self.counters = pd.Series(dtype='int64')
+        self.n = 0
+        # Total amount subtracted from the counters; 0 means their counts are exact
+        self.decrement = 0
+        # Set once the counters are abandoned for a high-cardinality column
+        self.overflow = False
+
+    def _buckets(self, hashes: np.ndarray) -> np.ndarray:
+        with np.errstate(over='ignore'):
+            return ((hashes[None, :] * self._multipliers[:, None]) >> self._shift).astype(np.intp)
+
+    def update(self, values: pd.Series, hashes: np.ndarray = None, track_values: bool = True) -> None:
+        """Count the non-missing values (`hashes`: their hash_values, if already computed)"""
+        values = values.dropna()
+        if values.empty:
+            return
+        self.numeric = is_numeric_column(values)
+        self.n += len(values)
+        for row, buckets in enumerate(self._buckets(hash_values(values) if hashes is None else hashes)):
+            self.table[row] += np.bincount(buckets, minlength=self.width)
+        if not track_values or self.overflow:
+            self.overflow = True
+            self.counters = self.counters.iloc[:0]
+            return
+        counts = values.value_counts()
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            counts = counts[counts > 0]
+        counts.index = counts.index.astype(object)
+        self._add_counters(counts)
+
+    def _add_counters(self, counts: pd.Series) -> None:
+        # Weighted Misra-Gries: add the counts, then if too many values are tracked subtract
+        # the (capacity + 1)-th largest count from every counter and drop the ones left at zero
+        merged = self.counters.add(counts, fill_value=0).astype('int64')
+        if len(merged) > self.capacity:
+            cut = int(np.sort(merged.to_numpy())[::-1][self.capacity])
+            merged = merged[merged > cut] - cut
+            self.decrement += cut
+        self.counters = merged
+
+    def merge(self, other: 'FrequencySketch') -> None:
+        self.table += other.table
+        self.n += other.n
+        self.decrement += other.decrement
+        self.overflow = self.overflow or other.overflow
+        if self.overflow:
+            self.counters = self.counters.iloc[:0]
+        else:
+            self._add_counters(other.counters)
+
+    @property
+    def exact(self) -> bool:
+        return self.decrement == 0 and not self.overflow
+
+    def estimate(self, values) -> np.ndarray:
+        """Count-Min estimates (upper bounds) of how often each value occurs"""
+        buckets = self._buckets(hash_values(pd.Series(list(values), dtype='float64' if self.numeric else object)))
+        return self.table[np.arange(len(self.table))[:, None], buckets].min(axis=0)
+
+    def value_counts(self) -> pd.Series:
+        """Counts of the tracked values, most frequent first (exact counts when `exact`)"""
+        if self.exact or self.counters.empty:
+            counts = self.counters
+        else:
+            counts = pd.Series(self.estimate(self.counters.index), index=self.counters.index)
+        return counts.sort_values(ascending=False)
+
+    @property
+    def count_error(self) -> float:
+        """Upper bound on the overcount of value_counts() (0 when exact)"""
+        if self.exact:
+            return 0.0
+        table_error = math.e / self.width * self.n
+        return table_error if self.overflow else min(table_error, float(self.decrement))
+
+
+class ColumnSketch:
+    """All the sketches profile_dataset needs for one column, built in one pass"""
+
+    def __init__(self, series: pd.Series):
+        # Column kind and dtype are taken from the first chunk seen
+        self.numeric = is_numeric_column(series)
+        self.text = is_text_column(series)
+        self.dtype = str(series.dtype)
+        self.nulls = 0
+        if self.numeric:
+            # Exact running moments (Chan et al.'s parallel variance), plus quantiles
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            self.quantiles = KLLSketch()
+        else:
+            self.distinct = HyperLogLog()
+            self.frequencies = FrequencySketch()
+            self.numeric_like = 0
+
+    def update(self, series: pd.Series) -> None:
+        self.nulls += int(series.isna().sum())
+        if self.numeric:
+            values = series.to_numpy(dtype='float64', na_value=np.nan)
+            values = values[~np.isnan(values)]
+            self._merge_moments(values.size, values.mean() if values.size else 0.0,
+                                float(((values - values.mean()) ** 2).sum()) if values.size else 0.0)
+            self.quantiles.update(values)
+        else:
+            # Hash once for both sketches; stop exact counting once the column clearly has
+            # many more distinct values than the heavy-hitter counters can hold
+            hashes = hash_values(series)
+            self.distinct.update_hashes(hashes)
+            self.frequencies.update(series, hashes=hashes,
+                                    track_values=self.distinct.estimate() <= 4 * self.frequencies.capacity)
+            if self.text:
+                if isinstance(series.dtype, pd.CategoricalDtype):
+                    codes = series.cat.codes.to_numpy()
+                    parsed = pd.to_numeric(pd.Series(series.cat.categories.astype(object)), errors='coerce')
+                    self.numeric_like += int(np.isin(codes, np.flatnonzero(parsed.notna().to_numpy())).sum())
+                else:
+                    self.numeric_like += int(pd.to_numeric(series, errors='coerce').notna().sum())
+
+    def _merge_moments(self, count: int, mean: float, m2: float) -> None:
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def merge(self, other: 'ColumnSketch') -> None:
+        self.nulls += other.nulls
+        if self.numeric:
+            self._merge_moments(other.count, other.mean, other.m2)
+            self.quantiles.merge(other.quantiles)
+        else:
+            self.distinct.merge(other.distinct)
+            self.frequencies.merge(other.frequencies)
+            self.numeric_like += other.numeric_like
+
+    def stats(self) -> list:
+        """describe()-style row: count, mean, std, min, 25%, 50%, 75%, max"""
+        if self.count == 0:
+            return [0] + [np.nan] * 7
+        std = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+        quartiles = self.quantiles.quantiles([0.25, 0.5, 0.75])
+        return [self.count, self.mean, std, self.quantiles.min, *quartiles, self.quantiles.max]
+
+
+
+class GridHistogram:
+    """
+    Histogram on GRID_BINS equal-width bins. The first values seen set the grid to span
+    their range; values falling outside it double the bin width (merging neighbouring bins,
+    so every new edge is an old edge) until they fit. The grid therefore always covers the
+    data with at most a few bins' worth of slack, and updates cost O(new values).
+    Count, mean, M2, min and max are tracked exactly alongside.
+    """
+
+    def __init__(self, bins: int = GRID_BINS):
+        self.bins = bins
+        self.counts = np.zeros(bins, dtype='int64')
+        self.low = None
+        self.width = None
+        self.count, self.mean, self.m2 = 0, 0.0, 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        # Whether every value seen is a whole number (counts, marks, ranks, ...)
+        self.integral = True
+
+    @property
+    def high(self) -> float:
+        return self.low + self.bins * self.width
+
+    def edges(self) -> np.ndarray:
+        return self.low + np.arange(self.bins + 1) * self.width
+
+    def _double(self, grow_left: bool) -> None:
+        # Pairs of bins become one bin of twice the width; the freed half of the grid is
+        # added on the side that needs to grow
+        merged = self.counts.reshape(-1, 2).sum(axis=1)
+        padding = np.zeros(self.bins // 2, dtype='int64')
+        if grow_left:
+            self.low -= self.bins * self.width
+            self.counts = np.concatenate([padding, merged])
+        else:
+            self.counts = np.concatenate([merged, padding])
+        self.width *= 2
+
+    def _cover(self, low: float, high: float) -> None:
+        if self.low is None:
+            self.low = low
+            # A constant column still needs a positive bin width
+            self.width = (high - low) / self.bins if high > low else max(abs(low), 1.0) / self.bins
+            return
+        # The top edge belongs to the last bin (as in np.histogram)
+        while low < self.low or high > self.high:
+            self._double(grow_left=low < self.low)
+
+    def _bin(self, values: np.ndarray) -> np.ndarray:
+        return np.minimum(((values - self.low) / self.width).astype(np.intp), self.bins - 1)
+
+    def update(self, values) -> None:
+        values = np.asarray(values, dtype='float64')
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return
+        low, high = values.min(), values.max()
+        self._cover(low, high)
+        self.counts += np.bincount(self._bin(values), minlength=self.bins)
+        # Chan et al.'s parallel update, as in ColumnSketch
+        mean = values.mean()
+        self._merge_moments(values.size, mean, float(((values - mean) ** 2).sum()))
+        self.min, self.max = min(self.min, low), max(self.max, high)
+        self.integral = self.integral and bool(np.all(values == np.rint(values)))
+
+    def _merge_moments(self, count: int, mean: float, m2: float) -> None:
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def merge(self, other: 'GridHistogram') -> None:
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.__dict__.update(other.__dict__, counts=other.counts.copy())
+            return
+        # Widen until our bins are at least as wide as the other's and cover its range, then
+        # move each of its bins into ours by its center (exact when the grids are aligned)
+        while self.width < other.width:
+            self._double(grow_left=False)
+        self._cover(other.low, other.high - other.width / 2)
+        occupied = np.flatnonzero(other.counts)
+        centers = other.low + (occupied + 0.5) * other.width
+        self.counts += np.bincount(self._bin(centers), weights=other.counts[occupied],
+                                   minlength=self.bins).astype('int64')
+        self._merge_moments(other.count, other.mean, other.m2)
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        self.integral = self.integral and other.integral
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+def sketch_chunks(chunks) -> tuple:
+    """
+    Sketch an iterable of DataFrame chunks (e.g. cache_utils.iter_arrow_chunks).
+    Column kinds come from the first chunk.
+
+    Returns:
+    tuple: (number of rows, {column: ColumnSketch})
+    """
+    n_rows, sketches = 0, None
+    for chunk in chunks:
+        if sketches is None:
+            sketches = {col: ColumnSketch(chunk[col]) for col in chunk.columns}
+        n_rows += len(chunk)
+        for col, sketch in sketches.items():
+            sketch.update(chunk[col])
+    return n_rows, sketches or {}
+
+def sketch_profile(n_rows: int, sketches: dict) -> DatasetProfile:
+    """
+    Build a DatasetProfile from column sketches. Counts, means, standard deviations,
+    minima and maxima are exact; quartiles, distinct counts and value counts are approximate
+    and their bounds are recorded in `error_bounds`.
+    """
+    numeric = [col for col, sketch in sketches.items() if sketch.numeric]
+    profile = DatasetProfile(
+        n_rows=n_rows,
+        columns=list(sketches),
+        dtypes={col: sketch.dtype for col, sketch in sketches.items()},
+        null_counts={col: sketch.nulls for col, sketch in sketches.items()},
+        numeric_stats=pd.DataFrame([sketches[col].stats() for col in numeric], index=numeric,
+                                   columns=STAT_ROWS, dtype='float64'),
+        approximate=True,
+    )
+    profile.error_bounds['quantile_rank_error'] = kll_rank_error()
+    profile.error_bounds['distinct_relative_error'] = HyperLogLog().relative_error
+    for col, sketch in sketches.items():
+        if sketch.numeric:
+            continue
+        counts = sketch.frequencies.value_counts()
+        # Few distinct values are tracked exactly, so the exact count is preferred over the estimate
+        profile.nunique[col] = len(counts) if sketch.frequencies.exact else sketch.distinct.estimate()
+        if sketch.frequencies.exact and len(counts) <= MAX_TRACKED_VALUES:
+            profile.value_counts[col] = counts
+        profile.error_bounds.setdefault('count_error', {})[col] = sketch.frequencies.count_error
+        if sketch.text:
+            profile.numeric_like[col] = sketch.numeric_like
+    return profile
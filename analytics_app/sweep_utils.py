@@ -0,0 +1,212 @@
+"""
+Privacy/utility sweeps over many epsilons.
+Provides:
+1. parse_epsilons: Validate a list of epsilons given as text (query strings, command lines).
+2. epsilon_sweep: Anonymize the numeric columns of a dataset at every epsilon in one pass
+   and measure what each level of privacy costs: mean and variance error, histogram
+   distance and correlation drift against the original data.
+3. sweep_dataset: epsilon_sweep for a stored dataset, through the dataset cache (on a sample of
+   the rows of large datasets, see settings.ANALYSIS_SAMPLE_ROWS). Runs inside pool workers.
+
+The Laplace scale of a column is linear in 1/epsilon (see privacy_utils.noise_scale), so one
+unit-Laplace draw U serves every epsilon: the variant for epsilon e is X + U * b / e, with b
+the column's scale at epsilon 1. The data is read once and the noise drawn once, instead
+of running anonymize_data once per epsilon.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .cache_utils import arrow_rows, dataset_files, file_hash, load_dataset, load_profile, sample_rows, use_sample
+from .chart_utils import HIST_BINS
+from .correlation_utils import CorrelationAccumulator
+from .privacy_utils import anonymization_plan, round_columns, unit_laplace
+from .profile_utils import DatasetProfile, profile_dataset
+from .timing_utils import timed
+
+DEFAULT_EPSILONS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+# Most epsilons evaluated by one sweep
+MAX_EPSILONS = 20
+# Size of the (epsilons x rows x columns) buffer of noisy variants, which bounds the rows per
+# slab; a slab needs a few temporaries of this size
+SWEEP_BUFFER_BYTES = 16 * 1024 ** 2
+# Significant digits kept in the result
+PRECISION = 4
+
+def parse_epsilons(values) -> list:
+    """
+    Parse epsilons given as strings (comma-separated or not) into a sorted list of unique
+    positive floats. Raises ValueError for anything else, or for more than MAX_EPSILONS.
+    """
+    if isinstance(values, str):
+        values = [values]
+    epsilons = set()
+    for value in values:
+        for part in str(value).split(','):
+            if part.strip():
+                try:
+                    epsilon = float(part)
+                except ValueError:
+                    epsilon = math.nan
+                if not math.isfinite(epsilon) or epsilon <= 0:
+                    raise ValueError(f"Epsilon must be a positive number, not {part.strip()}")
+                epsilons.add(epsilon)
+    if not epsilons:
+        raise ValueError("Give at least one epsilon")
+    if len(epsilons) > MAX_EPSILONS:
+        raise ValueError(f"At most {MAX_EPSILONS} epsilons can be compared at once")
+    return sorted(epsilons)
+
+def _round(values):
+    return [_round(value) for value in values] if np.ndim(values) else (
+        float(f"{values:.{PRECISION}g}") if np.isfinite(values) else None)
+
+def _moments(sums: np.ndarray, squares: np.ndarray, counts: np.ndarray) -> tuple:
+    # Mean offset and sample variance from sums of shifted values and their squares
+    with np.errstate(invalid='ignore', divide='ignore'):
+        offset = sums / counts
+        variance = (squares - sums * offset) / (counts - 1)
+    return offset, variance
+
+@timed('sweep')
+def epsilon_sweep(df: pd.DataFrame, epsilons, profile: DatasetProfile = None, rng=None) -> dict:
+    """
+    Utility of anonymize_data's numeric noise at each epsilon, from one pass over the data.
+
+    Per slab of rows, a single unit-Laplace block is broadcast over an epsilon axis to give
+    every noisy variant at once (rounded as in a release); the variants are reduced to sums,
+    sums of squares, histogram counts and correlation products and then discarded, so memory
+    stays bounded by SWEEP_BUFFER_BYTES whatever the size of the dataset. Text columns are
+    generalized the same way at every epsilon and are not part of the sweep.
+
+    Metrics, per epsilon and column (averaged over the columns in 'metrics'):
+    - mean_error: |noisy mean - mean| in standard deviations of the original column
+    - variance_error: |noisy variance - variance| relative to the original variance
+    - histogram_distance: total variation distance between the noisy and original
+      histograms (HIST_BINS bins over the original range, outliers in the edge bins)
+    - correlation_drift (and _max): mean (and max) |noisy r - r| over all column pairs
+
+    Parameters:
+    df (pd.DataFrame): The cleaned dataset.
+    epsilons: Epsilons to evaluate (see parse_epsilons).
+    profile (DatasetProfile): Profile of df; computed if not given.
+    rng (int or np.random.Generator): Seed or generator for the noise.
+
+    Returns:
+    dict: {'epsilons', 'columns', 'rows', 'noise_scales': per column at epsilon 1,
+           'metrics': {metric: [per epsilon]}, 'per_column': {metric: [[per column] per epsilon]}}
+    """
+    if profile is None:
+        profile = profile_dataset(df)
+    epsilons = np.array(sorted(set(float(epsilon) for epsilon in epsilons)))
+    rng = np.random.default_rng(rng)
+    # Scales at epsilon 1 are the b in b / epsilon; rounding does not depend on epsilon
+    plan = anonymization_plan(profile, 1.0)
+    columns = [col for col in df.columns if col in plan.noise]
+    k, c, n = len(epsilons), len(columns), len(df)
+    metrics = ('mean_error', 'variance_error', 'histogram_distance')
+    result = {
+        'epsilons': epsilons.tolist(),
+        'columns': [str(col) for col in columns],
+        'rows': n,
+        'noise_scales': _round(np.array([plan.noise[col][0] for col in columns])),
+        'metrics': {name: [None] * k for name in (*metrics, 'correlation_drift', 'correlation_drift_max')},
+        'per_column': {name: [[] for _ in range(k)] for name in metrics},
+    }
+    if not c or not n:
+        return result
+
+    scales = np.array([plan.noise[col][0] for col in columns])
+    decimals = np.array([plan.noise[col][1] for col in columns])
+    stats = profile.numeric_stats.loc[columns]
+    # Values are shifted by the original means so sums of squares keep their precision
+    means = stats['mean'].to_numpy(dtype='float64')
+    low = stats['min'].to_numpy(dtype='float64')
+    width = (stats['max'].to_numpy(dtype='float64') - low) / HIST_BINS
+    width[~(width > 0)] = 1.0
+    # Noise scale of every (epsilon, column), broadcast over the rows of a slab
+    variant_scales = (scales / epsilons[:, None])[:, None, :]
+
+    counts = np.zeros(c)
+    orig_sums, orig_squares = np.zeros(c), np.zeros(c)
+    sums, squares = np.zeros((k, c)), np.zeros((k, c))
+    # Histograms of the original (row 0) and of each variant, flattened as (variant, column, bin)
+    # with one extra bin per histogram for missing values
+    histograms = np.zeros((k + 1) * c * (HIST_BINS + 1), dtype='int64')
+    bin_offsets = (np.arange(k + 1)[:, None, None] * c + np.arange(c)) * (HIST_BINS + 1)
+    correlations = [CorrelationAccumulator(means) for _ in range(k + 1)] if c >= 2 else []
+
+    slab_rows = max(1024, SWEEP_BUFFER_BYTES // (8 * (k + 1) * c))
+    for start in range(0, n, slab_rows):
+        values = df.iloc[start:start + slab_rows][columns].to_numpy(dtype='float64', na_value=np.nan)
+        # One draw for every epsilon: (epsilons x rows x columns)
+        variants = values + unit_laplace(rng, len(values), c) * variant_scales
+        round_columns(variants, decimals)
+
+        present = ~np.isnan(values)
+        counts += present.sum(axis=0)
+        # Plain sums when the slab has no missing values (rounding keeps noisy values finite)
+        total = np.sum if present.all() else np.nansum
+        shifted = values - means
+        orig_sums += total(shifted, axis=0)
+        orig_squares += total(shifted * shifted, axis=0)
+        shifted = variants - means
+        sums += total(shifted, axis=1)
+        squares += total(shifted * shifted, axis=1)
+
+        # Bin index of every value, with missing values counted in an extra bin that is dropped
+        both = np.concatenate([values[None], variants])
+        with np.errstate(invalid='ignore'):
+            bins = np.floor((both - low) / width)
+        np.clip(bins, 0, HIST_BINS - 1, out=bins)
+        np.nan_to_num(bins, copy=False, nan=HIST_BINS)
+        index = bins.astype('int64')
+        index += bin_offsets
+        histograms += np.bincount(index.ravel(), minlength=histograms.size)
+        for accumulator, variant in zip(correlations, both):
+            accumulator.add(variant.T)
+
+    orig_offset, orig_variance = _moments(orig_sums, orig_squares, counts)
+    offset, variance = _moments(sums, squares, counts)
+    histograms = histograms.reshape(k + 1, c, HIST_BINS + 1)[:, :, :HIST_BINS].astype('float64')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        histograms /= histograms.sum(axis=2, keepdims=True)
+        per_column = {
+            'mean_error': np.abs(offset - orig_offset) / np.sqrt(orig_variance),
+            'variance_error': np.abs(variance - orig_variance) / orig_variance,
+            'histogram_distance': 0.5 * np.abs(histograms[1:] - histograms[0]).sum(axis=2),
+        }
+    for name, values in per_column.items():
+        # Constant columns have no spread to compare against
+        values[~np.isfinite(values)] = np.nan
+        result['per_column'][name] = [_round(row) for row in values]
+        result['metrics'][name] = [_round(np.nanmean(row)) if np.isfinite(row).any() else None for row in values]
+
+    if correlations:
+        orig_matrix = correlations[0].matrix()
+        off_diagonal = ~np.eye(c, dtype=bool)
+        for i, accumulator in enumerate(correlations[1:]):
+            drift = np.abs(accumulator.matrix() - orig_matrix)[off_diagonal]
+            if np.isfinite(drift).any():
+                result['metrics']['correlation_drift'][i] = _round(np.nanmean(drift))
+                result['metrics']['correlation_drift_max'][i] = _round(np.nanmax(drift))
+    return result
+
+def sweep_dataset(filepath: str, epsilons, digest: str = None, rng=0) -> dict:
+    """
+    epsilon_sweep of a stored dataset's cleaned data (the data releases are built from),
+    loaded through the dataset cache. The fixed default seed makes repeated sweeps agree.
+    Datasets with more than settings.ANALYSIS_SAMPLE_ROWS rows are swept on that many sampled
+    rows ('sampled_from' in the result gives their number of rows).
+    """
+    digest = digest or file_hash(filepath)
+    paths = dataset_files(filepath, clean=True, digest=digest)
+    n_rows = arrow_rows(paths)
+    if use_sample(n_rows):
+        sample = sample_rows(paths, settings.ANALYSIS_SAMPLE_ROWS, rng=0)
+        return {**epsilon_sweep(sample, epsilons, rng=rng), 'sampled_from': n_rows}
+    df = load_dataset(filepath, clean=True, digest=digest)
+    profile = load_profile(filepath, clean=True, digest=digest, df=df)
+    return epsilon_sweep(df, epsilons, profile=profile, rng=rng)
@@ -0,0 +1,100 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from analytics_app.append_utils import append_rows, load_summary
+from analytics_app.benchmarks import make_dataset
+from analytics_app.cache_utils import CACHE_SUFFIX, cache_path, concat_frames, load_dataset, load_profile, read_upload
+from analytics_app.export_utils import iter_export
+from analytics_app.release_utils import load_release, preview_release, release_path
+
+from .utils import StoreTestCase
+
+
+def with_gaps(df: pd.DataFrame, step: int) -> pd.DataFrame:
+    df = df.copy()
+    df.loc[::step, 'Score_0'] = np.nan
+    df.loc[::step + 1, 'Category'] = np.nan
+    return df
+
+def stored_rows(path: str) -> int:
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+
+class AppendTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path, self.digest = self.stored_dataset(with_gaps(make_dataset(1000, 8, seed=1), 9))
+        load_release(self.path, epsilon=1.0, digest=self.digest)
+        self.rows = [self.stored_dataset(with_gaps(make_dataset(n, 8, seed=seed), 5), f'rows{seed}.csv')[0]
+                     for n, seed in ((300, 2), (200, 3))]
+
+    def append_all(self) -> tuple:
+        path, digest = self.path, self.digest
+        for rows_path in self.rows:
+            path, digest = append_rows(path, digest, rows_path)
+        return path, digest
+
+    def test_append_matches_full_recompute(self):
+        before = load_dataset(self.path, clean=True, digest=self.digest)
+        old_release = load_release(self.path, epsilon=1.0, digest=self.digest)
+        path, digest = self.append_all()
+
+        raw = load_dataset(path, digest=digest)
+        pd.testing.assert_frame_equal(raw.astype(str), read_upload(path).astype(str))
+        clean = load_dataset(path, clean=True, digest=digest)
+        self.assertEqual(len(clean), 1500)
+        self.assertEqual(int(clean.isna().sum().sum()), 0)
+        # Rows already in the dataset keep the values they were filled with
+        pd.testing.assert_frame_equal(clean.iloc[:1000].astype(str), before.astype(str))
+
+        # Merged statistics agree with statistics of the whole cleaned dataset
+        profile, summary = load_profile(path, clean=True, digest=digest), load_summary(path, digest)
+        self.assertEqual(profile.n_rows, len(clean))
+        for col in ('Marks', 'Score_0'):
+            self.assertAlmostEqual(summary.sketches[col].mean, clean[col].astype('float64').mean(), places=6)
+            self.assertAlmostEqual(profile.numeric_stats.loc[col, 'mean'], clean[col].astype('float64').mean(),
+                                   places=6)
+        self.assertEqual(sorted(profile.value_counts['Category'].items()),
+                         sorted(clean['Category'].astype(str).value_counts().items()))
+
+        release = load_release(path, epsilon=1.0, digest=digest)
+        self.assertEqual(len(release), 1500)
+        self.assertEqual(list(release.columns), list(old_release.columns))
+        # Earlier rows keep their noise
+        pd.testing.assert_frame_equal(release.iloc[:1000].astype(str), old_release.astype(str))
+        csv = pd.read_csv(io.BytesIO(b''.join(iter_export(release_path(digest, 1.0), 'csv'))))
+        self.assertEqual(len(csv), 1500)
+        self.assertEqual(list(preview_release(path, 1.0, 5, digest).columns), list(release.columns))
+
+    def test_append_writes_only_the_new_rows(self):
+        load_dataset(self.path, clean=True, digest=self.digest)
+        parent_files = [cache_path(self.digest, 'raw'), cache_path(self.digest, 'clean'),
+                        release_path(self.digest, 1.0)]
+        # Reads bump modification times, so a rewrite shows as a new inode
+        files = [(os.stat(path).st_ino, os.stat(path).st_size) for path in parent_files]
+        path, digest = append_rows(self.path, self.digest, self.rows[0])
+
+        for part in (cache_path(digest, 'raw'), cache_path(digest, 'clean'), release_path(digest, 1.0)):
+            self.assertEqual(stored_rows(part), 300, part)
+        self.assertEqual([(os.stat(path).st_ino, os.stat(path).st_size) for path in parent_files], files)
+
+    def test_evicted_parts_are_rebuilt_with_the_stored_fill_values(self):
+        path, digest = self.append_all()
+        clean = load_dataset(path, clean=True, digest=digest)
+        for name in os.listdir(os.path.dirname(cache_path(digest))):
+            if name.endswith(CACHE_SUFFIX):
+                os.remove(os.path.join(os.path.dirname(cache_path(digest)), name))
+
+        rebuilt = load_dataset(path, clean=True, digest=digest)
+        pd.testing.assert_frame_equal(rebuilt, clean)
+        # Not what cleaning the whole dataset again (with its global means) would give
+        whole = concat_frames(*(read_upload(p) for p in (self.path, *self.rows)))
+        global_mean = whole['Score_0'].mean()
+        self.assertFalse(np.allclose(rebuilt['Score_0'].iloc[1000:][whole['Score_0'].iloc[1000:].isna().to_numpy()],
+                                     global_mean))
@@ -0,0 +1,74 @@
+import base64
+import io
+import json
+import os
+import zipfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from django.urls import reverse
+
+from analytics_app.batch_utils import BatchZipWriter, anonymize_file
+from analytics_app.benchmarks import make_dataset
+
+from .utils import StoreTestCase
+
+
+class BatchZipWriterTests(StoreTestCase):
+    def test_results_are_streamed_in_bounded_chunks(self):
+        path = self.write_csv(make_dataset(2000, 6))
+        entry = anonymize_file(path, epsilon=1.0, output_format='csv')
+        size = os.path.getsize(entry['output'])
+        writer = BatchZipWriter()
+        with mock.patch('analytics_app.batch_utils.BATCH_ZIP_CHUNK_BYTES', 4096):
+            chunks = list(writer.add(entry))
+        self.assertGreater(len(chunks), 1)
+        # Deflate output trails its input by at most a block, never by the whole file
+        self.assertLess(max(map(len, chunks)), size)
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks) + writer.close()))
+        self.assertEqual(archive.namelist(), ['data.anonymized.csv', 'manifest.json'])
+        self.assertEqual(archive.getinfo('data.anonymized.csv').file_size, size)
+        manifest = json.loads(archive.read('manifest.json'))
+        self.assertEqual((manifest['files'], manifest['failed']), (1, 0))
+        self.assertEqual(manifest['results'][0]['bytes'], size)
+
+    def test_failed_files_are_listed_in_the_manifest(self):
+        writer = BatchZipWriter()
+        data = b''.join(writer.add(anonymize_file(os.path.join(self.tmp_dir, 'missing.csv'))))
+        archive = zipfile.ZipFile(io.BytesIO(data + writer.close()))
+        manifest = json.loads(archive.read('manifest.json'))
+        self.assertEqual(manifest['failed'], 1)
+        self.assertIn('error', manifest['results'][0])
+
+
+class EpsilonValidationTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        User.objects.create_user('pipeline', password='pw-12345678')
+        self.auth = 'Basic ' + base64.b64encode(b'pipeline:pw-12345678').decode()
+        self.csv = self.write_csv(make_dataset(50, 5))
+
+    def post(self, **fields):
+        with open(self.csv, 'rb') as f:
+            upload = SimpleUploadedFile('data.csv', f.read(), content_type='text/csv')
+        return self.client.post(reverse('anonymize_batch'), {'files': [upload], **fields},
+                                HTTP_AUTHORIZATION=self.auth)
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def test_view_rejects_non_finite_epsilons(self):
+        for fields in ({'epsilon': 'inf'}, {'epsilon': 'nan'}, {'epsilon': '0'}, {'epsilon': '1e300'},
+                       {'epsilons': json.dumps({'data.csv': float('inf')})}):
+            with self.subTest(fields=fields):
+                response = self.post(**fields)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('positive finite', response.json()['error'])
+
+    def test_command_rejects_non_finite_epsilons(self):
+        for epsilon in ('inf', 'nan', '-1', '1e300'):
+            with self.subTest(epsilon=epsilon), self.assertRaisesMessage(CommandError, 'positive finite'):
+                call_command('anonymize_batch', self.csv, epsilon=float(epsilon),
+                             output=os.path.join(self.tmp_dir, 'out.zip'))
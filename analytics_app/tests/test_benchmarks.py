@@ -0,0 +1,90 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase
+
+from analytics_app.benchmarks import BASE_COLUMNS, compare_results, make_dataset, run_stage
+from analytics_app.privacy_utils import MAX_GROUPING_CARDINALITY
+
+
+def result(stage='anonymize', seconds=1.0, peak_rss_mb=100.0, **extra):
+    return {'rows': 1000, 'cols': 5, 'stage': stage, 'seconds': seconds, 'peak_rss_mb': peak_rss_mb, **extra}
+
+
+class MakeDatasetTests(SimpleTestCase):
+    def test_shape_and_determinism(self):
+        df = make_dataset(500, 12, seed=1)
+        self.assertEqual(df.shape, (500, 12))
+        self.assertEqual(list(df.columns[:5]), BASE_COLUMNS)
+        self.assertTrue(df.equals(make_dataset(500, 12, seed=1)))
+        self.assertFalse(df.equals(make_dataset(500, 12, seed=2)))
+        self.assertEqual(list(make_dataset(10, 3).columns), BASE_COLUMNS[:3])
+
+    def test_generated_columns_cover_every_anonymization_branch(self):
+        df = make_dataset(5000, 9)
+        self.assertTrue(df['Name'].is_unique)
+        self.assertEqual(df['Score_0'].dtype, 'float64')
+        self.assertEqual(df['Marks_1'].dtype, 'int64')
+        # A low-cardinality column with rare levels, and text rank tiers
+        self.assertLessEqual(df['Group_2'].nunique(), MAX_GROUPING_CARDINALITY)
+        self.assertLess(df['Group_2'].value_counts(normalize=True).min(), 0.05)
+        self.assertTrue(df['Rank_3'].str.startswith('Tier').all())
+
+
+class CompareResultsTests(SimpleTestCase):
+    def test_regressions_are_flagged(self):
+        baseline = [result('anonymize'), result('stats'), result('profile'), result('compare', error='boom')]
+        current = [result('anonymize', seconds=1.1), result('stats', seconds=1.5),
+                   result('profile', peak_rss_mb=150.0), result('compare'), result('unknown')]
+        comparisons = {c['stage']: c for c in compare_results(current, baseline, threshold=0.2)}
+        # Entries with no (valid) baseline are not compared
+        self.assertEqual(sorted(comparisons), ['anonymize', 'profile', 'stats'])
+        self.assertFalse(comparisons['anonymize']['regression'])
+        self.assertAlmostEqual(comparisons['anonymize']['time_ratio'], 1.1)
+        self.assertTrue(comparisons['stats']['regression'])
+        self.assertTrue(comparisons['profile']['regression'])
+
+    def test_new_heavy_modules_are_regressions(self):
+        baseline = [result('startup:urls', heavy_modules=[])]
+        current = [result('startup:urls', heavy_modules=['pandas'])]
+        (comparison,) = compare_results(current, baseline)
+        self.assertEqual(comparison['new_modules'], ['pandas'])
+        self.assertTrue(comparison['regression'])
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='analytics_bench_')
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+
+    def test_run_stage_reports_time_and_memory(self):
+        stage = run_stage('anonymize', 300, 6, repeat=2)
+        self.assertNotIn('error', stage)
+        self.assertEqual((stage['rows'], stage['cols'], stage['stage']), (300, 6, 'anonymize'))
+        self.assertLessEqual(stage['seconds'], stage['mean_seconds'])
+        self.assertGreaterEqual(stage['peak_rss_mb'], stage['rss_before_mb'])
+
+    def test_command_writes_results_and_fails_on_regression(self):
+        output = os.path.join(self.tmp_dir, 'results.json')
+        options = {'rows': [200], 'cols': [5], 'stages': ['profile'], 'repeat': 1, 'stdout': io.StringIO()}
+        call_command('benchmark', output=output, **options)
+        with open(output) as f:
+            report = json.load(f)
+        (entry,) = report['results']
+        self.assertEqual((entry['rows'], entry['stage']), (200, 'profile'))
+        self.assertIn('pandas', report['environment'])
+
+        # A baseline a thousand times faster makes this run a regression
+        entry['seconds'] /= 1000
+        baseline = os.path.join(self.tmp_dir, 'baseline.json')
+        with open(baseline, 'w') as f:
+            json.dump(report, f)
+        with self.assertRaisesMessage(CommandError, 'regression'):
+            call_command('benchmark', output=output, baseline=baseline, fail_on_regression=True, **options)
+
+        with self.assertRaisesMessage(CommandError, 'at least the 5 sample columns'):
+            call_command('benchmark', output=output, **{**options, 'cols': [3]})
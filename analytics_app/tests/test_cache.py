@@ -0,0 +1,96 @@
+import os
+import time
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from django.test import override_settings
+
+from analytics_app.append_utils import load_summary
+from analytics_app.benchmarks import make_dataset
+from analytics_app.cache_utils import (CACHE_SUFFIX, FILL_SUFFIX, PROFILE_SUFFIX, SUMMARY_SUFFIX, cache_path,
+                                       clean_dataset, evict_cache, load_dataset, load_profile, read_upload)
+
+from .utils import StoreTestCase
+
+
+class DatasetCacheTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path, self.digest = self.stored_dataset(make_dataset(2000, 8))
+
+    def test_reopened_dataset_is_read_from_the_memory_map(self):
+        parsed = load_dataset(self.path, clean=True, digest=self.digest)
+        self.assertTrue(os.path.exists(cache_path(self.digest, 'raw')))
+        self.assertTrue(os.path.exists(cache_path(self.digest, 'clean')))
+
+        with mock.patch('analytics_app.cache_utils.read_upload', side_effect=AssertionError("parsed again")):
+            cached = load_dataset(self.path, clean=True, digest=self.digest)
+        pd.testing.assert_frame_equal(cached, parsed)
+        # Numeric columns are views of the mapped file, not copies
+        self.assertFalse(cached['Marks'].to_numpy().flags.writeable)
+        # Whole-column operations make new arrays; single elements can only be set on a copy
+        cached['Marks'] += 1
+        self.assertEqual(cached.loc[0, 'Marks'], parsed.loc[0, 'Marks'] + 1)
+        with self.assertRaises(ValueError):
+            cached.loc[0, 'Score_0'] = -1
+
+    def test_profile_is_cached(self):
+        profile = load_profile(self.path, clean=True, digest=self.digest)
+        with mock.patch('analytics_app.cache_utils.profile_dataset', side_effect=AssertionError("profiled again")):
+            self.assertEqual(load_profile(self.path, clean=True, digest=self.digest).n_rows, profile.n_rows)
+
+    def test_eviction_removes_old_data_but_keeps_profiles_and_summaries(self):
+        load_profile(self.path, clean=True, digest=self.digest)
+        load_summary(self.path, self.digest)
+        old = [cache_path(self.digest, variant) for variant in ('raw', 'clean')]
+        past = time.time() - 3600
+        for path in old:
+            os.utime(path, (past, past))
+
+        other_path, other_digest = self.stored_dataset(make_dataset(2000, 8, seed=1), 'other.csv')
+        # Too small for anything but the file just written
+        with override_settings(DATASET_CACHE_MAX_BYTES=1):
+            load_dataset(other_path, clean=True, digest=other_digest)
+        self.assertFalse(any(os.path.exists(path) for path in old))
+        self.assertTrue(os.path.exists(cache_path(other_digest, 'clean')))
+        self.assertTrue(os.path.exists(cache_path(self.digest, 'clean', PROFILE_SUFFIX)))
+        self.assertTrue(os.path.exists(cache_path(self.digest, 'clean', SUMMARY_SUFFIX)))
+
+        # An evicted dataset is parsed again from its upload
+        self.assertEqual(len(load_dataset(self.path, clean=True, digest=self.digest)), 2000)
+
+    def test_evict_cache_only_counts_arrow_files(self):
+        load_profile(self.path, clean=True, digest=self.digest)
+        removed = evict_cache(max_bytes=0, keep=cache_path(self.digest, 'clean'))
+        self.assertEqual(removed, [cache_path(self.digest, 'raw')])
+        self.assertTrue(all(path.endswith(CACHE_SUFFIX) for path in removed))
+
+
+# Chunks of 100 rows, so the test files span many batches
+@override_settings(STREAMING_CONVERSION_MIN_BYTES=0, STREAMING_CHUNK_ROWS=100)
+class StreamingConversionTests(StoreTestCase):
+    def test_large_csv_is_parsed_and_cleaned_batch_by_batch(self):
+        df = make_dataset(1000, 9, seed=3)
+        df.loc[::7, 'Score_0'] = np.nan
+        df.loc[::11, 'Group_2'] = np.nan
+        # Gaps in a column with too many distinct values for the first pass to count them
+        df['Comment'] = [f"note {i}" if i % 5 else None for i in range(len(df))]
+        df['Quarter'] = np.arange(len(df)) / 4
+        df.loc[3, 'Marks'] = 100_000
+        path, digest = self.stored_dataset(df)
+
+        with mock.patch('analytics_app.cache_utils.read_upload', side_effect=AssertionError("loaded")):
+            raw = load_dataset(path, digest=digest)
+            clean = load_dataset(path, clean=True, digest=digest)
+        with pa.memory_map(cache_path(digest, 'clean')) as source:
+            self.assertEqual(pa.ipc.open_file(source).num_record_batches, 10)
+
+        # Same values and compact dtypes as parsing the whole file
+        pd.testing.assert_frame_equal(raw, read_upload(path))
+        pd.testing.assert_frame_equal(clean, clean_dataset(read_upload(path)))
+        self.assertEqual(str(clean['Marks'].dtype), 'int32')
+        self.assertEqual(str(clean['Quarter'].dtype), 'float32')
+        self.assertIsInstance(clean['Group_2'].dtype, pd.CategoricalDtype)
+        self.assertTrue(os.path.exists(cache_path(digest, 'clean', FILL_SUFFIX)))
@@ -0,0 +1,80 @@
+import json
+
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+
+from analytics_app.benchmarks import make_dataset
+from analytics_app.chart_utils import HIST_BINS, KDE_POINTS, chart_columns, chart_data, histogram_data
+from analytics_app.profile_utils import profile_dataset
+from analytics_app.viz_utils import compare_datasets
+
+
+def exact_kde(values: np.ndarray, points: np.ndarray) -> np.ndarray:
+    # Gaussian KDE with Scott's rule, evaluated point by point
+    bandwidth = values.std(ddof=1) * values.size ** (-1 / 5)
+    z = (points[:, None] - values[None, :]) / bandwidth
+    return np.exp(-0.5 * z ** 2).sum(axis=1) / (values.size * bandwidth * np.sqrt(2 * np.pi))
+
+
+class HistogramDataTests(SimpleTestCase):
+    def test_bins_match_numpy(self):
+        values = np.random.default_rng(0).normal(50, 10, 5000)
+        values[::17] = np.nan
+        data = histogram_data(values)
+        counts, edges = np.histogram(values[np.isfinite(values)], bins=HIST_BINS)
+        self.assertEqual(data['counts'], counts.tolist())
+        np.testing.assert_allclose(data['bin_edges'], edges, rtol=1e-5)
+
+    def test_kde_matches_the_exact_density(self):
+        values = np.random.default_rng(1).gamma(2.0, 5.0, 4000)
+        data = histogram_data(values)
+        self.assertEqual(len(data['kde_x']), KDE_POINTS)
+        bin_width = data['bin_edges'][1] - data['bin_edges'][0]
+        expected = exact_kde(values, np.array(data['kde_x'])) * values.size * bin_width
+        np.testing.assert_allclose(data['kde_y'], expected, atol=0.01 * expected.max())
+
+    def test_degenerate_columns(self):
+        self.assertEqual(histogram_data(np.array([np.nan, np.nan])),
+                         {'bin_edges': [], 'counts': [], 'kde_x': [], 'kde_y': []})
+        constant = histogram_data(np.full(10, 3.0))
+        self.assertEqual(sum(constant['counts']), 10)
+        self.assertEqual((constant['kde_x'], constant['kde_y']), ([], []))
+
+
+class ChartDataTests(SimpleTestCase):
+    def setUp(self):
+        self.df = make_dataset(2000, 9, seed=2)
+        self.df['Coded'] = self.df['Marks'].astype(str)
+        self.df['Sparse'] = np.where(np.arange(2000) % 3, np.nan, 1.0)
+
+    def test_chart_columns(self):
+        columns = chart_columns(profile_dataset(self.df))
+        # Numbers stored as text are charted; mostly-missing and non-numeric columns are not
+        self.assertEqual(columns, ['RollNo', 'Marks', 'Rank', 'Score_0', 'Marks_1', 'Coded'])
+
+    def test_payload_is_small_json(self):
+        data = chart_data(self.df)
+        payload = json.dumps(data, allow_nan=False)
+        self.assertLess(len(payload), 40_000)
+        histograms = {chart['column']: chart for chart in data['histograms']}
+        self.assertEqual(histograms['Coded']['counts'], histograms['Marks']['counts'])
+        self.assertEqual(data['correlation']['columns'], list(histograms))
+        matrix = np.array(data['correlation']['matrix'], dtype='float64')
+        np.testing.assert_allclose(np.diag(matrix), 1)
+
+    def test_single_column_has_no_correlation(self):
+        data = chart_data(pd.DataFrame({'Marks': np.arange(100.0), 'Category': ['A', 'B'] * 50}))
+        self.assertEqual([chart['column'] for chart in data['histograms']], ['Marks'])
+        self.assertIsNone(data['correlation'])
+
+    def test_compare_datasets_returns_chart_aggregates(self):
+        result = compare_datasets(self.df, epsilon=1.0)
+        self.assertNotIn('error', result)
+        charts = result['charts']
+        json.dumps(charts, allow_nan=False)
+        anon_columns = [chart['column'] for chart in charts['anon']['histograms']]
+        # Identifier columns are dropped from the release
+        self.assertNotIn('RollNo', anon_columns)
+        self.assertIn('Marks', anon_columns)
+        self.assertIsNotNone(charts['drift'])
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+
+from analytics_app.correlation_utils import compare_correlations, correlation_matrix, downsample, top_pairs
+
+
+def frame_with_gaps(n_rows: int = 2000, n_cols: int = 6, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    base = rng.normal(size=n_rows)
+    df = pd.DataFrame({f"c{i}": base * (i - 2) + rng.normal(scale=1 + i, size=n_rows) + 1e6 * (i == 1)
+                       for i in range(n_cols)})
+    for i, col in enumerate(df.columns):
+        df.loc[rng.random(n_rows) < 0.05 * i, col] = np.nan
+    return df
+
+
+class CorrelationMatrixTests(SimpleTestCase):
+    def test_matches_dataframe_corr_with_missing_values(self):
+        df = frame_with_gaps()
+        # Small slabs, so the pairwise sums are accumulated over many of them
+        for slab_rows in (37, 65_536):
+            matrix, used = correlation_matrix(df.to_numpy().T, slab_rows=slab_rows)
+            self.assertEqual(used, len(df))
+            np.testing.assert_allclose(matrix, df.corr().to_numpy(), atol=1e-5)
+
+    def test_undefined_pairs_are_nan(self):
+        df = pd.DataFrame({
+            'a': [1.0, 2.0, 3.0, 4.0, np.nan, np.nan],
+            'b': [np.nan, np.nan, np.nan, 1.0, 2.0, 3.0],
+            'constant': [5.0] * 6,
+            'c': [2.0, 1.0, 4.0, 3.0, 6.0, 5.0],
+        })
+        matrix, _ = correlation_matrix(df.to_numpy().T)
+        expected = df.corr().to_numpy()
+        np.testing.assert_array_equal(np.isnan(matrix), np.isnan(expected))
+        np.testing.assert_allclose(matrix[~np.isnan(matrix)], expected[~np.isnan(expected)], atol=1e-6)
+
+    def test_sample_uses_the_requested_rows(self):
+        df = frame_with_gaps(5000)
+        matrix, used = correlation_matrix(df.to_numpy().T, sample_rows=2000, rng=1)
+        self.assertEqual(used, 2000)
+        np.testing.assert_allclose(matrix, df.corr().to_numpy(), atol=0.1)
+
+
+class CorrelationReportTests(SimpleTestCase):
+    def test_drift_is_anon_minus_orig(self):
+        orig = frame_with_gaps()
+        anon = orig + np.random.default_rng(2).normal(scale=2, size=orig.shape)
+        anon = anon.drop(columns=['c3'])
+        result = compare_correlations(orig.to_numpy().T, list(orig.columns), anon.to_numpy().T, list(anon.columns))
+        shared = [col for col in orig.columns if col in anon.columns]
+        expected = anon[shared].corr() - orig[shared].corr()
+        self.assertEqual(result['drift']['columns'], shared)
+        np.testing.assert_allclose(np.array(result['drift']['matrix'], dtype='float64'), expected.to_numpy(), atol=1e-3)
+        self.assertAlmostEqual(result['drift']['max_abs'], np.abs(expected.to_numpy()).max(), places=3)
+        strongest = result['orig']['top_pairs'][0]
+        self.assertAlmostEqual(strongest['anon_r'], anon.corr().loc[strongest['a'], strongest['b']], places=3)
+
+    def test_top_pairs_and_downsample(self):
+        matrix = np.array([[1, 0.2, -0.9], [0.2, 1, np.nan], [-0.9, np.nan, 1]])
+        self.assertEqual([(p['a'], p['b'], p['r']) for p in top_pairs(matrix, ['x', 'y', 'z'])],
+                         [('x', 'z', -0.9), ('x', 'y', 0.2)])
+        wide = np.ones((10, 10))
+        averaged, names, groups = downsample(wide, [f"c{i}" for i in range(10)], max_columns=4)
+        self.assertEqual(averaged.shape, (4, 4))
+        self.assertEqual(sum(len(group) for group in groups), 10)
+        self.assertEqual(len(names), 4)
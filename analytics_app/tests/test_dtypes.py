@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+
+from analytics_app.benchmarks import make_dataset
+from analytics_app.cache_utils import concat_frames, optimize_dtypes
+from analytics_app.privacy_utils import anonymize_data
+from analytics_app.profile_utils import profile_dataset
+
+
+def loaded_frame(n_rows: int = 3000) -> pd.DataFrame:
+    # Columns as read_csv returns them: int64, float64 and object
+    df = make_dataset(n_rows, 9, seed=6)
+    df['Score_0'] = df['Score_0'].round(1)
+    df['Half'] = np.arange(n_rows) / 2
+    df['Big'] = np.arange(n_rows) * 100_000
+    df['Ratio'] = np.random.default_rng(0).random(n_rows)
+    df.loc[::10, 'Group_2'] = None
+    return df
+
+
+class OptimizeDtypesTests(SimpleTestCase):
+    def setUp(self):
+        self.df = loaded_frame()
+        self.compact = optimize_dtypes(self.df)
+
+    def test_columns_get_compact_dtypes(self):
+        dtypes = self.compact.dtypes
+        self.assertEqual(dtypes['Marks'], np.int16)
+        self.assertEqual(dtypes['Marks_1'], np.int8)
+        self.assertEqual(dtypes['Big'], np.int32)
+        self.assertEqual(dtypes['Half'], np.float32)
+        # float32 would change these values, so they stay float64
+        self.assertEqual(dtypes['Score_0'], np.float64)
+        self.assertEqual(dtypes['Ratio'], np.float64)
+        for col in ('Category', 'Group_2', 'Rank_3'):
+            self.assertIsInstance(dtypes[col], pd.CategoricalDtype, col)
+        # Unique text is kept as (Arrow-backed) strings, never Python objects
+        self.assertIsInstance(dtypes['Name'], pd.StringDtype)
+        self.assertEqual(dtypes['Name'].storage, 'pyarrow')
+        self.assertLess(self.compact.memory_usage(deep=True).sum(), self.df.memory_usage(deep=True).sum())
+
+    def test_values_are_unchanged(self):
+        pd.testing.assert_frame_equal(self.compact.astype(object).where(self.compact.notna(), None),
+                                      self.df.astype(object).where(self.df.notna(), None))
+
+    def test_nullable_and_boolean_columns_are_kept(self):
+        df = pd.DataFrame({'Flag': [True, False, True], 'Count': pd.array([1, None, 3], dtype='Int64'),
+                           'Empty': [None, None, None]})
+        pd.testing.assert_frame_equal(optimize_dtypes(df), df)
+
+    def test_compact_dtypes_are_profiled_and_anonymized_like_the_originals(self):
+        profile, compact_profile = profile_dataset(self.df), profile_dataset(self.compact)
+        self.assertEqual(compact_profile.numeric_columns, profile.numeric_columns)
+        pd.testing.assert_frame_equal(compact_profile.numeric_stats, profile.numeric_stats)
+        self.assertEqual(compact_profile.nunique, profile.nunique)
+
+        release = anonymize_data(self.df, epsilon=1.0, rng=5)
+        compact_release = anonymize_data(self.compact, epsilon=1.0, rng=5)
+        self.assertEqual(list(compact_release.columns), list(release.columns))
+        for col in release.columns:
+            self.assertEqual(compact_release[col].astype(str).tolist(), release[col].astype(str).tolist(), col)
+        # Noise can push downcast integers out of their range, so they are widened
+        self.assertEqual(compact_release['Marks'].dtype, np.int64)
+
+
+class ConcatFramesTests(SimpleTestCase):
+    def test_categories_are_merged(self):
+        first = optimize_dtypes(pd.DataFrame({'Grade': ['A', 'B'] * 5, 'Marks': [1, 2] * 5}))
+        second = optimize_dtypes(pd.DataFrame({'Marks': [300, 400] * 5, 'Grade': ['C', 'A'] * 5}))
+        combined = concat_frames(first, second)
+        self.assertEqual(list(combined.columns), ['Grade', 'Marks'])
+        self.assertIsInstance(combined['Grade'].dtype, pd.CategoricalDtype)
+        self.assertEqual(sorted(combined['Grade'].cat.categories), ['A', 'B', 'C'])
+        self.assertEqual(combined['Grade'].tolist(), ['A', 'B'] * 5 + ['C', 'A'] * 5)
+        self.assertEqual(combined['Marks'].dtype, np.int16)
+        self.assertEqual(combined['Marks'].tolist(), [1, 2] * 5 + [300, 400] * 5)
+
+    def test_numbers_and_text_become_text(self):
+        first = optimize_dtypes(pd.DataFrame({'Code': [1, 2, 1, 2]}))
+        second = optimize_dtypes(pd.DataFrame({'Code': ['x', 'y', 'x', 'y']}))
+        combined = concat_frames(first, second)
+        self.assertEqual(combined['Code'].astype(str).tolist(), ['1', '2', '1', '2', 'x', 'y', 'x', 'y'])
@@ -0,0 +1,113 @@
+import gzip
+import io
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from analytics_app.benchmarks import make_dataset
+from analytics_app.export_utils import export_path, parse_range
+from analytics_app.registry import register_upload
+from analytics_app.release_utils import load_release
+
+from .utils import StoreTestCase
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=990-5000', 1000), (990, 999))
+
+    def test_ignored_headers(self):
+        for header in (None, '', 'items=0-1', 'bytes=0-1,5-6', 'bytes=5-3', 'bytes=a-b', 'bytes=-'):
+            self.assertIsNone(parse_range(header, 1000), header)
+
+    def test_unsatisfiable(self):
+        for header, size in (('bytes=1000-', 1000), ('bytes=-0', 1000), ('bytes=-5', 0)):
+            with self.assertRaises(ValueError):
+                parse_range(header, size)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class ExportViewTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('analyst', password='pw-12345678')
+        self.client.force_login(self.user)
+        self.path, self.digest = self.stored_dataset(make_dataset(3000, 8))
+        version = register_upload(self.user, self.path, self.digest, 'marks.csv')
+        session = self.client.session
+        session['dataset_version'] = version.pk
+        session.save()
+
+    def get(self, fmt='csv', **headers):
+        return self.client.get(reverse('export_release'), {'format': fmt, 'epsilon': 1}, headers=headers)
+
+    def test_formats_hold_the_release(self):
+        release = load_release(self.path, epsilon=1.0, digest=self.digest)
+        csv = pd.read_csv(io.BytesIO(b''.join(self.get('csv').streaming_content)))
+        self.assertEqual(list(csv.columns), list(release.columns))
+        self.assertEqual(len(csv), len(release))
+        gz = b''.join(self.get('csv.gz').streaming_content)
+        self.assertEqual(len(pd.read_csv(io.BytesIO(gzip.decompress(gz)))), len(release))
+        parquet = pq.read_table(io.BytesIO(b''.join(self.get('parquet').streaming_content)))
+        self.assertEqual(parquet.num_rows, len(release))
+
+    def test_first_download_is_streamed_and_stored(self):
+        path = export_path(self.digest, 1.0, 'csv')
+        response = self.get(Range='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Length', response)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('marks_anonymized_e1.csv', response['Content-Disposition'])
+        chunks = iter(response.streaming_content)
+        first = next(chunks)
+        # Bytes are sent before the export is complete, which is only published at the end
+        self.assertFalse(os.path.exists(path))
+        body = first + b''.join(chunks)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), body)
+
+        stored = self.get()
+        self.assertEqual(stored['Content-Length'], str(len(body)))
+        self.assertEqual(stored['ETag'], response['ETag'])
+        self.assertEqual(b''.join(stored.streaming_content), body)
+
+    def test_interrupted_first_download_is_not_stored(self):
+        path = export_path(self.digest, 1.0, 'csv')
+        response = self.get()
+        chunks = iter(response.streaming_content)
+        next(chunks)
+        response.close()
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual([name for name in os.listdir(os.path.dirname(path)) if name.endswith('.tmp')], [])
+
+    def test_range_requests(self):
+        full = self.get()
+        body, etag = b''.join(full.streaming_content), full['ETag']
+
+        partial = self.get(Range='bytes=100-199')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(b''.join(partial.streaming_content), body[100:200])
+        self.assertEqual(partial['Content-Range'], f"bytes 100-199/{len(body)}")
+
+        suffix = self.get(Range='bytes=-50', **{'If-Range': etag})
+        self.assertEqual(suffix.status_code, 206)
+        self.assertEqual(b''.join(suffix.streaming_content), body[-50:])
+
+        unsatisfiable = self.get(Range=f'bytes={len(body)}-')
+        self.assertEqual(unsatisfiable.status_code, 416)
+        self.assertEqual(unsatisfiable['Content-Range'], f"bytes */{len(body)}")
+
+        # A partial copy of other bytes gets the whole export again
+        stale = self.get(Range='bytes=100-199', **{'If-Range': '"other"'})
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(b''.join(stale.streaming_content), body)
+
+    def test_unknown_format(self):
+        self.assertEqual(self.get('xlsx').status_code, 400)
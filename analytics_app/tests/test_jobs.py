@@ -0,0 +1,115 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from analytics_app.benchmarks import make_dataset
+from analytics_app.cache_utils import arrow_rows, dataset_files
+from analytics_app.jobs import claim_next_job, enqueue_analysis, heartbeat, requeue_stale_jobs, run_job
+from analytics_app.models import AnalysisJob
+from analytics_app.registry import register_upload
+from analytics_app.release_utils import release_path
+
+from .utils import StoreTestCase
+
+
+class JobLifecycleTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('analyst', password='pw-12345678')
+
+    def test_enqueue_reuses_the_latest_job(self):
+        job = enqueue_analysis(self.user, '/data.csv', digest='abc', epsilon=1.0)
+        self.assertEqual(enqueue_analysis(self.user, '/data.csv', digest='abc', epsilon=1.0).pk, job.pk)
+        self.assertNotEqual(enqueue_analysis(self.user, '/data.csv', digest='abc', epsilon=2.0).pk, job.pk)
+
+    def test_failed_job_is_only_rerun_on_retry(self):
+        job = enqueue_analysis(self.user, '/data.csv', digest='abc')
+        AnalysisJob.objects.filter(pk=job.pk).update(status=AnalysisJob.STATUS_FAILED, error='boom')
+
+        again = enqueue_analysis(self.user, '/data.csv', digest='abc')
+        self.assertEqual((again.pk, again.status), (job.pk, AnalysisJob.STATUS_FAILED))
+        self.assertEqual(AnalysisJob.objects.count(), 1)
+
+        retried = enqueue_analysis(self.user, '/data.csv', digest='abc', retry=True)
+        self.assertEqual((retried.pk, retried.status, retried.error), (job.pk, AnalysisJob.STATUS_QUEUED, ''))
+        self.assertEqual(AnalysisJob.objects.count(), 1)
+
+    def test_only_expired_leases_are_requeued(self):
+        live = enqueue_analysis(self.user, '/a.csv', digest='a')
+        dead = enqueue_analysis(self.user, '/b.csv', digest='b')
+        self.assertIsNotNone(claim_next_job())
+        self.assertIsNotNone(claim_next_job())
+        self.assertIsNone(claim_next_job())
+        AnalysisJob.objects.filter(pk=dead.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=600))
+        heartbeat([live.pk])
+
+        self.assertEqual(requeue_stale_jobs(lease_seconds=120), 1)
+        self.assertEqual(AnalysisJob.objects.get(pk=live.pk).status, AnalysisJob.STATUS_RUNNING)
+        self.assertEqual(AnalysisJob.objects.get(pk=dead.pk).status, AnalysisJob.STATUS_QUEUED)
+        # A requeued job can be claimed again, a running one cannot
+        self.assertEqual(claim_next_job().pk, dead.pk)
+
+    def test_run_job_stores_charts(self):
+        path, digest = self.stored_dataset(make_dataset(500, 8))
+        job = enqueue_analysis(self.user, path, digest=digest)
+        claim_next_job()
+        self.assertEqual(run_job(job.pk), AnalysisJob.STATUS_DONE)
+        job.refresh_from_db()
+        self.assertEqual((job.progress, job.error), (100, ''))
+        self.assertIn('charts', job.result)
+        self.assertIn('timings', job.result)
+
+    @override_settings(ANALYSIS_SAMPLE_ROWS=300)
+    def test_large_datasets_are_compared_on_a_sample(self):
+        path, digest = self.stored_dataset(make_dataset(1000, 8))
+        dataset_files(path, clean=True, digest=digest)
+        job = enqueue_analysis(self.user, path, digest=digest)
+        claim_next_job()
+        with mock.patch('analytics_app.cache_utils.load_dataset', side_effect=AssertionError("loaded")):
+            self.assertEqual(run_job(job.pk), AnalysisJob.STATUS_DONE)
+        job.refresh_from_db()
+        self.assertEqual(job.result['sample'], {'rows': 300, 'of': 1000})
+        self.assertIn('charts', job.result)
+        # The release itself covers every row
+        self.assertEqual(arrow_rows([release_path(digest, 1.0)]), 1000)
+
+    def test_run_job_records_failure(self):
+        job = enqueue_analysis(self.user, '/missing/data.csv', digest='0' * 64)
+        claim_next_job()
+        self.assertEqual(run_job(job.pk), AnalysisJob.STATUS_FAILED)
+        job.refresh_from_db()
+        self.assertIn('Error reading the dataset', job.error)
+        self.assertIsNotNone(job.finished_at)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class VisualizeFailureTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('analyst', password='pw-12345678')
+        self.client.force_login(self.user)
+        path, digest = self.stored_dataset(make_dataset(200, 6))
+        version = register_upload(self.user, path, digest, 'data.csv')
+        session = self.client.session
+        session['dataset_version'] = version.pk
+        session.save()
+        self.job = enqueue_analysis(self.user, path, digest=digest, epsilon=1.0)
+        AnalysisJob.objects.filter(pk=self.job.pk).update(status=AnalysisJob.STATUS_FAILED, error='Bad column')
+
+    def test_failed_job_is_shown_without_queueing_another(self):
+        for _ in range(3):
+            response = self.client.get(reverse('visualize'), {'epsilon': 1})
+            self.assertContains(response, 'Bad column')
+            self.assertContains(response, 'Try again')
+        self.assertEqual(AnalysisJob.objects.count(), 1)
+        self.assertEqual(AnalysisJob.objects.get().status, AnalysisJob.STATUS_FAILED)
+
+    def test_retry_requeues_the_failed_job(self):
+        response = self.client.post(f"{reverse('visualize')}?epsilon=1")
+        self.assertRedirects(response, f"{reverse('visualize')}?epsilon=1", fetch_redirect_response=False)
+        self.assertEqual(AnalysisJob.objects.count(), 1)
+        self.assertEqual(AnalysisJob.objects.get().status, AnalysisJob.STATUS_QUEUED)
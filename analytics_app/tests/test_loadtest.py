@@ -0,0 +1,103 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+from django.test import LiveServerTestCase, SimpleTestCase, override_settings
+
+from analytics_app.benchmarks import make_dataset
+from analytics_app.loadtest import (Recorder, VirtualUser, _percentile, _process_tree, compare_loadtests,
+                                    summarize)
+
+from .utils import run_inline, write_csv
+
+
+def recorded(latencies: dict, errors: dict = None) -> Recorder:
+    recorder = Recorder()
+    for endpoint, seconds in latencies.items():
+        for i, value in enumerate(seconds):
+            recorder.record(endpoint, value, i < len(seconds) - (errors or {}).get(endpoint, 0), 'HTTP 500')
+    return recorder
+
+
+class SummaryTests(SimpleTestCase):
+    def test_percentiles_are_nearest_rank(self):
+        ordered = list(range(1, 101))
+        self.assertEqual([_percentile(ordered, q) for q in (50, 95, 99)], [50, 95, 99])
+        self.assertEqual([_percentile(list(range(1, 11)), q) for q in (50, 95, 99)], [5, 10, 10])
+        self.assertEqual(_percentile([7], 99), 7)
+
+    def test_summarize(self):
+        recorder = recorded({'dashboard': [i / 1000 for i in range(1, 101)], 'upload': [0.5] * 10,
+                             'visualize:ready': [3.0]}, errors={'upload': 2})
+        recorder.finish_flow(True)
+        summary = summarize(recorder, duration=10.0)
+        self.assertEqual(summary['requests'], 110)
+        self.assertEqual(summary['throughput_rps'], 11.0)
+        self.assertEqual(summary['error_rate'], round(2 / 110, 4))
+        self.assertEqual(summary['flows'], {'completed': 1, 'failed': 0})
+        self.assertEqual(summary['endpoints']['dashboard']['p95_ms'], 95.0)
+        self.assertEqual(summary['endpoints']['upload']['error_rate'], 0.2)
+        self.assertEqual(summary['failures'], ['upload: HTTP 500'] * 2)
+        self.assertNotIn('login', summary['endpoints'])
+
+    def test_regressions_are_flagged(self):
+        baseline = summarize(recorded({'dashboard': [0.1] * 20}), duration=10.0)
+        faster = summarize(recorded({'dashboard': [0.1] * 20}), duration=9.0)
+        self.assertFalse(any(c['regression'] for c in compare_loadtests(faster, baseline)))
+
+        slower = summarize(recorded({'dashboard': [0.1] * 10 + [0.5] * 10}, errors={'dashboard': 1}), duration=20.0)
+        flagged = {c['metric'] for c in compare_loadtests(slower, baseline) if c['regression']}
+        # Errors where the baseline had none count even though the ratio is undefined
+        self.assertEqual(flagged, {'throughput_rps', 'error_rate', 'dashboard p95_ms'})
+
+    def test_process_tree_includes_children(self):
+        child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+        self.addCleanup(child.wait)
+        self.addCleanup(child.kill)
+        tree = _process_tree(os.getpid())
+        self.assertEqual(tree[0], os.getpid())
+        self.assertIn(child.pid, tree)
+
+
+@override_settings(ALLOWED_HOSTS=['localhost', '127.0.0.1', 'testserver'])
+class VirtualUserTests(LiveServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.mkdtemp(prefix='analytics_test_')
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        dirs = override_settings(
+            MEDIA_ROOT=os.path.join(self.tmp_dir, 'media'),
+            UPLOAD_STORE_DIR=os.path.join(self.tmp_dir, 'uploads'),
+            DATASET_CACHE_DIR=os.path.join(self.tmp_dir, 'cache'),
+            RELEASE_STORE_DIR=os.path.join(self.tmp_dir, 'releases'),
+        )
+        dirs.enable()
+        self.addCleanup(dirs.disable)
+        pool = mock.patch('analytics_app.pool_utils._submit', side_effect=run_inline)
+        pool.start()
+        self.addCleanup(pool.stop)
+
+    def test_flow_up_to_the_dashboard(self):
+        recorder = Recorder()
+        user = VirtualUser(self.live_server_url, 'loadtest-flow', recorder)
+        user.signup()
+        user.login()
+        user.upload(write_csv(make_dataset(300, 6), os.path.join(self.tmp_dir, 'data.csv')))
+        user.dashboard(1.0)
+        self.assertEqual(recorder.errors, {}, recorder.failures)
+        self.assertEqual(sorted(recorder.latencies), ['dashboard', 'login', 'signup', 'upload'])
+        # The form pages are fetched for their CSRF token before each post
+        self.assertEqual(len(recorder.latencies['upload']), 2)
+
+    def test_failed_step_ends_the_flow(self):
+        recorder = Recorder()
+        user = VirtualUser(self.live_server_url, 'loadtest-fail', recorder)
+        # Logging in without an account re-renders the form instead of redirecting
+        with mock.patch.object(user, 'signup'):
+            user.run(os.path.join(self.tmp_dir, 'missing.csv'), 1.0)
+        self.assertEqual(recorder.flows, {'completed': 0, 'failed': 1})
+        self.assertEqual(recorder.errors, {'login': 1})
+        self.assertNotIn('upload', recorder.latencies)
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+
+from analytics_app.benchmarks import make_dataset
+from analytics_app.privacy_utils import (RANK_LABELS, add_laplace_noise, anonymize_data, noise_scale, rank_buckets,
+                                         round_columns, unit_laplace)
+
+
+class LaplaceNoiseTests(SimpleTestCase):
+    def test_unit_laplace_has_laplace_moments(self):
+        noise = unit_laplace(np.random.default_rng(0), 200_000, 2)
+        self.assertEqual(noise.shape, (200_000, 2))
+        # Laplace(0, 1): mean 0, variance 2, mean absolute deviation 1
+        np.testing.assert_allclose(noise.mean(axis=0), 0, atol=0.02)
+        np.testing.assert_allclose(noise.var(axis=0), 2, rtol=0.03)
+        np.testing.assert_allclose(np.abs(noise).mean(axis=0), 1, rtol=0.02)
+
+    def test_noise_is_scaled_and_rounded_per_column(self):
+        block = np.zeros((100_000, 2))
+        add_laplace_noise(block, np.array([1.0, 10.0]), np.array([2, 0]), np.random.default_rng(1))
+        np.testing.assert_allclose(np.abs(block).mean(axis=0), [1, 10], rtol=0.03)
+        np.testing.assert_array_equal(block[:, 1], np.rint(block[:, 1]))
+        np.testing.assert_array_equal(block[:, 0], np.round(block[:, 0], 2))
+
+    def test_round_columns(self):
+        block = np.array([[1.23456, 1.6], [-2.98765, 2.5]])
+        np.testing.assert_array_equal(round_columns(block, np.array([2, 0])), [[1.23, 2.0], [-2.99, 2.0]])
+
+    def test_noise_scale(self):
+        self.assertEqual(noise_scale(100, 1.0), 10)
+        self.assertEqual(noise_scale(100, 0.5), 20)
+
+
+class AnonymizeDataNoiseTests(SimpleTestCase):
+    def setUp(self):
+        self.df = make_dataset(5000, 9, seed=4)
+        self.df.loc[::9, 'Score_0'] = np.nan
+
+    def test_same_seed_gives_the_same_release(self):
+        first = anonymize_data(self.df, epsilon=1.0, rng=11)
+        pd.testing.assert_frame_equal(first, anonymize_data(self.df, epsilon=1.0, rng=11))
+        pd.testing.assert_frame_equal(first, anonymize_data(self.df, epsilon=1.0, rng=np.random.default_rng(11)))
+        self.assertFalse(first['Marks'].equals(anonymize_data(self.df, epsilon=1.0, rng=12)['Marks']))
+
+    def test_input_is_left_untouched_and_dtypes_kept(self):
+        original = self.df.copy()
+        release = anonymize_data(self.df, epsilon=1.0, rng=0)
+        pd.testing.assert_frame_equal(self.df, original)
+        self.assertEqual(release['Marks'].dtype, np.int64)
+        self.assertEqual(release['Score_0'].dtype, np.float64)
+        # Missing values stay missing, present ones get noise
+        pd.testing.assert_series_equal(release['Score_0'].isna(), original['Score_0'].isna())
+        self.assertGreater((release['Marks'] != original['Marks']).mean(), 0.9)
+
+    def test_noise_spread_follows_epsilon(self):
+        data_range = self.df['Marks'].max() - self.df['Marks'].min()
+        for epsilon in (0.5, 2.0):
+            release = anonymize_data(self.df, epsilon=epsilon, rng=3)
+            spread = (release['Marks'] - self.df['Marks']).abs().mean()
+            self.assertAlmostEqual(spread / noise_scale(data_range, epsilon), 1, delta=0.1)
+
+    def test_rank_buckets_match_qcut(self):
+        series = self.df['Rank_3']
+        expected = pd.qcut(series.rank(method='first'), q=5, labels=RANK_LABELS)
+        self.assertEqual(rank_buckets(series, series.value_counts()).tolist(), expected.tolist())
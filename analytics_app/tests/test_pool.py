@@ -0,0 +1,143 @@
+import asyncio
+import os
+from concurrent.futures import Future
+from unittest import mock
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from analytics_app import pool_utils, views
+from analytics_app.benchmarks import make_dataset
+from analytics_app.pool_utils import PoolSaturated, run_in_pool, saturated, submit
+from analytics_app.timing_utils import HISTOGRAM, collect, stage
+
+from .utils import StoreTestCase
+
+def record_stage(name: str) -> int:
+    # Runs in a pool worker
+    with stage(name):
+        return os.getpid()
+
+
+@override_settings(CPU_POOL_MAX_PENDING=2)
+class PendingLimitTests(SimpleTestCase):
+    def test_submit_refuses_work_past_the_limit(self):
+        futures = []
+        with mock.patch.object(pool_utils, '_submit', side_effect=lambda *args: futures.append(Future()) or futures[-1]):
+            submit(print)
+            submit(print)
+            self.assertTrue(saturated())
+            with self.assertRaises(PoolSaturated):
+                submit(print)
+            # What run_collected returns: (result, stage timings, pid)
+            futures[0].set_result((None, [], os.getpid()))
+            self.assertFalse(saturated())
+            submit(print)
+            for future in futures[1:]:
+                future.set_result((None, [], os.getpid()))
+        self.assertFalse(saturated())
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], CPU_POOL_MAX_PENDING=0)
+class SaturatedViewTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('analyst', password='pw-12345678'))
+
+    def assertBusy(self, response):
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+
+    def test_upload_answers_503(self):
+        # Data of its own: a conversion this process already ran is reused rather than queued
+        upload = SimpleUploadedFile('data.csv', make_dataset(50, seed=15).to_csv(index=False).encode(), content_type='text/csv')
+        self.assertBusy(self.client.post(reverse('upload'), {'file': upload}))
+        self.assertIsNone(self.client.session.get('dataset_version'))
+
+    @override_settings(CPU_POOL_MAX_PENDING=1)
+    def test_dashboard_answers_503(self):
+        upload = SimpleUploadedFile('data.csv', make_dataset(50).to_csv(index=False).encode(), content_type='text/csv')
+        self.assertRedirects(self.client.post(reverse('upload'), {'file': upload}), reverse('dashboard'),
+                             fetch_redirect_response=False)
+        with override_settings(CPU_POOL_MAX_PENDING=0):
+            self.assertBusy(self.client.get(reverse('dashboard')))
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class EventLoopTests(SimpleTestCase):
+    def test_views_are_async(self):
+        for view in (views.upload_file, views.dashboard, views.visualize, views.export_release,
+                     views.append_file, views.anonymize_batch):
+            self.assertTrue(iscoroutinefunction(view), view.__name__)
+
+    async def test_requests_are_served_while_a_pooled_call_runs(self):
+        worker_future = Future()
+        with mock.patch.object(pool_utils, '_submit', return_value=worker_future):
+            pooled = asyncio.ensure_future(run_in_pool(print))
+            await asyncio.sleep(0)
+            response = await self.async_client.get(reverse('login'))
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(pooled.done())
+            worker_future.set_result(('done', [], os.getpid()))
+            self.assertEqual(await pooled, 'done')
+        self.assertFalse(saturated())
+
+
+@override_settings(CPU_POOL_MAX_PENDING=1)
+class CancelledCallTests(SimpleTestCase):
+    async def test_running_call_keeps_its_slot_after_the_caller_leaves(self):
+        worker_future = Future()
+        worker_future.set_running_or_notify_cancel()
+        with mock.patch.object(pool_utils, '_submit', return_value=worker_future):
+            pooled = asyncio.ensure_future(run_in_pool(print))
+            await asyncio.sleep(0)
+            # The client disconnects: the request's task is cancelled, the worker keeps running
+            pooled.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await pooled
+            self.assertTrue(saturated())
+            with self.assertRaises(PoolSaturated):
+                submit(print)
+            with self.assertNoLogs('concurrent.futures', level='ERROR'):
+                worker_future.set_result((None, [], os.getpid()))
+        self.assertFalse(saturated())
+
+    async def test_queued_call_is_dropped_with_its_caller(self):
+        worker_future = Future()
+        with mock.patch.object(pool_utils, '_submit', return_value=worker_future):
+            pooled = asyncio.ensure_future(run_in_pool(print))
+            await asyncio.sleep(0)
+            pooled.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await pooled
+        self.assertTrue(worker_future.cancelled())
+        self.assertFalse(saturated())
+
+
+class WorkerTimingTests(SimpleTestCase):
+    def tearDown(self):
+        pool_utils._reset_pool()
+
+    def test_worker_stages_reach_the_request_and_the_histogram(self):
+        with collect() as timings:
+            pid = async_to_sync(run_in_pool)(record_stage, 'test:worker_stage')
+        self.assertNotEqual(pid, os.getpid())
+        self.assertEqual([name for name, _ in timings], ['test:worker_stage'])
+        self.assertEqual(HISTOGRAM.snapshot()['test:worker_stage']['count'], 1)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class ServerTimingTests(StoreTestCase):
+    def test_pooled_stages_are_in_server_timing(self):
+        self.client.force_login(User.objects.create_user('analyst', password='pw-12345678'))
+        upload = SimpleUploadedFile('data.csv', make_dataset(80, seed=16).to_csv(index=False).encode(),
+                                    content_type='text/csv')
+        self.client.post(reverse('upload'), {'file': upload})
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        # preview_release ran on the pool and anonymized the dataset there
+        self.assertIn('anonymize;dur=', response['Server-Timing'])
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+
+from analytics_app.benchmarks import make_dataset
+from analytics_app.privacy_utils import anonymize_data
+from analytics_app.profile_utils import MAX_TRACKED_VALUES, STAT_ROWS, profile_dataset
+
+
+def mixed_frame(n_rows: int = 2000) -> pd.DataFrame:
+    df = make_dataset(n_rows, 9, seed=5)
+    df.loc[::7, 'Score_0'] = np.nan
+    df.loc[::13, 'Group_2'] = np.nan
+    df['Small'] = df['Marks_1'].astype('int8')
+    df['Nullable'] = pd.array(df['Marks'], dtype='Int64')
+    df.loc[::5, 'Nullable'] = pd.NA
+    df['Category'] = df['Category'].astype('category').cat.add_categories(['Unused'])
+    df['Codes'] = np.where(np.arange(n_rows) % 4, (np.arange(n_rows) % 10).astype(str), 'n/a')
+    df['Passed'] = df['Marks'] > 150
+    df['Empty'] = np.nan
+    return df
+
+
+class ProfileDatasetTests(SimpleTestCase):
+    def setUp(self):
+        self.df = mixed_frame()
+        self.profile = profile_dataset(self.df)
+
+    def test_numeric_stats_match_describe(self):
+        numeric = self.df.drop(columns=['Passed'])
+        expected = numeric.describe().transpose()[STAT_ROWS]
+        stats = self.profile.numeric_stats
+        self.assertEqual(sorted(stats.index), sorted(expected.index))
+        pd.testing.assert_frame_equal(stats.loc[expected.index].astype('float64'), expected.astype('float64'),
+                                      check_names=False)
+
+    def test_counts_match_pandas(self):
+        self.assertEqual(self.profile.n_rows, len(self.df))
+        self.assertEqual(self.profile.null_counts, self.df.isna().sum().to_dict())
+        for col in ('Name', 'Category', 'Group_2', 'Rank_3', 'Codes', 'Passed'):
+            series = self.df[col]
+            self.assertEqual(self.profile.nunique[col], series.nunique(), col)
+            if series.nunique() <= MAX_TRACKED_VALUES:
+                counts = series.value_counts()
+                self.assertEqual(self.profile.value_counts[col].to_dict(), counts[counts > 0].to_dict(), col)
+            else:
+                self.assertNotIn(col, self.profile.value_counts)
+        # Unused categories are not counted as values
+        self.assertNotIn('Unused', self.profile.value_counts['Category'])
+
+    def test_numeric_like_counts_parsable_text(self):
+        for col in ('Codes', 'Category', 'Name'):
+            expected = int(pd.to_numeric(self.df[col].astype(object), errors='coerce').notna().sum())
+            self.assertEqual(self.profile.numeric_like[col], expected, col)
+        self.assertEqual(self.profile.coerced_null_count('Codes'), (self.df['Codes'] == 'n/a').sum())
+        self.assertNotIn('Passed', self.profile.numeric_like)
+
+    def test_anonymize_data_reuses_the_profile(self):
+        expected = anonymize_data(self.df, epsilon=1.0, rng=2)
+        shared = anonymize_data(self.df, epsilon=1.0, profile=self.profile, rng=2)
+        pd.testing.assert_frame_equal(shared, expected)
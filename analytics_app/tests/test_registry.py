@@ -0,0 +1,109 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+
+from analytics_app.benchmarks import make_dataset
+from analytics_app.cache_utils import load_profile
+from analytics_app.models import Dataset, DatasetVersion, Release
+from analytics_app.registry import (record_release, register_append, register_upload, save_metadata,
+                                    version_metadata)
+
+from .utils import StoreTestCase
+
+
+class RegistryTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('analyst', password='pw-12345678')
+        self.path, self.digest = self.stored_dataset(make_dataset(400, 6))
+
+    def test_uploading_the_same_content_reopens_the_dataset(self):
+        version = register_upload(self.user, self.path, self.digest, 'marks.csv')
+        self.assertEqual((version.number, version.name, version.file_hash), (1, 'marks.csv', self.digest))
+        self.assertEqual(register_upload(self.user, self.path, self.digest, 'again.csv').pk, version.pk)
+        self.assertEqual(Dataset.objects.get().current_version_id, version.pk)
+
+        # Each user has their own datasets
+        other = User.objects.create_user('other', password='pw-12345678')
+        self.assertNotEqual(register_upload(other, self.path, self.digest, 'marks.csv').pk, version.pk)
+        self.assertEqual(Dataset.objects.count(), 2)
+
+    def test_appends_add_numbered_versions(self):
+        first = register_upload(self.user, self.path, self.digest, 'base.csv')
+        second = register_append(first, '/chain-a', 'a' * 64, 'day1.csv')
+        third = register_append(second, '/chain-b', 'b' * 64, 'day2.csv')
+        self.assertEqual([second.number, third.number], [2, 3])
+        self.assertEqual(third.name, 'base.csv + day1.csv + day2.csv')
+        self.assertEqual(third.parent_id, second.pk)
+        # Appending the same rows again gives the existing version back, as the current one
+        self.assertEqual(register_append(first, '/chain-a', 'a' * 64, 'day1.csv').pk, second.pk)
+        self.assertEqual(Dataset.objects.get().current_version_id, second.pk)
+        self.assertEqual(DatasetVersion.objects.count(), 3)
+
+    def test_metadata_comes_from_the_profile(self):
+        version = register_upload(self.user, self.path, self.digest, 'marks.csv')
+        self.assertFalse(version.described)
+        metadata = version_metadata(self.path, self.digest)
+        json.dumps(metadata, allow_nan=False)
+        save_metadata(version, metadata)
+
+        version = DatasetVersion.objects.get(pk=version.pk)
+        profile = load_profile(self.path, clean=True, digest=self.digest)
+        self.assertTrue(version.described)
+        self.assertEqual((version.n_rows, version.n_columns), (400, 6))
+        self.assertEqual([col for col, _ in version.schema], profile.columns)
+        self.assertEqual(version.profile['numeric_stats']['Marks']['mean'],
+                         profile.numeric_stats.loc['Marks', 'mean'])
+        self.assertEqual(version.profile['nunique']['Category'], profile.nunique['Category'])
+
+    def test_releases_are_recorded_once(self):
+        version = register_upload(self.user, self.path, self.digest, 'marks.csv')
+        release = record_release(version, 1.0)
+        self.assertEqual(record_release(version, 1.0).pk, release.pk)
+        record_release(version, 0.5)
+        self.assertEqual(list(version.releases.values_list('epsilon', flat=True)), [0.5, 1.0])
+        self.assertEqual(Release.objects.count(), 2)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class DatasetViewTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('analyst', password='pw-12345678')
+        self.client.force_login(self.user)
+        path, digest = self.stored_dataset(make_dataset(200, 5))
+        self.version = register_upload(self.user, path, digest, 'marks.csv')
+        other = User.objects.create_user('other', password='pw-12345678')
+        self.foreign = register_upload(other, path, digest, 'theirs.csv')
+
+    def test_list_shows_only_the_users_datasets(self):
+        response = self.client.get(reverse('datasets'))
+        self.assertContains(response, 'marks.csv')
+        self.assertNotContains(response, 'theirs.csv')
+
+    def test_open_sets_the_session_version(self):
+        url = reverse('open_dataset', args=[self.version.dataset_id])
+        self.assertRedirects(self.client.post(url), reverse('dashboard'), fetch_redirect_response=False)
+        self.assertEqual(self.client.session['dataset_version'], self.version.pk)
+        foreign = reverse('open_dataset', args=[self.foreign.dataset_id])
+        self.assertEqual(self.client.post(foreign).status_code, 404)
+
+    def test_dashboard_describes_the_version_once(self):
+        session = self.client.session
+        session['dataset_version'] = self.version.pk
+        session.save()
+        with mock.patch('analytics_app.views.version_metadata', wraps=version_metadata) as describe:
+            for _ in range(2):
+                self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        self.assertEqual(describe.call_count, 1)
+        self.version.refresh_from_db()
+        self.assertEqual(self.version.n_rows, 200)
+        self.assertEqual(list(self.version.releases.values_list('epsilon', flat=True)), [1.0])
+
+        # Another user's version in the session is not served
+        session['dataset_version'] = self.foreign.pk
+        session.save()
+        self.assertRedirects(self.client.get(reverse('dashboard')), reverse('upload'), fetch_redirect_response=False)
@@ -0,0 +1,106 @@
+import os
+from unittest import mock
+
+import pandas as pd
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+
+from analytics_app import privacy_utils, release_utils
+from analytics_app.benchmarks import make_dataset
+from analytics_app.privacy_utils import anonymization_plan, anonymize_data
+from analytics_app.profile_utils import profile_dataset
+from analytics_app.registry import register_upload
+from analytics_app.release_utils import (load_plan, load_release, preview_release, publish_release, release_path,
+                                         stored_epsilons)
+
+from .utils import StoreTestCase
+
+
+class ReleaseStoreTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path, self.digest = self.stored_dataset(make_dataset(2500, 8))
+
+    def test_release_is_anonymized_once(self):
+        with mock.patch('analytics_app.release_utils.anonymize_data', wraps=anonymize_data) as anonymize:
+            first = load_release(self.path, epsilon=1.0, digest=self.digest)
+            again = load_release(self.path, epsilon=1.0, digest=self.digest)
+        self.assertEqual(anonymize.call_count, 1)
+        # The same noise is served every time
+        pd.testing.assert_frame_equal(first, again)
+        self.assertTrue(os.path.exists(release_path(self.digest, 1.0)))
+
+    def test_releases_are_keyed_by_epsilon_and_version(self):
+        low = load_release(self.path, epsilon=0.5, digest=self.digest)
+        high = load_release(self.path, epsilon=2.0, digest=self.digest)
+        self.assertFalse(low['Marks'].equals(high['Marks']))
+        self.assertEqual(stored_epsilons(self.digest), [0.5, 2.0])
+
+        version = privacy_utils.ANONYMIZATION_VERSION + 1
+        with mock.patch.object(release_utils, 'ANONYMIZATION_VERSION', version):
+            self.assertTrue(release_path(self.digest, 0.5).endswith(f".v{version}.arrow"))
+            self.assertEqual(stored_epsilons(self.digest), [])
+            load_release(self.path, epsilon=0.5, digest=self.digest)
+            self.assertEqual(stored_epsilons(self.digest), [0.5])
+
+    def test_preview_reads_the_first_rows_of_the_release(self):
+        with mock.patch.object(release_utils, 'RELEASE_BATCH_ROWS', 100):
+            preview = preview_release(self.path, epsilon=1.0, n_rows=10, digest=self.digest)
+        release = load_release(self.path, epsilon=1.0, digest=self.digest)
+        pd.testing.assert_frame_equal(preview, release.head(10))
+        self.assertEqual(len(preview_release(self.path, epsilon=1.0, n_rows=250, digest=self.digest)), 250)
+
+    def test_first_published_release_wins(self):
+        release = load_release(self.path, epsilon=1.0, digest=self.digest)
+        path = release_path(self.digest, 1.0)
+        df = make_dataset(50, 8)
+        plan = anonymization_plan(profile_dataset(df), 1.0)
+        self.assertFalse(publish_release(anonymize_data(df, rng=1), path, plan))
+        pd.testing.assert_frame_equal(load_release(self.path, epsilon=1.0, digest=self.digest), release)
+        self.assertEqual(load_plan(self.path, epsilon=1.0, digest=self.digest).n_rows, len(release))
+        self.assertEqual([name for name in os.listdir(os.path.dirname(path)) if name.endswith('.tmp')], [])
+
+    @override_settings(MAX_OTHER_RELEASES=2)
+    def test_releases_at_other_epsilons_are_capped(self):
+        for epsilon in (0.3, 0.7):
+            load_release(self.path, epsilon=epsilon, digest=self.digest)
+        with self.assertRaisesMessage(ValueError, 'already has releases'):
+            load_release(self.path, epsilon=0.9, digest=self.digest)
+        # Existing releases and the page epsilons are still served
+        load_release(self.path, epsilon=0.7, digest=self.digest)
+        load_release(self.path, epsilon=2.0, digest=self.digest)
+        with self.assertRaisesMessage(ValueError, 'up to'):
+            load_release(self.path, epsilon=1e300, digest=self.digest)
+        self.assertEqual(stored_epsilons(self.digest), [0.3, 0.7, 2.0])
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class DashboardReleaseTests(StoreTestCase):
+    def test_refreshing_the_dashboard_shows_the_same_noise(self):
+        user = User.objects.create_user('analyst', password='pw-12345678')
+        self.client.force_login(user)
+        path, digest = self.stored_dataset(make_dataset(500, 6))
+        session = self.client.session
+        session['dataset_version'] = register_upload(user, path, digest, 'data.csv').pk
+        session.save()
+
+        first = self.client.get(reverse('dashboard'))
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.context['table'], self.client.get(reverse('dashboard')).context['table'])
+        self.assertEqual(stored_epsilons(digest), [1.0])
+
+    def test_only_release_epsilons_are_accepted(self):
+        user = User.objects.create_user('analyst', password='pw-12345678')
+        self.client.force_login(user)
+        path, digest = self.stored_dataset(make_dataset(500, 6))
+        session = self.client.session
+        session['dataset_version'] = register_upload(user, path, digest, 'data.csv').pk
+        session.save()
+
+        for epsilon in ('1.0000001', '1e300', 'abc'):
+            with self.subTest(epsilon=epsilon):
+                for view in ('dashboard', 'export_release'):
+                    self.assertEqual(self.client.get(reverse(view), {'epsilon': epsilon}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('dashboard'), {'epsilon': '0.5'}).status_code, 200)
+        self.assertEqual(stored_epsilons(digest), [0.5])
@@ -0,0 +1,109 @@
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase, override_settings
+
+from analytics_app.benchmarks import make_dataset
+from analytics_app.cache_utils import load_dataset, load_profile
+from analytics_app.sketch_utils import ColumnSketch, FrequencySketch, HyperLogLog, KLLSketch
+from analytics_app.viz_utils import approximation_note, generate_basic_stats
+
+from .utils import StoreTestCase
+
+
+class SketchAccuracyTests(SimpleTestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_hyperloglog_estimate_and_merge(self):
+        values = pd.Series(np.arange(200_000))
+        whole, first, second = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        whole.update(values)
+        first.update(values.iloc[:120_000])
+        # Overlapping halves: a merge counts the union
+        second.update(values.iloc[80_000:])
+        first.merge(second)
+        np.testing.assert_array_equal(first.registers, whole.registers)
+        self.assertLess(abs(whole.estimate() - 200_000) / 200_000, 3 * whole.relative_error)
+        small = HyperLogLog()
+        small.update(pd.Series(['a', 'b', 'c', 'a']))
+        self.assertEqual(small.estimate(), 3)
+
+    def test_kll_quantiles_within_rank_error(self):
+        values = self.rng.normal(size=300_000)
+        whole, first, second = KLLSketch(seed=1), KLLSketch(seed=2), KLLSketch(seed=3)
+        whole.update(values)
+        first.update(values[:100_000])
+        second.update(values[100_000:])
+        first.merge(second)
+        ordered = np.sort(values)
+        qs = np.array([0.01, 0.25, 0.5, 0.75, 0.99])
+        for sketch in (whole, first):
+            self.assertEqual(sketch.n, values.size)
+            ranks = np.searchsorted(ordered, sketch.quantiles(qs)) / values.size
+            self.assertTrue(np.all(np.abs(ranks - qs) <= sketch.rank_error), ranks)
+            self.assertEqual(sketch.quantiles([0, 1]).tolist(), [values.min(), values.max()])
+
+    def test_frequencies_exact_until_capacity(self):
+        values = pd.Series(self.rng.choice(list('abcde'), size=10_000, p=[0.5, 0.2, 0.15, 0.1, 0.05]))
+        first, second = FrequencySketch(), FrequencySketch()
+        first.update(values.iloc[:3000])
+        second.update(values.iloc[3000:])
+        first.merge(second)
+        self.assertTrue(first.exact)
+        self.assertEqual(first.value_counts().to_dict(), values.value_counts().to_dict())
+
+        many = FrequencySketch(capacity=8)
+        skewed = pd.Series(np.concatenate([np.zeros(5000), self.rng.integers(1, 1000, 5000)]))
+        many.update(skewed)
+        self.assertFalse(many.exact)
+        # The heavy hitter is kept and never undercounted, within the stated error
+        estimate = many.value_counts()[0.0]
+        self.assertGreaterEqual(estimate, (skewed == 0).sum())
+        self.assertLessEqual(estimate - (skewed == 0).sum(), many.count_error)
+
+    def test_column_sketch_merge_is_exact_for_moments(self):
+        series = pd.Series(self.rng.normal(10, 3, 50_000))
+        series[::13] = np.nan
+        first, second = ColumnSketch(series), ColumnSketch(series)
+        first.update(series.iloc[:20_000])
+        second.update(series.iloc[20_000:])
+        first.merge(second)
+        count, mean, std = first.stats()[:3]
+        self.assertEqual(count, series.count())
+        self.assertAlmostEqual(mean, series.mean(), places=9)
+        self.assertAlmostEqual(std, series.std(), places=9)
+        self.assertEqual(first.nulls, series.isna().sum())
+
+
+@override_settings(APPROXIMATE_STATS_MIN_ROWS=1000)
+class ApproximateProfileTests(StoreTestCase):
+    def test_large_datasets_are_sketched_from_the_cache(self):
+        path, digest = self.stored_dataset(make_dataset(5000, 8, seed=4))
+        df = load_dataset(path, clean=True, digest=digest)
+        with mock.patch('analytics_app.cache_utils.profile_dataset', side_effect=AssertionError("loaded")):
+            profile = load_profile(path, clean=True, digest=digest)
+        self.assertTrue(profile.approximate)
+        self.assertEqual(profile.n_rows, 5000)
+        stats = profile.numeric_stats.loc['Marks']
+        self.assertAlmostEqual(stats['mean'], df['Marks'].mean(), places=6)
+        self.assertEqual((stats['min'], stats['max']), (df['Marks'].min(), df['Marks'].max()))
+        self.assertEqual(profile.nunique['Category'], df['Category'].nunique())
+
+        html = generate_basic_stats(df, profile=profile)
+        self.assertIn(approximation_note(profile), html)
+        # The table shows no distinct counts, so the caption quotes no bound for them
+        self.assertNotIn('distinct', html)
+
+    def test_loaded_datasets_are_profiled_exactly(self):
+        path, digest = self.stored_dataset(make_dataset(5000, 8, seed=5))
+        df = load_dataset(path, clean=True, digest=digest)
+        profile = load_profile(path, clean=True, digest=digest, df=df)
+        self.assertFalse(profile.approximate)
+        # ...and an exact profile is reused whatever the threshold
+        self.assertFalse(load_profile(path, clean=True, digest=digest).approximate)
+
+    def test_small_datasets_are_profiled_exactly(self):
+        path, digest = self.stored_dataset(make_dataset(500, 8, seed=6))
+        self.assertFalse(load_profile(path, clean=True, digest=digest).approximate)
@@ -0,0 +1,28 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from analytics_app.benchmarks import HEAVY_MODULES
+
+# Imports the URL configuration (and with it every view module) in a fresh interpreter and
+# prints which of the heavy modules ended up loaded
+IMPORT_SCRIPT = """
+import json, sys
+import django
+django.setup()
+import analytics_app.views, privacy_analytics.urls
+print(json.dumps(sorted(m for m in {heavy!r} if m in sys.modules)))
+"""
+
+
+class ImportTimeTests(SimpleTestCase):
+    def test_views_and_urls_do_not_import_heavy_modules(self):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'privacy_analytics.settings'}
+        process = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT.format(heavy=HEAVY_MODULES)],
+                                 capture_output=True, text=True, cwd=settings.BASE_DIR, env=env, timeout=120)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertEqual(json.loads(process.stdout.strip().splitlines()[-1]), [])
@@ -0,0 +1,129 @@
+import io
+import os
+import tracemalloc
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+from django.core.files.uploadedfile import UploadedFile
+from django.test import SimpleTestCase, override_settings
+
+from analytics_app import privacy_utils
+from analytics_app.benchmarks import make_dataset
+from analytics_app.cache_utils import clean_dataset, load_dataset, load_profile, read_upload
+from analytics_app.privacy_utils import (anonymization_plan, anonymize_csv, anonymize_data, collect_column_stats,
+                                         column_stats_plan)
+from analytics_app.profile_utils import profile_dataset
+from analytics_app.release_utils import ensure_release, load_plan, preview_release, release_path
+from analytics_app.upload_utils import start_conversion, store_upload
+
+from .utils import StoreTestCase
+
+def sample_frame(n_rows: int = 1000) -> pd.DataFrame:
+    df = make_dataset(n_rows, 9, seed=3)
+    df.loc[::7, 'Score_0'] = np.nan
+    df.loc[::11, 'Group_2'] = np.nan
+    df['Passed'] = df['Marks'] > 150
+    return df
+
+def to_csv(df: pd.DataFrame) -> str:
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+
+# Small noise blocks, so a 1000-row file spans many chunks
+@mock.patch.object(privacy_utils, 'NOISE_BLOCK_ROWS', 64)
+class AnonymizeCsvTests(SimpleTestCase):
+    def setUp(self):
+        self.csv = to_csv(sample_frame())
+
+    def test_matches_anonymize_data_with_the_same_seed(self):
+        output = io.StringIO()
+        anonymize_csv(io.StringIO(self.csv), output, epsilon=0.5, chunksize=100, rng=7)
+        expected = anonymize_data(pd.read_csv(io.StringIO(self.csv)), epsilon=0.5, rng=7)
+        self.assertEqual(output.getvalue(), to_csv(expected))
+
+    def test_plan_matches_anonymization_plan(self):
+        stats = collect_column_stats(io.StringIO(self.csv), chunksize=100)
+        streamed = column_stats_plan(stats, epsilon=2.0)
+        expected = anonymization_plan(profile_dataset(pd.read_csv(io.StringIO(self.csv))), epsilon=2.0)
+        self.assertEqual(streamed.dropped, expected.dropped)
+        self.assertEqual(streamed.noise, expected.noise)
+        self.assertEqual(streamed.rare, expected.rare)
+        self.assertEqual(sorted(streamed.kept['Group_2']), sorted(expected.kept['Group_2']))
+        self.assertEqual(streamed.ranks['Rank_3'].sort_index().to_dict(),
+                         expected.ranks['Rank_3'].sort_index().to_dict())
+
+
+@override_settings(STREAMING_RELEASE_MIN_BYTES=0)
+class StreamingReleaseTests(StoreTestCase):
+    def test_large_csv_release_is_built_without_loading_the_dataset(self):
+        path, digest = self.stored_dataset(sample_frame(3000))
+        with mock.patch('analytics_app.release_utils.load_dataset', side_effect=AssertionError("loaded")):
+            release = ensure_release(path, epsilon=1.0, digest=digest)
+        self.assertEqual(release, release_path(digest, 1.0))
+        streamed = feather.read_table(release).to_pandas()
+
+        # Same columns, rows and generalization as the in-memory release of the cleaned data
+        clean = load_dataset(path, clean=True, digest=digest)
+        profile = load_profile(path, clean=True, digest=digest, df=clean)
+        expected = anonymize_data(clean, epsilon=1.0, profile=profile, rng=0)
+        self.assertEqual(list(streamed.columns), list(expected.columns))
+        self.assertEqual(len(streamed), len(expected))
+        self.assertEqual(int(streamed.isna().sum().sum()), 0)
+        for col in ('Category', 'Group_2', 'Rank_3', 'Passed'):
+            self.assertEqual(streamed[col].astype(str).tolist(), expected[col].astype(str).tolist(), col)
+        self.assertTrue(pd.api.types.is_integer_dtype(streamed['Marks']))
+
+        plan, expected_plan = load_plan(path, epsilon=1.0, digest=digest), anonymization_plan(profile, 1.0)
+        self.assertEqual(plan.dropped, expected_plan.dropped)
+        self.assertEqual(plan.rare, expected_plan.rare)
+        for col, (scale, decimals, is_int) in expected_plan.noise.items():
+            self.assertAlmostEqual(plan.noise[col][0], scale)
+            self.assertEqual(plan.noise[col][1:], (decimals, is_int))
+
+    def test_unknown_fill_value_falls_back_to_loading(self):
+        df = sample_frame(500)
+        # Missing values in a column with too many distinct values to track its mode
+        df['Comment'] = [f"note {i}" if i % 5 else None for i in range(len(df))]
+        path, digest = self.stored_dataset(df)
+        release = ensure_release(path, epsilon=1.0, digest=digest)
+        self.assertTrue(os.path.exists(release))
+        self.assertEqual(feather.read_table(release).to_pandas()['Comment'].isna().sum(), 0)
+
+    @override_settings(STREAMING_CONVERSION_MIN_BYTES=0)
+    def test_fill_values_of_a_streamed_conversion_are_reused(self):
+        df = sample_frame(500)
+        df['Comment'] = [f"note {i}" if i % 5 else None for i in range(len(df))]
+        path, digest = self.stored_dataset(df)
+        clean = load_dataset(path, clean=True, digest=digest)
+        with mock.patch('analytics_app.release_utils.load_dataset', side_effect=AssertionError("loaded")):
+            release = ensure_release(path, epsilon=1.0, digest=digest)
+        streamed = feather.read_table(release).to_pandas()
+        self.assertEqual(streamed['Comment'].astype(str).tolist(), clean['Comment'].astype(str).tolist())
+
+
+# Small chunks and noise blocks stand in for a file many chunks long
+@override_settings(STREAMING_CONVERSION_MIN_BYTES=0, STREAMING_RELEASE_MIN_BYTES=0, STREAMING_CHUNK_ROWS=4096)
+@mock.patch.object(privacy_utils, 'NOISE_BLOCK_ROWS', 2048)
+class StreamingMemoryTests(StoreTestCase):
+    def test_upload_to_release_holds_less_than_the_dataset(self):
+        csv = self.write_csv(make_dataset(40_000, 9))
+        # Peak of the memory traced by Python and numpy (Arrow buffers and memory maps are not),
+        # from the upload to the dashboard's preview of the release
+        tracemalloc.start()
+        try:
+            with open(csv, 'rb') as f:
+                path, digest = store_upload(UploadedFile(f, name='data.csv', size=os.path.getsize(csv)))
+            start_conversion(path, digest).result()
+            preview_release(path, epsilon=1.0, digest=digest)
+            streamed = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+            clean_dataset(read_upload(csv))
+            loaded = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertTrue(os.path.exists(release_path(digest, 1.0)))
+        self.assertLess(streamed, loaded / 2)
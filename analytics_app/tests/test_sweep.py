@@ -0,0 +1,121 @@
+import os
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from analytics_app.benchmarks import make_dataset
+from analytics_app.chart_utils import HIST_BINS
+from analytics_app.privacy_utils import anonymization_plan, round_columns, unit_laplace
+from analytics_app.profile_utils import profile_dataset
+from analytics_app.registry import register_upload
+from analytics_app.sweep_utils import MAX_EPSILONS, epsilon_sweep, parse_epsilons
+
+from .utils import StoreTestCase
+
+
+def histogram(values: pd.Series, low: float, width: float) -> np.ndarray:
+    # Shares of HIST_BINS bins over the original range, outliers in the edge bins
+    bins = np.clip(np.floor((values.dropna() - low) / width), 0, HIST_BINS - 1).astype(int)
+    return np.bincount(bins, minlength=HIST_BINS) / len(bins)
+
+
+class ParseEpsilonsTests(SimpleTestCase):
+    def test_parse(self):
+        self.assertEqual(parse_epsilons(['1, 0.5', '2', '1']), [0.5, 1.0, 2.0])
+        self.assertEqual(parse_epsilons('0.1'), [0.1])
+        for values in (['0'], ['-1'], ['inf'], ['nan'], ['x'], [''], [','.join(map(str, range(1, MAX_EPSILONS + 2)))]):
+            with self.subTest(values=values), self.assertRaises(ValueError):
+                parse_epsilons(values)
+
+
+class EpsilonSweepTests(SimpleTestCase):
+    def setUp(self):
+        self.df = make_dataset(3000, 8, seed=9)
+        self.df.loc[::17, 'Score_0'] = np.nan
+        self.epsilons = [0.5, 2.0]
+        self.result = epsilon_sweep(self.df, self.epsilons, rng=3)
+
+    def noisy_variants(self) -> tuple:
+        # What anonymize_data's noise looks like at each epsilon, from the sweep's single draw
+        plan = anonymization_plan(profile_dataset(self.df), 1.0)
+        columns = self.result['columns']
+        values = self.df[columns].to_numpy(dtype='float64', na_value=np.nan)
+        noise = unit_laplace(np.random.default_rng(3), len(values), len(columns))
+        scales = np.array([plan.noise[col][0] for col in columns])
+        decimals = np.array([plan.noise[col][1] for col in columns])
+        variants = [pd.DataFrame(round_columns(values + noise * scales / epsilon, decimals), columns=columns)
+                    for epsilon in self.epsilons]
+        return self.df[columns].astype('float64'), variants
+
+    def test_metrics_match_the_noisy_data(self):
+        orig, variants = self.noisy_variants()
+        self.assertEqual(self.result['rows'], len(self.df))
+        low, width = orig.min(), (orig.max() - orig.min()) / HIST_BINS
+        for i, noisy in enumerate(variants):
+            mean_error = ((noisy.mean() - orig.mean()).abs() / orig.std()).to_numpy()
+            np.testing.assert_allclose(self.result['per_column']['mean_error'][i], mean_error, rtol=1e-3)
+            variance_error = ((noisy.var() - orig.var()).abs() / orig.var()).to_numpy()
+            np.testing.assert_allclose(self.result['per_column']['variance_error'][i], variance_error, rtol=1e-3)
+
+            distances = []
+            for col in orig.columns:
+                expected, observed = (histogram(frame[col], low[col], width[col]) for frame in (orig, noisy))
+                distances.append(0.5 * np.abs(observed - expected).sum())
+            np.testing.assert_allclose(self.result['per_column']['histogram_distance'][i], distances, rtol=1e-3)
+
+            drift = (noisy.corr() - orig.corr()).abs().to_numpy()[~np.eye(len(orig.columns), dtype=bool)]
+            self.assertAlmostEqual(self.result['metrics']['correlation_drift'][i], drift.mean(), places=3)
+            self.assertAlmostEqual(self.result['metrics']['correlation_drift_max'][i], drift.max(), places=3)
+
+    def test_more_privacy_costs_more_utility(self):
+        metrics = epsilon_sweep(self.df, [0.1, 1.0, 10.0], rng=0)['metrics']
+        for name in ('variance_error', 'histogram_distance', 'correlation_drift'):
+            self.assertGreater(metrics[name][0], metrics[name][2], name)
+
+    def test_no_numeric_columns(self):
+        result = epsilon_sweep(pd.DataFrame({'a': list('xyz')}), [1.0])
+        self.assertEqual(result['columns'], [])
+        self.assertEqual(result['metrics']['mean_error'], [None])
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class SweepViewTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('analyst', password='pw-12345678')
+        self.client.force_login(self.user)
+
+    def open_version(self, path: str, digest: str) -> None:
+        session = self.client.session
+        session['dataset_version'] = register_upload(self.user, path, digest, 'data.csv').pk
+        session.save()
+
+    def test_sweep_of_the_current_dataset(self):
+        self.open_version(*self.stored_dataset(make_dataset(500, 6)))
+        response = self.client.get(reverse('epsilon_sweep'), {'epsilons': '0.5,2'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['epsilons'], [0.5, 2.0])
+
+    @override_settings(ANALYSIS_SAMPLE_ROWS=200)
+    def test_large_datasets_are_swept_on_a_sample(self):
+        self.open_version(*self.stored_dataset(make_dataset(800, 6)))
+        response = self.client.get(reverse('epsilon_sweep'), {'epsilons': '0.5,2'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['rows'], response.json()['sampled_from']), (200, 800))
+
+    def test_failures_are_reported_as_json(self):
+        # The stored upload is gone, so the dataset cannot be read
+        self.open_version(os.path.join(self.tmp_dir, 'missing.csv'), '0' * 64)
+        response = self.client.get(reverse('epsilon_sweep'))
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('Error computing the sweep', response.json()['error'])
+
+        self.open_version(*self.stored_dataset(make_dataset(100, 5)))
+        with mock.patch('analytics_app.sweep_utils.sweep_dataset', side_effect=ValueError("all values are NaN")):
+            response = self.client.get(reverse('epsilon_sweep'))
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('all values are NaN', response.json()['error'])
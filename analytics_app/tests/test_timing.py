@@ -0,0 +1,87 @@
+import json
+import os
+
+import pandas as pd
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from analytics_app.timing_utils import (HISTOGRAM, LatencyHistogram, collect, extend_collected, observe_all,
+                                        server_timing_header, stage, timed)
+
+
+class LatencyHistogramTests(SimpleTestCase):
+    def test_buckets_and_totals(self):
+        histogram = LatencyHistogram(buckets=(10, 100))
+        for duration_ms in (5, 10, 50, 500):
+            histogram.observe('anonymize', duration_ms)
+        snapshot = histogram.snapshot()['anonymize']
+        self.assertEqual((snapshot['count'], snapshot['sum_ms'], snapshot['max_ms']), (4, 565, 500))
+        self.assertEqual(snapshot['mean_ms'], 141.25)
+        # Bounds are inclusive; slower stages land in +Inf
+        self.assertEqual(snapshot['buckets'], {'10': 2, '100': 1, '+Inf': 1})
+        histogram.reset()
+        self.assertEqual(histogram.snapshot(), {})
+
+
+class StageTests(SimpleTestCase):
+    def test_stages_are_collected_logged_and_counted(self):
+        count = HISTOGRAM.snapshot().get('test-stage', {}).get('count', 0)
+        with self.assertLogs('analytics_app.timing') as logs, collect() as timings:
+            with stage('test-stage') as fields:
+                fields['rows'] = 3
+        self.assertEqual([name for name, _ in timings], ['test-stage'])
+        self.assertEqual(HISTOGRAM.snapshot()['test-stage']['count'], count + 1)
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line['event'], line['stage'], line['rows']), ('stage', 'test-stage', 3))
+
+    def test_failed_stages_are_recorded_with_the_error(self):
+        with self.assertLogs('analytics_app.timing') as logs, self.assertRaises(KeyError):
+            with stage('test-failure'):
+                raise KeyError('column')
+        self.assertEqual(json.loads(logs.records[0].getMessage())['error'], 'KeyError')
+
+    def test_timed_logs_the_shape_of_the_data(self):
+        @timed('test-timed')
+        def head(df, n=2):
+            return df.head(n)
+
+        with self.assertLogs('analytics_app.timing') as logs:
+            head(pd.DataFrame({'a': range(10), 'b': range(10)}))
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line['rows'], line['cols']), (10, 2))
+
+    def test_collectors_nest_and_take_worker_timings(self):
+        with self.assertLogs('analytics_app.timing'):
+            with collect() as outer:
+                with collect() as inner, stage('test-inner'):
+                    pass
+                extend_collected([('worker', 4.0)])
+        self.assertEqual([name for name, _ in inner], ['test-inner'])
+        self.assertEqual(outer, [('worker', 4.0)])
+        extend_collected([('ignored', 1.0)])
+
+    def test_observe_all_skips_timings_of_this_process(self):
+        before = HISTOGRAM.snapshot().get('test-worker', {}).get('count', 0)
+        observe_all([('test-worker', 1.0)], os.getpid())
+        observe_all([('test-worker', 1.0), ('test-worker', 2.0)], os.getpid() + 1)
+        self.assertEqual(HISTOGRAM.snapshot()['test-worker']['count'], before + 2)
+
+    def test_server_timing_header_sums_repeated_stages(self):
+        header = server_timing_header([('read_csv', 1.25), ('fillna', 2.0), ('read_csv', 1.0)])
+        self.assertEqual(header, 'read_csv;dur=2.2, fillna;dur=2.0')
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class MetricsViewTests(TestCase):
+    def test_views_are_timed_and_metrics_are_staff_only(self):
+        response = self.client.get(reverse('login'))
+        self.assertRegex(response['Server-Timing'], r'^total;dur=\d+\.\d$')
+
+        user = User.objects.create_user('analyst', password='pw-12345678')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+        user.is_staff = True
+        user.save()
+        stages = self.client.get(reverse('metrics')).json()['stages']
+        self.assertGreaterEqual(stages['view:login']['count'], 1)
@@ -0,0 +1,102 @@
+import io
+import os
+
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from analytics_app.benchmarks import make_dataset
+from analytics_app.cache_utils import cache_path, load_dataset
+from analytics_app.models import DatasetVersion
+from analytics_app.upload_utils import (UploadError, sniff_format, start_conversion, store_upload, upload_dir,
+                                        validate_csv_header, validate_file, wait_for_conversion)
+
+from .utils import StoreTestCase
+
+
+def upload(content: bytes, name: str = 'data.csv') -> SimpleUploadedFile:
+    return SimpleUploadedFile(name, content, content_type='text/csv')
+
+def stored_files() -> list:
+    return sorted(os.path.join(root, name) for root, _, names in os.walk(upload_dir()) for name in names)
+
+
+class HeaderValidationTests(SimpleTestCase):
+    def test_sniff_format(self):
+        self.assertEqual(sniff_format(b'PK\x03\x04rest'), '.xlsx')
+        self.assertEqual(sniff_format(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1rest'), '.xls')
+        self.assertEqual(sniff_format(b'a,b\n1,2\n'), '.csv')
+
+    def test_valid_headers(self):
+        self.assertEqual(validate_csv_header(b'\xef\xbb\xbfName, Marks\n1,2\n'), ['Name', 'Marks'])
+        self.assertEqual(validate_csv_header('Nom,Note\xe9\n'.encode('latin-1')), ['Nom', 'Note\xe9'])
+        # A first chunk ending inside a very wide header is left to the parser
+        self.assertEqual(validate_csv_header(b'a,b,c', complete=False), [])
+
+    def test_invalid_headers(self):
+        for head in (b'\n\n', b'a,,b\n1,2,3\n', b'a,b,a\n1,2,3\n', b'a\x00b\n'):
+            with self.subTest(head=head), self.assertRaises(UploadError):
+                validate_csv_header(head)
+
+
+class StoreUploadTests(StoreTestCase):
+    def test_identical_uploads_are_stored_once(self):
+        content = make_dataset(100, 5).to_csv(index=False).encode()
+        path, digest = store_upload(upload(content, 'first.csv'))
+        self.assertEqual(store_upload(upload(content, 'second.csv')), (path, digest))
+        self.assertEqual(stored_files(), [path])
+        self.assertEqual(os.path.basename(path), f"{digest}.csv")
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), content)
+
+        other, other_digest = store_upload(upload(content + b'Extra,1,2,3,A\n'))
+        self.assertNotEqual(other_digest, digest)
+        self.assertEqual(stored_files(), sorted([path, other]))
+
+    def test_rejected_uploads_leave_nothing_behind(self):
+        for content in (b'', b'a,a\n1,2\n', b'\x00\x01\x02'):
+            with self.subTest(content=content), self.assertRaises(UploadError):
+                store_upload(upload(content))
+        self.assertEqual(stored_files(), [])
+
+    def test_excel_uploads_are_sniffed_and_validated(self):
+        buffer = io.BytesIO()
+        make_dataset(20, 5).to_excel(buffer, index=False)
+        path, digest = store_upload(upload(buffer.getvalue(), 'marks.csv'))
+        self.assertTrue(path.endswith('.xlsx'))
+        self.assertEqual(validate_file(path), '.xlsx')
+        self.assertEqual(len(load_dataset(path, digest=digest)), 20)
+        with self.assertRaises(UploadError):
+            store_upload(upload(b'PK\x03\x04 not a workbook'))
+
+    def test_conversion_fills_the_cache(self):
+        df = make_dataset(300, 6)
+        path, digest = self.stored_dataset(df)
+        start_conversion(path, digest).result()
+        wait_for_conversion(digest)
+        self.assertTrue(os.path.exists(cache_path(digest, 'raw')))
+        self.assertTrue(os.path.exists(cache_path(digest, 'clean')))
+        pd.testing.assert_frame_equal(load_dataset(path, digest=digest).astype(object), df.astype(object))
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class UploadViewTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('analyst', password='pw-12345678')
+        self.client.force_login(self.user)
+
+    def test_upload_registers_a_version(self):
+        content = make_dataset(100, 5).to_csv(index=False).encode()
+        response = self.client.post(reverse('upload'), {'file': upload(content)})
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        version = DatasetVersion.objects.get()
+        self.assertEqual(self.client.session['dataset_version'], version.pk)
+        self.assertEqual(version.file_path, stored_files()[0])
+
+    def test_bad_upload_is_reported_on_the_form(self):
+        response = self.client.post(reverse('upload'), {'file': upload(b'a,a\n1,2\n')})
+        self.assertContains(response, 'duplicate column names')
+        self.assertFalse(DatasetVersion.objects.exists())
@@ -0,0 +1,62 @@
+"""
+Shared helpers for the analytics_app tests.
+Provides:
+1. StoreTestCase: TestCase whose upload store, dataset cache, release store and media
+   directory are temporary, and whose process pool runs functions inline.
+2. write_csv / stored_dataset: Synthetic datasets (benchmarks.make_dataset) as CSV files and
+   as stored, content-addressed uploads.
+"""
+import os
+import shutil
+import tempfile
+from concurrent.futures import Future
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+def run_inline(func, *args):
+    # Stand-in for the pool's own submit: pool workers load the real settings, not the test's
+    future = Future()
+    try:
+        future.set_result(func(*args))
+    except BaseException as e:
+        future.set_exception(e)
+    return future
+
+
+class StoreTestCase(TestCase):
+    """TestCase with temporary storage directories and an inline process pool"""
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.mkdtemp(prefix='analytics_test_')
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        dirs = override_settings(
+            MEDIA_ROOT=os.path.join(self.tmp_dir, 'media'),
+            UPLOAD_STORE_DIR=os.path.join(self.tmp_dir, 'uploads'),
+            DATASET_CACHE_DIR=os.path.join(self.tmp_dir, 'cache'),
+            RELEASE_STORE_DIR=os.path.join(self.tmp_dir, 'releases'),
+        )
+        dirs.enable()
+        self.addCleanup(dirs.disable)
+        pool = mock.patch('analytics_app.pool_utils._submit', side_effect=run_inline)
+        pool.start()
+        self.addCleanup(pool.stop)
+
+    def write_csv(self, df, name: str = 'data.csv') -> str:
+        return write_csv(df, os.path.join(self.tmp_dir, name))
+
+    def stored_dataset(self, df, name: str = 'data.csv') -> tuple:
+        """(path, digest) of df stored as an upload"""
+        return stored_dataset(self.write_csv(df, name))
+
+def write_csv(df, path: str) -> str:
+    df.to_csv(path, index=False)
+    return path
+
+def stored_dataset(csv_path: str) -> tuple:
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    from analytics_app.upload_utils import store_upload
+    with open(csv_path, 'rb') as f:
+        return store_upload(SimpleUploadedFile(os.path.basename(csv_path), f.read(), content_type='text/csv'))
@@ -0,0 +1,158 @@
+"""
+Lightweight timing instrumentation for the analytics pipeline.
+Provides:
+1. stage / timed: Context manager and decorator that time a pipeline stage (CSV read, fillna,
+   anonymization, statistics, chart data, ...).
+2. collect: Gather the stage timings of the current request or job, e.g. for a Server-Timing header.
+3. LatencyHistogram / HISTOGRAM: In-process histogram of stage latencies, served by the metrics view.
+4. run_collected / observe_all / extend_collected: Carry the stage timings of a call made in
+   another process (a pool worker) back to the process that waits for it (see pool_utils).
+
+Every timed stage also writes one JSON log line to the 'analytics_app.timing' logger with its
+duration and, where known, the row and column counts of the data it worked on.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('analytics_app.timing')
+
+# Upper bounds (in milliseconds) of the histogram buckets; slower stages fall in a final +Inf bucket
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+# Timings of the stages run so far in the current request/job (None when nobody is collecting)
+_collected = contextvars.ContextVar('stage_timings', default=None)
+
+class LatencyHistogram:
+    """Thread-safe per-stage latency histogram (count, total, max and bucket counts)"""
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def observe(self, name: str, duration_ms: float) -> None:
+        with self._lock:
+            entry = self._stages.get(name)
+            if entry is None:
+                entry = self._stages[name] = {
+                    'count': 0, 'sum_ms': 0.0, 'max_ms': 0.0, 'buckets': [0] * (len(self.buckets) + 1)}
+            entry['count'] += 1
+            entry['sum_ms'] += duration_ms
+            entry['max_ms'] = max(entry['max_ms'], duration_ms)
+            index = next((i for i, bound in enumerate(self.buckets) if duration_ms <= bound), len(self.buckets))
+            entry['buckets'][index] += 1
+
+    def snapshot(self) -> dict:
+        """Return {stage: {count, sum_ms, mean_ms, max_ms, buckets: {upper bound: count}}}"""
+        bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        with self._lock:
+            return {
+                name: {
+                    'count': entry['count'],
+                    'sum_ms': round(entry['sum_ms'], 3),
+                    'mean_ms': round(entry['sum_ms'] / entry['count'], 3),
+                    'max_ms': round(entry['max_ms'], 3),
+                    'buckets': dict(zip(bounds, entry['buckets'])),
+                }
+                for name, entry in sorted(self._stages.items())
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+
+HISTOGRAM = LatencyHistogram()
+
+def record(name: str, duration_ms: float, **fields) -> None:
+    """Record a finished stage: histogram, current collector and a JSON log line"""
+    HISTOGRAM.observe(name, duration_ms)
+    timings = _collected.get()
+    if timings is not None:
+        timings.append((name, duration_ms))
+    logger.info(json.dumps({'event': 'stage', 'stage': name, 'duration_ms': round(duration_ms, 3), **fields},
+                           default=str))
+
+@contextmanager
+def stage(name: str, **fields):
+    """
+    Time the enclosed block as stage `name`.
+    Yields a dict of extra log fields the block can fill in (e.g. rows/cols once known).
+    """
+    start = time.perf_counter()
+    try:
+        yield fields
+    except Exception as e:
+        fields['error'] = type(e).__name__
+        raise
+    finally:
+        record(name, (time.perf_counter() - start) * 1000, **fields)
+
+def _frame_shape(*values) -> dict:
+    # Row/column counts of the first DataFrame among the values, for the log line. pandas is
+    # not imported here: if nothing has imported it yet, none of the values is a DataFrame.
+    pd = sys.modules.get('pandas')
+    if pd is None:
+        return {}
+    for value in values:
+        if isinstance(value, pd.DataFrame):
+            return {'rows': value.shape[0], 'cols': value.shape[1]}
+    return {}
+
+def timed(name: str):
+    """Decorator timing every call of a function as stage `name`"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name, **_frame_shape(*args, *kwargs.values())) as fields:
+                result = func(*args, **kwargs)
+                if 'rows' not in fields:
+                    fields.update(_frame_shape(result))
+                return result
+        return wrapper
+    return decorator
+
+@contextmanager
+def collect():
+    """Collect the (stage, duration_ms) pairs recorded inside the block into the yielded list"""
+    timings = []
+    token = _collected.set(timings)
+    try:
+        yield timings
+    finally:
+        _collected.reset(token)
+
+def server_timing_header(timings) -> str:
+    """Format (stage, duration_ms) pairs as a Server-Timing header, summing repeated stages"""
+    totals = {}
+    for name, duration_ms in timings:
+        totals[name] = totals.get(name, 0.0) + duration_ms
+    return ', '.join(f"{name};dur={duration_ms:.1f}" for name, duration_ms in totals.items())
+
+def run_collected(func, *args) -> tuple:
+    """
+    Call func(*args) and return (result, the (stage, duration_ms) pairs it recorded, pid of this
+    process). Pool workers run calls through it, since their histogram and collectors are not
+    the ones of the process serving the request.
+    """
+    with collect() as timings:
+        result = func(*args)
+    return result, timings, os.getpid()
+
+def observe_all(timings, pid: int) -> None:
+    """Add stage timings returned by run_collected to HISTOGRAM, unless this process recorded them"""
+    if pid != os.getpid():
+        for name, duration_ms in timings:
+            HISTOGRAM.observe(name, duration_ms)
+
+def extend_collected(timings) -> None:
+    """Add stage timings returned by run_collected to the current collector, if any"""
+    collected = _collected.get()
+    if collected is not None:
+        collected.extend(timings)
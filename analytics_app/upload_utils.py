@@ -0,0 +1,223 @@
+"""
+Upload storage for the analytics app.
+Provides:
+1. store_upload: Stream an uploaded file to disk while hashing it, sniffing its format and
+   validating its header, and store it content-addressed so identical uploads are kept once.
+   validate_file runs the same checks on a file that is already on disk.
+2. store_chain / chain_parts: Appended versions of a stored dataset, kept as small chain
+   files naming the parent and the appended upload (see append_utils).
+3. start_conversion / wait_for_conversion: Parse a stored upload into the columnar cache in
+   the background (on the shared process pool), so request handlers only ever read the cache.
+"""
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+
+from .pool_utils import submit
+
+# Leading bytes of Excel workbooks: .xlsx files are zip archives, .xls files OLE2 documents
+XLSX_MAGIC = b'PK\x03\x04'
+XLS_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+# Encodings tried, in order, when decoding the header of a CSV upload
+CSV_ENCODINGS = ('utf-8-sig', 'latin-1')
+# Extension of chain files (a stored dataset plus appended rows)
+CHAIN_SUFFIX = '.chain'
+
+class UploadError(ValueError):
+    """The uploaded file is not a CSV or Excel file with a usable header row"""
+
+def upload_dir() -> str:
+    """Directory holding the content-addressed uploads (created on demand)"""
+    os.makedirs(settings.UPLOAD_STORE_DIR, exist_ok=True)
+    return settings.UPLOAD_STORE_DIR
+
+def upload_path(digest: str, extension: str) -> str:
+    """Content-addressed location of an upload: <store>/<first 2 hex digits>/<digest><extension>"""
+    return os.path.join(upload_dir(), digest[:2], f"{digest}{extension}")
+
+def sniff_format(head: bytes) -> str:
+    """Return the file extension matching the first bytes of an upload ('.xlsx', '.xls' or '.csv')"""
+    if head.startswith(XLSX_MAGIC):
+        return '.xlsx'
+    if head.startswith(XLS_MAGIC):
+        return '.xls'
+    return '.csv'
+
+def validate_csv_header(head: bytes, complete: bool = True) -> list:
+    """
+    Check that the first chunk of a CSV upload is text with a header row of distinct,
+    non-empty column names. `complete` tells whether the chunk is the whole file.
+    Returns the column names; raises UploadError otherwise.
+    """
+    if b'\x00' in head:
+        raise UploadError("The file is not a CSV or Excel file.")
+    for encoding in CSV_ENCODINGS:
+        try:
+            text = head.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    # For very wide files the chunk can end inside the header; that is left to the parser
+    if not complete and '\n' not in text:
+        return []
+    header_line = next((line for line in text.splitlines() if line.strip()), '')
+    if not header_line:
+        raise UploadError("The file is empty.")
+    header = next(csv.reader(io.StringIO(header_line)))
+    columns = [name.strip() for name in header]
+    if any(not name for name in columns):
+        raise UploadError("The header row has empty column names.")
+    if len(set(columns)) != len(columns):
+        raise UploadError("The header row has duplicate column names.")
+    return columns
+
+def validate_excel_header(path: str) -> list:
+    """Read only the header and first rows of a workbook, raising UploadError if it cannot be parsed"""
+    # Imported here so the web process only loads pandas when an Excel file is uploaded
+    import pandas as pd
+    try:
+        df = pd.read_excel(path, nrows=5)
+    except Exception as e:
+        raise UploadError(f"The Excel file could not be read: {e}")
+    if len(df.columns) == 0:
+        raise UploadError("The Excel file has no columns.")
+    return [str(col) for col in df.columns]
+
+def validate_file(path: str) -> str:
+    """Run the upload checks on a file already on disk; returns its sniffed extension"""
+    chunk_size = 64 * 1024
+    with open(path, 'rb') as f:
+        head = f.read(chunk_size)
+    if not head:
+        raise UploadError("The file is empty.")
+    extension = sniff_format(head)
+    if extension == '.csv':
+        validate_csv_header(head, complete=len(head) < chunk_size)
+    else:
+        validate_excel_header(path)
+    return extension
+
+def store_upload(uploaded_file) -> tuple:
+    """
+    Stream an uploaded file to disk, hashing it and validating its format on the way.
+    CSV headers are checked on the first chunk, so bad files are rejected before the rest
+    is written. The file is stored under its SHA-256 digest; if the same content was
+    uploaded before, the existing copy is reused.
+
+    Parameters:
+    uploaded_file (UploadedFile): The file from request.FILES.
+
+    Returns:
+    tuple: (stored path, SHA-256 hex digest)
+    """
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=upload_dir(), suffix='.part')
+    extension = None
+    try:
+        with os.fdopen(fd, 'wb') as destination:
+            for chunk in uploaded_file.chunks():
+                if extension is None:
+                    # Sniff the format and validate the header from the first chunk
+                    extension = sniff_format(chunk)
+                    if extension == '.csv':
+                        validate_csv_header(chunk, complete=len(chunk) >= uploaded_file.size)
+                destination.write(chunk)
+                digest.update(chunk)
+        if extension is None:
+            raise UploadError("The file is empty.")
+        if extension != '.csv':
+            validate_excel_header(tmp_path)
+
+        path = upload_path(digest.hexdigest(), extension)
+        if os.path.exists(path):
+            # Duplicate upload: keep the stored copy
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return path, digest.hexdigest()
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _stored_name(path: str) -> str:
+    # Store-relative name of an upload; only content-addressed uploads can be chained
+    digest, extension = os.path.splitext(os.path.basename(path))
+    if os.path.abspath(upload_path(digest, extension)) != os.path.abspath(path):
+        raise UploadError("Rows can only be appended to uploaded datasets.")
+    return f"{digest}{extension}"
+
+def store_chain(parent_path: str, rows_path: str) -> tuple:
+    """
+    Store the version of a dataset made of `parent_path` followed by the rows of `rows_path`
+    (both stored uploads or chains). The chain file is content-addressed like any upload,
+    so appending the same rows to the same dataset twice gives the same version.
+
+    Returns:
+    tuple: (chain path, SHA-256 hex digest of the chain file)
+    """
+    content = json.dumps({'parent': _stored_name(parent_path), 'rows': _stored_name(rows_path)},
+                         sort_keys=True).encode()
+    digest = hashlib.sha256(content).hexdigest()
+    path = upload_path(digest, CHAIN_SUFFIX)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    return path, digest
+
+def chain_parts(path: str) -> tuple:
+    """(parent path, appended rows path) of a chain file"""
+    with open(path) as f:
+        chain = json.load(f)
+    return tuple(upload_path(*os.path.splitext(chain[key])) for key in ('parent', 'rows'))
+
+# Conversions started by this process, by content hash
+_conversions = {}
+_conversions_lock = threading.Lock()
+
+def _convert(filepath: str, digest: str) -> None:
+    from .cache_utils import dataset_files, load_profile
+    # The cleaned variant is what releases and comparisons are built from (this also caches the raw one)
+    dataset_files(filepath, clean=True, digest=digest)
+    # Profiled from the cached file, so large datasets are sketched batch by batch
+    load_profile(filepath, clean=True, digest=digest)
+
+def start_conversion(filepath: str, digest: str):
+    """
+    Start parsing an upload into the cache (raw and cleaned Arrow files, profile) in the background.
+    Raises pool_utils.PoolSaturated when the pool already has too much work pending.
+    """
+    with _conversions_lock:
+        # Forget finished conversions; their results live in the cache
+        for done in [key for key, f in _conversions.items() if f.done() and key != digest]:
+            del _conversions[done]
+        future = _conversions.get(digest)
+        if future is None or (future.done() and (future.cancelled() or future.exception() is not None)):
+            future = _conversions[digest] = submit(_convert, filepath, digest)
+        return future
+
+def wait_for_conversion(digest: str, timeout: float = None) -> None:
+    """Block until a background conversion started in this process finishes (no-op if none was)"""
+    with _conversions_lock:
+        future = _conversions.get(digest)
+    if future is not None:
+        future.result(timeout=timeout)
+
+async def await_conversion(digest: str) -> None:
+    """Async counterpart of wait_for_conversion, for async views"""
+    with _conversions_lock:
+        future = _conversions.get(digest)
+    if future is not None:
+        # Shielded: the conversion is shared, so a disconnecting client must not cancel it for the others
+        await asyncio.shield(asyncio.wrap_future(future))
@@ -4,8 +4,17 @@ from . import views
 urlpatterns = [
     path('', views.upload_file, name='upload'),
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('append/', views.append_file, name='append'),
+    path('export/', views.export_release, name='export_release'),
+    path('datasets/', views.dataset_list, name='datasets'),
+    path('datasets/<int:dataset_id>/open/', views.open_dataset, name='open_dataset'),
     path('signup/', views.signup_view, name='signup'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     path('visualize/', views.visualize, name='visualize'),
+    path('sweep/', views.epsilon_sweep, name='epsilon_sweep'),
+    path('jobs/<int:job_id>/status/', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/charts/', views.job_charts, name='job_charts'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('api/anonymize/batch/', views.anonymize_batch, name='anonymize_batch'),
 ]
\ No newline at end of file
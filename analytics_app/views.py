@@ -1,16 +1,25 @@
 # Create Authentication views here.
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.decorators import login_required
-import os, pandas as pd, numpy as np
-from django.http import HttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib import messages
+import asyncio, base64, binascii, json, math, os, time
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
 from .forms import UploadFileForm  # Import the UploadFileForm from forms.py
-from .privacy_utils import anonymize_data
-from .viz_utils import compare_datasets
-
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+from .jobs import enqueue_analysis, requeue
+from .upload_utils import UploadError, await_conversion, start_conversion, store_upload
+from .pool_utils import PoolSaturated, run_in_pool, saturated
+from django.conf import settings
+from .models import AnalysisJob, Dataset, DatasetVersion
+from .registry import record_release, register_append, register_upload, save_metadata, version_metadata
+from .timing_utils import HISTOGRAM, stage
 
 # Auth
 def signup_view(request):
@@ -38,101 +47,418 @@ def logout_view(request):
     logout(request)
     return redirect('login')
 
+# The upload, dashboard and visualize views are async: file I/O and database calls are awaited
+# in threads and pandas work runs in the bounded process pool (see pool_utils), so under ASGI
+# the event loop keeps serving logins and static pages while heavy requests are in flight.
+# Templates are rendered in a thread too, as base.html touches the (lazily loaded) user.
+
+def busy_response():
+    """503 answer for when the process pool is saturated"""
+    response = HttpResponse("The server is busy analysing other datasets. Please try again shortly.",
+                            status=503)
+    response['Retry-After'] = str(settings.CPU_POOL_RETRY_AFTER)
+    return response
+
+async def _current_version(request):
+    """
+    The DatasetVersion the session works on (with its dataset), or None.
+    One indexed query; ownership is checked in the same query.
+    """
+    version_id = await request.session.aget('dataset_version')
+    if version_id is None:
+        return None
+    user = await request.auser()
+    return await (DatasetVersion.objects.select_related('dataset')
+                  .filter(pk=version_id, dataset__owner=user).afirst())
+
+def _requested_epsilon(request) -> float:
+    """The `epsilon` query parameter (1.0 if not given); raises ValueError unless it is one of settings.RELEASE_EPSILONS"""
+    try:
+        epsilon = float(request.GET.get('epsilon') or 1.0)
+    except ValueError:
+        epsilon = math.nan
+    if epsilon not in settings.RELEASE_EPSILONS:
+        raise ValueError(f"Epsilon must be one of {', '.join(f'{e:g}' for e in settings.RELEASE_EPSILONS)}")
+    return epsilon
+
 # File Upload and Analytics
 @login_required
-def upload_file(request):
+async def upload_file(request):
     if request.method == 'POST':
         form = UploadFileForm(request.POST, request.FILES)
         if form.is_valid():
             uploaded_file = request.FILES['file']
-            filepath = os.path.join(UPLOAD_DIR, uploaded_file.name)
-            with open(filepath, 'wb+') as destination:
-                for chunk in uploaded_file.chunks():
-                    destination.write(chunk)
-            request.session['uploaded_file_path'] = filepath
+            # Stored under its content hash (identical uploads share one file), with the
+            # format sniffed and the header validated while streaming
+            try:
+                filepath, digest = await sync_to_async(store_upload, thread_sensitive=False)(uploaded_file)
+            except UploadError as e:
+                form.add_error('file', str(e))
+                return await sync_to_async(render)(request, 'upload.html', {'form': form})
+            # Parse into the dataset cache in the background while the browser follows the redirect
+            try:
+                start_conversion(filepath, digest)
+            except PoolSaturated:
+                return busy_response()
+            version = await sync_to_async(register_upload)(await request.auser(), filepath, digest,
+                                                           uploaded_file.name)
+            await request.session.aset('dataset_version', version.pk)
             return redirect('dashboard')
     else:
         form = UploadFileForm()
-    return render(request, 'upload.html', {'form': form})
+    return await sync_to_async(render)(request, 'upload.html', {'form': form})
 
 # Dashboard View: # integrate the privacy utils here
 @login_required
-def dashboard(request):
-    filepath = request.session.get('uploaded_file_path')
-    if not filepath or not os.path.exists(filepath):
+async def dashboard(request):
+    version = await _current_version(request)
+    if version is None:
         return redirect('upload')
     
-    # Read dataset
     try:
-        df = pd.read_csv(filepath)
+        epsilon = _requested_epsilon(request)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
+
+    # Anonymized release of the dataset (parsed in the background after upload, anonymized
+    # once and stored); only its first 10 rows are read for the preview
+    # Imported here (like the other data modules below) so starting the web process, or any
+    # management command, does not load pandas/pyarrow before a view needs them
+    from .release_utils import preview_release
+    try:
+        await await_conversion(version.file_hash)
+        if not version.described:
+            # Schema, row count and profile summary are stored the first time the version is shown
+            metadata = await run_in_pool(version_metadata, version.file_path, version.file_hash)
+            await sync_to_async(save_metadata)(version, metadata)
+        with stage('preview'):
+            anonymized_df = await run_in_pool(preview_release, version.file_path, epsilon, 10, version.file_hash)
+    except PoolSaturated:
+        return busy_response()
     except Exception as e:
         return HttpResponse(f"Error reading uploaded file. Ensure it's a valid CSV.")
-    
-    # Anonymize dataset
-    anonymized_df = anonymize_data(df, epsilon=1.0)
+    await sync_to_async(record_release)(version, epsilon)
 
-    # Show only top 10 rows for preview
-    preview = anonymized_df.head(10).to_html(classes='table table-bordered', index=False)
+    preview = anonymized_df.to_html(classes='table table-bordered', index=False)
 
-    return render(request, 'dashboard.html', 
+    return await sync_to_async(render)(request, 'dashboard.html', 
                   {
-                        'file': filepath, 
-                        'table': preview
+                        'file': version.name,
+                        'version': version,
+                        'table': preview,
+                        'epsilon': epsilon,
+                        'release_epsilons': settings.RELEASE_EPSILONS,
+                        'append_form': UploadFileForm(),
                    })
 
-# Visualization and Comparison View
+def _streamed(request, chunks):
+    # Under ASGI the response must be an async iterator (Django would otherwise read a sync one
+    # to the end before sending anything); each chunk is produced in a worker thread
+    if not isinstance(request, ASGIRequest):
+        return chunks
+
+    async def stream():
+        iterator = iter(chunks)
+        next_chunk = sync_to_async(next, thread_sensitive=False)
+        try:
+            while (chunk := await next_chunk(iterator, None)) is not None:
+                yield chunk
+        finally:
+            # Runs the generator's cleanup when the client disconnects
+            await sync_to_async(iterator.close, thread_sensitive=False)()
+    return stream()
+
+# Download of the whole anonymized release of the current dataset:
+# `?format=csv|csv.gz|parquet&epsilon=1`. The first download is sent as it is encoded and
+# stored on the way (see export_utils.tee_export); later ones are served from the stored export
+# with HTTP Range support (206/416), so interrupted downloads resume and large exports never
+# sit in memory
 @login_required
-def visualize(request):
-    filepath = request.session.get('uploaded_file_path')
-    if not filepath or not os.path.exists(filepath):
+async def export_release(request):
+    version = await _current_version(request)
+    if version is None:
         return redirect('upload')
-    
-    # Read dataset
     try:
-        # Try to determine if the file is CSV, Excel, etc.
-        if filepath.endswith('.csv'):
-            df = pd.read_csv(filepath)
-        elif filepath.endswith(('.xls', '.xlsx')):
-            df = pd.read_excel(filepath)
-        else:
-            # Default to CSV if unsure
-            df = pd.read_csv(filepath)
-            
-        # Basic data cleaning
-        # Fill missing values in numeric columns with mean, in categorical with most frequent
-        for col in df.columns:
-            if pd.api.types.is_numeric_dtype(df[col]):
-                df[col] = df[col].fillna(df[col].mean())
-            else:
-                df[col] = df[col].fillna(df[col].mode()[0] if not df[col].mode().empty else "Unknown")
-                
+        epsilon = _requested_epsilon(request)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
+    from .export_utils import EXPORT_FORMATS, export_path, iter_file, parse_range, tee_export
+    from .release_utils import ensure_release
+    output_format = request.GET.get('format', 'csv')
+    if output_format not in EXPORT_FORMATS:
+        return HttpResponse(f"format must be one of {', '.join(EXPORT_FORMATS)}", status=400)
+
+    path = export_path(version.file_hash, epsilon, output_format)
+    release = None
+    try:
+        await await_conversion(version.file_hash)
+        if not os.path.exists(path):
+            with stage('export'):
+                release = await run_in_pool(ensure_release, version.file_path, epsilon, version.file_hash)
+    except PoolSaturated:
+        return busy_response()
     except Exception as e:
-        return render(request, 'visualize.html', {
-            'viz': {
-                'error': f"Error reading the dataset: {str(e)}",
-                'orig_stats': "",
-                'anon_stats': "",
-                'orig_plots': [],
-                'anon_plots': [],
-                'anonymized_df': ""
-            }
-        })
-    
-    # Generate comparison stats and plots
+        return HttpResponse(f"Error exporting the anonymized dataset: {e}", status=500)
+    await sync_to_async(record_release)(version, epsilon)
+
+    extension, content_type = EXPORT_FORMATS[output_format]
+    filename = f"{os.path.splitext(version.name)[0]}_anonymized_e{epsilon:g}{extension}"
+    # Exports are deterministic, so the release's identity identifies the bytes
+    etag = f'"{os.path.basename(path)}"'
+    if release is not None and not os.path.exists(path):
+        # Not stored yet: the whole export, encoded while it is sent (its size is not known
+        # in advance, and any Range header is ignored)
+        response = StreamingHttpResponse(_streamed(request, tee_export(release, output_format, path)),
+                                         content_type=content_type)
+    else:
+        range_header = request.headers.get('Range')
+        if request.headers.get('If-Range', etag) != etag:
+            # The client's partial copy is of other bytes: send everything again
+            range_header = None
+        size = os.path.getsize(path)
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            return response
+        start, end = byte_range or (0, size - 1)
+        response = StreamingHttpResponse(_streamed(request, iter_file(path, start, end)),
+                                         content_type=content_type, status=206 if byte_range else 200)
+        response['Content-Length'] = str(end - start + 1)
+        if byte_range:
+            response['Content-Range'] = f"bytes {start}-{end}/{size}"
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+# Append rows to the current dataset: only the new rows are cleaned, summarized and anonymized
+# (see append_utils), and the session moves on to the new version
+@login_required
+async def append_file(request):
+    version = await _current_version(request)
+    if version is None:
+        return redirect('upload')
+    if request.method != 'POST':
+        return redirect('dashboard')
+    form = UploadFileForm(request.POST, request.FILES)
+    if not form.is_valid():
+        messages.error(request, "Select a CSV or Excel file with the rows to append.")
+        return redirect('dashboard')
+
+    from .append_utils import append_rows
+    uploaded_file = request.FILES['file']
+    try:
+        rows_path, _ = await sync_to_async(store_upload, thread_sensitive=False)(uploaded_file)
+        await await_conversion(version.file_hash)
+        with stage('append'):
+            filepath, digest = await run_in_pool(append_rows, version.file_path, version.file_hash, rows_path)
+    except PoolSaturated:
+        return busy_response()
+    except ValueError as e:
+        # UploadError (bad file) or rows that do not match the dataset's columns
+        messages.error(request, str(e))
+        return redirect('dashboard')
+
+    version = await sync_to_async(register_append)(version, filepath, digest, uploaded_file.name)
+    await request.session.aset('dataset_version', version.pk)
+    messages.success(request, f"Appended the rows of {uploaded_file.name}.")
+    return redirect('dashboard')
+
+# Visualization and Comparison View
+@login_required
+async def visualize(request):
+    version = await _current_version(request)
+    if version is None:
+        return redirect('upload')
+
+    try:
+        epsilon = _requested_epsilon(request)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
+
+    # The comparison runs in the background (see `manage.py run_jobs`); the page
+    # polls job_status and reloads itself once the results are ready. A failed analysis
+    # is shown as such until the user asks to try again (POST).
+    job = await sync_to_async(enqueue_analysis)(await request.auser(), version.file_path,
+                                                digest=version.file_hash, epsilon=epsilon,
+                                                retry=request.method == 'POST')
+    if request.method == 'POST':
+        return redirect(f"{reverse('visualize')}?epsilon={epsilon:g}")
+
+    # Results stored before chart data was computed (server-rendered PNGs only) are recomputed
+    if job.status == AnalysisJob.STATUS_DONE and 'charts' not in job.result:
+        await sync_to_async(requeue)(job)
+
+    if job.status == AnalysisJob.STATUS_DONE:
+        viz = job.result
+        await sync_to_async(record_release)(version, epsilon)
+    elif job.status == AnalysisJob.STATUS_FAILED:
+        viz = job.result or {
+            'error': job.error,
+            'orig_stats': "",
+            'anon_stats': "",
+            'charts': None,
+            'anonymized_df': ""
+        }
+    else:
+        viz = None
+    # The privacy/utility curve shown under the results covers every epsilon a release can be made at
+    sweep_epsilons = ','.join(f"{e:g}" for e in settings.RELEASE_EPSILONS)
+    return await sync_to_async(render)(request, 'visualize.html',
+                                       {'viz': viz, 'job': job, 'epsilon': epsilon, 'sweep_epsilons': sweep_epsilons,
+                                        'release_epsilons': settings.RELEASE_EPSILONS})
+
+# Privacy/utility sweep of the current dataset: utility metrics at every epsilon in
+# `?epsilons=0.1,1,10` (default settings.RELEASE_EPSILONS), computed in one pass (see sweep_utils).
+# Nothing is stored, so any epsilons can be measured; only the release epsilons can be opened
+@login_required
+async def epsilon_sweep(request):
+    version = await _current_version(request)
+    if version is None:
+        return JsonResponse({'error': 'Upload a dataset first'}, status=404)
+    from .sweep_utils import parse_epsilons, sweep_dataset
+    try:
+        epsilons = parse_epsilons(request.GET.get('epsilons') or settings.RELEASE_EPSILONS)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
     try:
-        comparison = compare_datasets(df, epsilon=1.0)
-        return render(request, 'visualize.html', {'viz': comparison})
+        await await_conversion(version.file_hash)
+        with stage('sweep'):
+            result = await run_in_pool(sweep_dataset, version.file_path, epsilons, version.file_hash)
+    except PoolSaturated:
+        return busy_response()
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        return render(request, 'visualize.html', {
-            'viz': {
-                'error': f"Error generating visualizations: {str(e)}",
-                'details': error_details,
-                'orig_stats': df.describe().to_html(classes="table table-bordered") if 'df' in locals() else "",
-                'anon_stats': "",
-                'orig_plots': [],
-                'anon_plots': [],
-                'anonymized_df': ""
-            }
-        })
\ No newline at end of file
+        # A failed conversion or unusable data: the page's script shows the error in the sweep panel
+        return JsonResponse({'error': f"Error computing the sweep: {str(e)}"}, status=500)
+    return JsonResponse(result)
+
+# The user's datasets, most recently used first, to reopen without uploading again
+@login_required
+def dataset_list(request):
+    datasets = (Dataset.objects.filter(owner=request.user)
+                .select_related('current_version')
+                .prefetch_related('versions', 'current_version__releases'))
+    return render(request, 'datasets.html', {'datasets': datasets})
+
+# Make a dataset (its current version, or `version` from the form) the session's dataset
+@login_required
+def open_dataset(request, dataset_id):
+    dataset = get_object_or_404(Dataset, pk=dataset_id, owner=request.user)
+    if request.method != 'POST':
+        return redirect('datasets')
+    version_id = request.POST.get('version', '')
+    version = get_object_or_404(dataset.versions, pk=version_id if version_id.isdigit() else dataset.current_version_id)
+    request.session['dataset_version'] = version.pk
+    return redirect('dashboard')
+
+# Job status for the polling visualize page
+@login_required
+def job_status(request, job_id):
+    job = get_object_or_404(AnalysisJob, pk=job_id, user=request.user)
+    return JsonResponse({
+        'id': job.pk,
+        'status': job.status,
+        'stage': job.stage,
+        'progress': job.progress,
+        'error': job.error,
+    })
+
+# Chart aggregates (histograms, KDE curves, correlation matrices) drawn by plotly on the visualize page
+@login_required
+def job_charts(request, job_id):
+    job = get_object_or_404(AnalysisJob, pk=job_id, user=request.user)
+    charts = (job.result or {}).get('charts') if job.status == AnalysisJob.STATUS_DONE else None
+    if charts is None:
+        return JsonResponse({'error': 'Charts are not available for this job'}, status=404)
+    return JsonResponse(charts)
+
+# Stage latency histogram of this process (admin only)
+@staff_member_required
+def metrics(request):
+    return JsonResponse({'pid': os.getpid(), 'stages': HISTOGRAM.snapshot()})
+
+# Batch API: pipelines authenticate with HTTP Basic; a logged-in browser session also works
+# but then needs a CSRF token like any other form post
+async def _api_user(request):
+    auth = request.META.get('HTTP_AUTHORIZATION', '')
+    if auth.startswith('Basic '):
+        try:
+            username, _, password = base64.b64decode(auth[6:]).decode('utf-8').partition(':')
+        except (binascii.Error, UnicodeDecodeError):
+            return None
+        return await sync_to_async(authenticate)(request, username=username, password=password)
+    user = await request.auser()
+    if user.is_authenticated and CsrfViewMiddleware(lambda r: None).process_view(request, None, (), {}) is None:
+        return user
+    return None
+
+@csrf_exempt
+async def anonymize_batch(request):
+    """
+    Anonymize many datasets in one request.
+    POST multipart fields: `files` (repeated), `epsilon` (default 1.0), `epsilons` (optional
+    JSON object mapping file name to epsilon) and `format` (parquet or csv).
+    Responds with a streamed zip: one anonymized file per input plus manifest.json with
+    per-file timings, dropped PII columns and errors.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    if await _api_user(request) is None:
+        response = JsonResponse({'error': 'Authentication required'}, status=401)
+        response['WWW-Authenticate'] = 'Basic realm="analytics"'
+        return response
+
+    from .batch_utils import OUTPUT_FORMATS, BatchZipWriter, anonymize_file
+    files = request.FILES.getlist('files')
+    output_format = request.POST.get('format', 'parquet')
+    try:
+        default_epsilon = float(request.POST.get('epsilon', 1.0))
+        epsilons = {name: float(eps) for name, eps in json.loads(request.POST.get('epsilons') or '{}').items()}
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': 'epsilon must be a number and epsilons a JSON object of numbers'}, status=400)
+    if not files:
+        return JsonResponse({'error': 'No files uploaded'}, status=400)
+    if output_format not in OUTPUT_FORMATS:
+        return JsonResponse({'error': f"format must be one of {', '.join(OUTPUT_FORMATS)}"}, status=400)
+    if not all(math.isfinite(eps) and 0 < eps <= settings.MAX_EPSILON for eps in [default_epsilon, *epsilons.values()]):
+        return JsonResponse({'error': f"epsilon must be a positive finite number up to {settings.MAX_EPSILON:g}"},
+                            status=400)
+    if saturated():
+        return busy_response()
+
+    start = time.perf_counter()
+    # At most one file per pool worker at a time, so a large batch does not lock out
+    # interactive requests from the pool
+    slots = asyncio.Semaphore(settings.CPU_POOL_WORKERS)
+
+    async def process(uploaded_file):
+        epsilon = epsilons.get(uploaded_file.name, default_epsilon)
+        try:
+            filepath, digest = await sync_to_async(store_upload, thread_sensitive=False)(uploaded_file)
+        except UploadError as e:
+            return {'file': uploaded_file.name, 'epsilon': epsilon, 'error': str(e)}
+        async with slots:
+            while True:
+                try:
+                    return await run_in_pool(anonymize_file, filepath, epsilon, output_format,
+                                             uploaded_file.name, digest)
+                except PoolSaturated:
+                    # Other requests hold the pool; wait for a slot rather than failing the file
+                    await asyncio.sleep(0.5)
+
+    async def stream():
+        writer = BatchZipWriter()
+        # Each file is added to the zip as soon as it is done
+        next_chunk = sync_to_async(next, thread_sensitive=False)
+        for finished in asyncio.as_completed([process(f) for f in files]):
+            chunks = writer.add(await finished)
+            while (chunk := await next_chunk(chunks, None)) is not None:
+                yield chunk
+        yield writer.close(seconds=round(time.perf_counter() - start, 3))
+
+    response = StreamingHttpResponse(stream(), content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename="anonymized.zip"'
+    return response
@@ -1,119 +1,110 @@
 """
 Visualization utilities for original vs anonymized data comparison.
-Generates plots and summary statistics to visualize the impact of anonymization.
+Generates chart data and summary statistics to visualize the impact of anonymization.
 """
 import pandas as pd
-import matplotlib
-# Configure matplotlib to use a non-interactive backend (Agg) to avoid thread-related crashes
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
-import os
-import uuid
 from django.conf import settings
 
+from .chart_utils import chart_columns, chart_data, numeric_block
+from .correlation_utils import compare_correlations
 from .privacy_utils import anonymize_data
+from .profile_utils import DatasetProfile, profile_dataset
+from .timing_utils import stage, timed
 
-# Define media directory for plots
-MEDIA_DIR = os.path.join(settings.MEDIA_ROOT, 'plots')
-os.makedirs(MEDIA_DIR, exist_ok=True)
+def approximation_note(profile: DatasetProfile) -> str:
+    """HTML caption stating the error bounds of a sketch-based profile"""
+    bounds = profile.error_bounds
+    return (
+        "<p class='text-muted small'>Approximate statistics for a large or appended dataset: the 25%, 50% and 75% "
+        f"values are within &plusmn;{bounds['quantile_rank_error']:.1%} of their true rank (99% confidence). "
+        "Count, mean, std, min and max are exact.</p>"
+    )
 
-def generate_basic_stats(df: pd.DataFrame):
+@timed('stats')
+def generate_basic_stats(df: pd.DataFrame, profile: DatasetProfile = None):
     """Return summary statistics of the DataFrame as HTML (to render in template)"""
     try:
+        if profile is None:
+            profile = profile_dataset(df)
         # For mixed data types, only include numeric columns in describe
-        numeric_df = df.select_dtypes(include=['number'])
-        if len(numeric_df.columns) > 0:
-            return numeric_df.describe().transpose().to_html(classes="table table-striped")
+        if len(profile.numeric_columns) > 0:
+            html = profile.numeric_stats.to_html(classes="table table-striped")
+            if profile.approximate:
+                html += approximation_note(profile)
+            return html
         else:
             # If no numeric columns, return basic info
+            null_counts = pd.Series(profile.null_counts)
             return pd.DataFrame({
-                'Column': df.columns,
-                'Type': df.dtypes,
-                'Non-Null Count': df.count(),
-                'Null Count': df.isna().sum()
+                'Column': profile.columns,
+                'Type': pd.Series(profile.dtypes),
+                'Non-Null Count': profile.n_rows - null_counts,
+                'Null Count': null_counts
             }).to_html(classes="table table-striped")
     except Exception as e:
         return f"<div class='alert alert-warning'>Error generating statistics: {str(e)}</div>"
 
-def generate_plots(df: pd.DataFrame, prefix="orig"):
-    """Generate histograms & correlation heatmaps. Save images and return file paths."""
-    plot_paths = []
-
-    # First ensure dataframe has consistent types - convert to numeric where possible
-    # but ignore errors (will leave non-convertible values as NaN)
-    df_clean = df.copy()
-    for col in df.columns:
-        if df[col].dtype == 'object':
-            try:
-                # Try to convert to numeric, but set errors='coerce' to turn strings into NaN
-                df_clean[col] = pd.to_numeric(df[col], errors='coerce')
-            except:
-                # If conversion fails completely, just keep as is
-                pass
-    
-    # Histogram of all numerical columns
-    for col in df_clean.select_dtypes(include="number").columns[:3]: # Limit to first 3 numeric columns for brevity
-        # Skip columns with too many NaN values
-        if df_clean[col].isna().sum() > 0.5 * len(df_clean):
-            continue
-            
-        filename = f"{prefix}_hist_{col}_{uuid.uuid4().hex[:8]}.png"
-        filepath = os.path.join(MEDIA_DIR, filename)
-        plt.figure(figsize=(6,4))
-        sns.histplot(df_clean[col].dropna(), kde=True)
-        plt.title(f'Distribution of {col} ({prefix})')
-        plt.savefig(filepath)
-        plt.close()
-        
-        # Return URL path for the template to use
-        url_path = f"{settings.MEDIA_URL}plots/{filename}"
-        plot_paths.append(url_path)
-
-    # Correlation heatmap
-    numeric_cols = df_clean.select_dtypes(include="number").columns
-    if len(numeric_cols) >= 2:  # Need at least 2 columns for correlation
-        # Filter out columns with too many NaN values
-        valid_cols = [col for col in numeric_cols if df_clean[col].isna().sum() <= 0.5 * len(df_clean)]
-        
-        if len(valid_cols) >= 2:  # Still need at least 2 valid columns
-            filename = f"{prefix}_corr_{uuid.uuid4().hex[:8]}.png"
-            filepath = os.path.join(MEDIA_DIR, filename)
-            plt.figure(figsize=(8,6))
-            corr = df_clean[valid_cols].corr()
-            sns.heatmap(corr, annot=True, fmt=".2f", cmap='coolwarm', cbar=True)
-            plt.title(f'Correlation Matrix ({prefix})')
-            plt.savefig(filepath)
-            plt.close()
-            
-            # Return URL path for the template to use
-            url_path = f"{settings.MEDIA_URL}plots/{filename}"
-            plot_paths.append(url_path)
-
-    return plot_paths
-
-def compare_datasets(orig_df: pd.DataFrame, epsilon: float = 1.0):
-    """Anonymize the original DataFrame and generate comparison stats and plots."""
+def compare_datasets(orig_df: pd.DataFrame, epsilon: float = 1.0, progress=None, dataset_hash: str = None,
+                     profile: DatasetProfile = None, anon_df: pd.DataFrame = None, incremental: dict = None):
+    """
+    Anonymize the original DataFrame and generate comparison stats and chart data.
+    Charts are returned as JSON aggregates (histogram bins, KDE curves and correlation
+    matrices, see chart_utils) that the visualize page draws with plotly, so nothing is
+    rasterized on the server. charts['drift'] is the change in correlations caused by
+    anonymization (see correlation_utils.compare_correlations).
+    `progress`, if given, is called with the name of each stage as it starts
+    ('anonymize', 'stats', 'charts') so background jobs can report where they are.
+    `dataset_hash` is the upload's content hash (kept for callers keying caches on it), and
+    `profile` its cached DatasetProfile. Each dataset is profiled at most once.
+    `anon_df` is the stored release to compare against (see release_utils); the data is
+    only anonymized here when it is not given.
+    `incremental` (see append_utils.incremental_charts) carries the release's profile and the
+    histograms of both datasets for appended versions, so they are not recomputed from the data.
+    """
+    report = progress or (lambda stage: None)
     try:
-        # Make a copy to avoid modifying the original dataframe
-        df = orig_df.copy()
+        # No copy needed: anonymize_data works on its own copy and the stats/chart
+        # helpers never modify the frame they are given
+        df = orig_df
+        orig_profile = profile if profile is not None else profile_dataset(df)
         
         # Apply anonymization
-        anon_df = anonymize_data(df, epsilon=epsilon)
+        report('anonymize')
+        if anon_df is None:
+            anon_df = anonymize_data(df, epsilon=epsilon, profile=orig_profile)
+        incremental = incremental or {}
+        anon_profile = incremental.get('anon_profile') or profile_dataset(anon_df)
         
         # Generate statistics
-        orig_stats = generate_basic_stats(df)
-        anon_stats = generate_basic_stats(anon_df)
+        report('stats')
+        orig_stats = generate_basic_stats(df, profile=orig_profile)
+        anon_stats = generate_basic_stats(anon_df, profile=anon_profile)
         
-        # Generate plots
-        orig_plots = generate_plots(df, prefix="orig")
-        anon_plots = generate_plots(anon_df, prefix="anon")
+        # Chart aggregates for every numeric column (no cap on the number of columns)
+        report('charts')
+        with stage('charts'):
+            orig_columns, anon_columns = chart_columns(orig_profile), chart_columns(anon_profile)
+            orig_block = numeric_block(df, orig_columns, orig_profile)
+            anon_block = numeric_block(anon_df, anon_columns, anon_profile)
+            charts = {
+                'orig': chart_data(df, profile=orig_profile, grids=incremental.get('orig_grids'),
+                                   correlation=False, block=orig_block),
+                'anon': chart_data(anon_df, profile=anon_profile, grids=incremental.get('anon_grids'),
+                                   correlation=False, block=anon_block),
+            }
+        with stage('correlation', columns=len(orig_columns)):
+            # Both heatmaps and their drift (anon - orig) from one pass over both blocks; the
+            # fixed seed samples the same rows every time the page is built
+            correlations = compare_correlations(orig_block, orig_columns, anon_block, anon_columns,
+                                                sample_rows=settings.CORRELATION_SAMPLE_ROWS, rng=0)
+            charts['orig']['correlation'] = correlations['orig']
+            charts['anon']['correlation'] = correlations['anon']
+            charts['drift'] = correlations['drift']
         
         return {
             "orig_stats": orig_stats,
             "anon_stats": anon_stats,
-            "orig_plots": orig_plots,
-            "anon_plots": anon_plots,
+            "charts": charts,
             "anonymized_df": anon_df.head().to_html(classes="table table-bordered")  # Show sample of anonymized data
         }
     except Exception as e:
@@ -125,7 +116,6 @@ def compare_datasets(orig_df: pd.DataFrame, epsilon: float = 1.0):
             "details": error_details,
             "orig_stats": df.describe().to_html(classes="table table-bordered") if 'df' in locals() else "",
             "anon_stats": "",
-            "orig_plots": [],
-            "anon_plots": [],
+            "charts": None,
             "anonymized_df": ""
         }
\ No newline at end of file
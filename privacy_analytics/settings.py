@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'analytics_app.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -123,6 +124,75 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploaded files, stored under their SHA-256 content hash
+UPLOAD_STORE_DIR = os.path.join(BASE_DIR, 'uploads', 'store')
+
+# Parsed upload cache (Arrow IPC files keyed by the upload's content hash)
+DATASET_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'datasets')
+DATASET_CACHE_MAX_BYTES = 5 * 1024 ** 3  # Least recently used Arrow files are evicted above 5 GB
+
+# Anonymized releases, written once per (dataset hash, epsilon, anonymization version) and never evicted
+RELEASE_STORE_DIR = os.path.join(BASE_DIR, 'cache', 'releases')
+# The epsilons pages and downloads release data at. Every other epsilon would store another
+# full copy of the dataset with an independent noise draw, so no other value is accepted there
+RELEASE_EPSILONS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+# Releases at other epsilons (batch API and command) a dataset may have besides those
+MAX_OTHER_RELEASES = 3
+# Largest epsilon accepted anywhere; far above it the noise hides next to nothing
+MAX_EPSILON = 10.0
+# CSV uploads of at least this size are anonymized in two streaming passes over the file
+# rather than loaded into memory (see release_utils.stream_release); None always loads them
+STREAMING_RELEASE_MIN_BYTES = 256 * 1024 ** 2
+# CSV uploads of at least this size are parsed into the dataset cache batch by batch, with dtypes
+# and fill values taken from a first pass over the file (see cache_utils.stream_upload); None
+# always loads them
+STREAMING_CONVERSION_MIN_BYTES = 256 * 1024 ** 2
+# Rows read at a time by the streaming releases and conversions above (releases round it up to
+# whole noise blocks of privacy_utils.NOISE_BLOCK_ROWS); their peak memory grows with it, not
+# with the file
+STREAMING_CHUNK_ROWS = 131_072
+
+# Datasets with at least this many rows are profiled with mergeable sketches, one cached record
+# batch at a time (approximate quartiles, distinct counts and value counts; the page states the
+# quartiles' error bound); None always profiles exactly
+APPROXIMATE_STATS_MIN_ROWS = None
+
+# Correlation heatmaps of datasets with more rows are estimated from this many uniformly
+# sampled rows (the page says so); None always uses every row
+CORRELATION_SAMPLE_ROWS = None
+
+# Comparisons and privacy/utility sweeps of datasets with more rows run on this many uniformly
+# sampled rows (the same rows of the data and of its release; the page says so), so their memory
+# does not grow with the dataset; None always uses every row
+ANALYSIS_SAMPLE_ROWS = 1_000_000
+
+# A running AnalysisJob whose runner has not renewed its lease for this many seconds is
+# considered abandoned (the runner died) and is queued again
+JOB_LEASE_SECONDS = 120
+
+# Process pool for CPU-heavy work started by views (background conversions, release previews).
+# Views answer 503 with Retry-After once CPU_POOL_MAX_PENDING calls are running or queued.
+CPU_POOL_WORKERS = min(4, os.cpu_count() or 1)
+CPU_POOL_MAX_PENDING = 2 * CPU_POOL_WORKERS
+CPU_POOL_RETRY_AFTER = 5  # seconds
+
+# Stage timings are logged as one JSON object per line (see analytics_app/timing_utils.py)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+        'timing': {'class': 'logging.StreamHandler', 'formatter': 'message'},
+    },
+    'loggers': {
+        'analytics_app': {'handlers': ['console'], 'level': 'INFO'},
+        'analytics_app.timing': {'handlers': ['timing'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 